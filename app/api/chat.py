@@ -1,15 +1,15 @@
 """
 聊天API模块 - 提供HTTP接口直接调用OpenAI API
 """
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, AsyncGenerator
-import json
+from typing import Optional, AsyncGenerator, Tuple
 import uuid
 from loguru import logger
 
-from app.services.stream_chat_service import stream_chat_service
+from app.services.resumable_stream import ResumableStream, ResumeGapError, stream_registry
+from app.utils.event_encoding import StreamEnvelope
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
@@ -21,6 +21,7 @@ class ChatRequest(BaseModel):
     model: Optional[str] = None
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 1000
+    bypass_cache: bool = False  # 为True时不使用回答缓存，重新请求模型
 
 
 class ChatResponse(BaseModel):
@@ -31,95 +32,128 @@ class ChatResponse(BaseModel):
     status: str
 
 
+# SSE响应头
+SSE_HEADERS = {
+    "Cache-Control": "no-cache, no-store, must-revalidate",
+    "Pragma": "no-cache",
+    "Expires": "0",
+    "Connection": "keep-alive",
+    "Content-Type": "text/event-stream",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Allow-Methods": "*",
+    "X-Accel-Buffering": "no",  # 禁用nginx缓冲
+    "Transfer-Encoding": "chunked"
+}
+
+
+def parse_event_id(event_id: str) -> Tuple[str, int]:
+    """解析SSE事件id（<message_id>:<序号>）"""
+    message_id, _, seq = event_id.strip().rpartition(":")
+    if not message_id or not seq.isdigit():
+        raise HTTPException(status_code=400, detail=f"Last-Event-ID格式错误: {event_id}")
+    return message_id, int(seq)
+
+
+def resume_point(message_id: str, session_id: Optional[str]) -> ResumableStream:
+    """查找要恢复的消息，已过期或会话不一致时返回404"""
+    stream = stream_registry.get(message_id, session_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail=f"消息不存在或已过期，无法恢复: {message_id}")
+    return stream
+
+
+def event_stream_response(stream: ResumableStream, last_seq: int, http_request: Request) -> StreamingResponse:
+    """把可恢复流中 last_seq 之后的事件作为SSE返回"""
+    message_id = stream.message_id
+    
+    async def generate_stream() -> AsyncGenerator[bytes, None]:
+        """生成流式响应
+        
+        对话服务产生的事件（stream_start、stream_chunk、intent_parsed、map_action、stream_end、error）
+        带序号 seq 编码为SSE帧，id 为 <message_id>:<seq>，文本片段使用预编码的事件外壳。
+        客户端断开时停止订阅，宽限期内未恢复则中止上游模型请求。
+        """
+        envelope = StreamEnvelope(message_id, stream.session_id)
+        events = stream_registry.subscribe(stream, last_seq)
+        try:
+            chunk_count = 0
+            async for seq, response in events:
+                if await http_request.is_disconnected():
+                    logger.info(f"SSE客户端已断开，停止发送流式对话: {message_id}")
+                    break
+                
+                yield envelope.sse({**response, "seq": seq}, f"{message_id}:{seq}")
+                
+                if response["type"] == "stream_chunk":
+                    chunk_count += 1
+                    # 调试信息
+                    if chunk_count % 10 == 0:
+                        logger.debug(f"已发送 {chunk_count} 个字符片段")
+                elif response["type"] == "stream_end":
+                    logger.info(f"流式输出完成，总共发送 {chunk_count} 个字符片段")
+                    break
+                elif response["type"] in ("error", "stream_cancelled"):
+                    break
+                    
+        except ResumeGapError as e:
+            yield envelope.sse({
+                "type": "error",
+                "message_id": message_id,
+                "error": str(e),
+                "session_id": stream.session_id
+            })
+        except Exception as e:
+            logger.error(f"流式生成失败: {str(e)}")
+            yield envelope.sse({
+                "type": "error", 
+                "message_id": message_id, 
+                "error": str(e)
+            })
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(generate_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @router.post("/stream")
-async def stream_chat(request: ChatRequest):
-    """流式聊天接口"""
+async def stream_chat(request: ChatRequest, http_request: Request):
+    """流式聊天接口
+    
+    请求头带有 Last-Event-ID 时不发起新的对话，而是从该事件之后继续发送对应消息的事件。
+    """
     try:
+        last_event_id = http_request.headers.get("last-event-id")
+        if last_event_id:
+            message_id, last_seq = parse_event_id(last_event_id)
+            stream = resume_point(message_id, request.session_id)
+            return event_stream_response(stream, last_seq, http_request)
+        
         # 生成消息ID
         message_id = str(uuid.uuid4())
         session_id = request.session_id or str(uuid.uuid4())
+        stream = stream_registry.start(request.message, session_id, message_id, request.bypass_cache)
+        return event_stream_response(stream, 0, http_request)
         
-        async def generate_stream() -> AsyncGenerator[str, None]:
-            """生成流式响应"""
-            try:
-                # 发送流式开始消息
-                start_data = {
-                    "type": "stream_start", 
-                    "message_id": message_id, 
-                    "session_id": session_id
-                }
-                yield f"data: {json.dumps(start_data, ensure_ascii=False)}\n\n"
-                
-                # 调用流式聊天服务
-                chunk_count = 0
-                async for response in stream_chat_service.stream_chat(
-                    request.message, 
-                    session_id
-                ):
-                    if response["type"] == "stream_chunk":
-                        chunk_count += 1
-                        # 发送内容片段 - 真正的流式输出
-                        chunk_data = {
-                            "type": "stream_chunk", 
-                            "message_id": message_id, 
-                            "chunk": response["chunk"],
-                            "session_id": session_id
-                        }
-                        chunk_str = f"data: {json.dumps(chunk_data, ensure_ascii=False)}\n\n"
-                        yield chunk_str
-                        
-                        # 调试信息
-                        if chunk_count % 10 == 0:
-                            logger.debug(f"已发送 {chunk_count} 个字符片段")
-                        
-                    elif response["type"] == "stream_end":
-                        # 发送结束消息
-                        end_data = {
-                            "type": "stream_end", 
-                            "message_id": message_id, 
-                            "session_id": session_id
-                        }
-                        yield f"data: {json.dumps(end_data, ensure_ascii=False)}\n\n"
-                        logger.info(f"流式输出完成，总共发送 {chunk_count} 个字符片段")
-                        break
-                        
-                    elif response["type"] == "error":
-                        # 发送错误消息
-                        error_data = {
-                            "type": "error", 
-                            "message_id": message_id, 
-                            "error": response["error"],
-                            "session_id": session_id
-                        }
-                        yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
-                        break
-                        
-            except Exception as e:
-                logger.error(f"流式生成失败: {str(e)}")
-                error_data = {
-                    "type": "error", 
-                    "message_id": message_id, 
-                    "error": str(e)
-                }
-                yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
-        
-        return StreamingResponse(
-            generate_stream(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache, no-store, must-revalidate",
-                "Pragma": "no-cache",
-                "Expires": "0",
-                "Connection": "keep-alive",
-                "Content-Type": "text/event-stream",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "*",
-                "Access-Control-Allow-Methods": "*",
-                "X-Accel-Buffering": "no",  # 禁用nginx缓冲
-                "Transfer-Encoding": "chunked"
-            }
-        )
-        
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"聊天接口错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"聊天服务出错: {str(e)}")
+
+
+@router.get("/stream/{message_id}")
+async def resume_stream(
+    message_id: str,
+    http_request: Request,
+    session_id: Optional[str] = None,
+    last_seq: int = Query(0, ge=0, description="最后收到的事件序号，请求头 Last-Event-ID 优先")
+):
+    """恢复流式对话，EventSource 可直接连接此地址，断线重连时浏览器会自动带上 Last-Event-ID"""
+    last_event_id = http_request.headers.get("last-event-id")
+    if last_event_id:
+        event_message_id, last_seq = parse_event_id(last_event_id)
+        if event_message_id != message_id:
+            raise HTTPException(status_code=400, detail="Last-Event-ID与消息ID不一致")
+    stream = resume_point(message_id, session_id)
+    return event_stream_response(stream, last_seq, http_request)
@@ -0,0 +1,76 @@
+"""
+地图API模块 - 提供POI聚合与热力图的视口查询接口
+"""
+import asyncio
+from typing import List, Optional
+import uuid
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+
+from app.core.clustering import cluster_store, parse_bbox
+from app.core.heatmap import CELL_SQUARE, CELL_TYPES, heatmap_store
+
+router = APIRouter(prefix="/api/map", tags=["map"])
+
+
+@router.get("/clusters")
+async def get_clusters(
+    result_id: str = Query(..., description="POI结果集id，来自 show_clusters 地图指令"),
+    zoom: float = Query(..., ge=0, le=24, description="地图缩放级别"),
+    bbox: str = Query(..., description="视口范围: 西,南,东,北"),
+    session_id: Optional[str] = None
+):
+    """查询视口内的POI聚合
+    
+    聚合层级在对话中的POI搜索完成时已构建并缓存，平移缩放只需按视口查询对应层级。
+    """
+    try:
+        viewport = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    action = cluster_store.clusters_action(result_id, viewport, zoom, session_id or str(uuid.uuid4()))
+    if action is None:
+        raise HTTPException(status_code=404, detail=f"POI结果集不存在或已过期: {result_id}")
+    return action.model_dump(mode="json")
+
+
+class HeatmapPoints(BaseModel):
+    """上传的热力图点集（列式数组）"""
+    lngs: List[float]
+    lats: List[float]
+    weights: Optional[List[float]] = None
+
+
+@router.post("/heatmap/points")
+async def upload_heatmap_points(points: HeatmapPoints):
+    """登记热力图点集，返回点集id，相同数据返回同一id"""
+    try:
+        dataset = await asyncio.to_thread(heatmap_store.add_points, points.lngs, points.lats, points.weights)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"source": dataset.dataset_id, "count": len(dataset)}
+
+
+@router.get("/heatmap")
+async def get_heatmap(
+    source: str = Query(..., description="点集id，或 show_clusters 地图指令中的POI结果集id"),
+    zoom: float = Query(..., ge=0, le=24, description="地图缩放级别"),
+    bbox: str = Query(..., description="视口范围: 西,南,东,北"),
+    cell: str = Query(CELL_SQUARE, description="单元类型: square 或 hex")
+):
+    """查询视口内的热力图聚合单元
+    
+    每个缩放级别的聚合结果首次查询时计算并随点集缓存，之后平移缩放只需按视口筛选单元。
+    """
+    if cell not in CELL_TYPES:
+        raise HTTPException(status_code=400, detail=f"不支持的单元类型: {cell}")
+    try:
+        viewport = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    dataset = heatmap_store.get(source)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail=f"点集不存在或已过期: {source}")
+    return await asyncio.to_thread(dataset.query, cell, int(zoom), viewport)
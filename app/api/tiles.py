@@ -0,0 +1,36 @@
+"""
+矢量瓦片API模块 - 按视口输出会话结果图层的MVT瓦片
+"""
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, Response
+
+from app.config import settings
+from app.core.tiles import MVT_MEDIA_TYPE, tile_store
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+
+@router.get("/{layer}/{z}/{x}/{y}.mvt")
+async def get_tile(layer: str, z: int, x: int, y: int, session_id: str, request: Request):
+    """获取矢量瓦片
+
+    携带 If-None-Match 且图层未变化时返回304；未命中缓存的瓦片在线程中编码，不阻塞事件循环。
+    """
+    if not 0 <= z <= settings.tile_max_zoom or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail=f"瓦片坐标无效: {z}/{x}/{y}")
+
+    tile_layer = tile_store.get_layer(session_id, layer)
+    if tile_layer is None:
+        raise HTTPException(status_code=404, detail=f"图层不存在或已过期: {layer}")
+
+    etag = tile_store.etag(tile_layer)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        tile_store.not_modified += 1
+        return Response(status_code=304, headers=headers)
+
+    data = tile_store.cached_tile(tile_layer, session_id, z, x, y)
+    if data is None:
+        data = await asyncio.to_thread(tile_store.render_tile, tile_layer, z, x, y)
+        tile_store.store_tile(tile_layer, session_id, z, x, y, data)
+    return Response(content=data, media_type=MVT_MEDIA_TYPE, headers=headers)
@@ -2,13 +2,17 @@
 WebSocket API处理模块
 支持流式聊天
 """
-import json
+import asyncio
 import uuid
-from typing import Dict, Set
+from typing import Any, Coroutine, Dict, Optional, Set
 from fastapi import WebSocket, WebSocketDisconnect
 from loguru import logger
 
-from app.services.stream_chat_service import stream_chat_service
+from app.config import settings
+from app.core.clustering import cluster_store, parse_bbox
+from app.services.outbound_queue import OutboundQueue, OutboundQueueClosed
+from app.services.resumable_stream import ResumableStream, ResumeGapError, stream_registry
+from app.utils.wire_format import WireCodec, negotiate
 
 
 class WebSocketManager:
@@ -17,24 +21,63 @@ class WebSocketManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
         self.session_connections: Dict[str, Set[str]] = {}
+        # 每个连接一个有界出站队列，由独立的写任务发送
+        self.outbound_queues: Dict[str, OutboundQueue] = {}
+        # 每个连接上进行中的流式对话任务，按message_id索引
+        self.stream_tasks: Dict[str, Dict[str, asyncio.Task]] = {}
+        # 各编码的累计连接数
+        self.encodings: Dict[str, int] = {}
+        
+        # 已断开连接的累计统计
+        self.closed_stats: Dict[str, float] = {
+            "sent": 0,
+            "merged": 0,
+            "overflowed": 0,
+            "pauses": 0,
+            "paused_seconds": 0.0,
+            "slow_consumer_disconnects": 0
+        }
     
-    async def connect(self, websocket: WebSocket, session_id: str):
-        """建立WebSocket连接"""
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, session_id: str, encoding: Optional[str] = None) -> str:
+        """建立WebSocket连接并协商消息编码，返回连接ID"""
+        codec, subprotocol = negotiate(websocket.scope.get("subprotocols", []), encoding)
+        await websocket.accept(subprotocol=subprotocol)
         connection_id = str(uuid.uuid4())
         self.active_connections[connection_id] = websocket
+        self.encodings[codec.encoding] = self.encodings.get(codec.encoding, 0) + 1
+        
+        queue = OutboundQueue(websocket, connection_id, codec=codec)
+        queue.start()
+        self.outbound_queues[connection_id] = queue
+        self.stream_tasks[connection_id] = {}
         
         if session_id not in self.session_connections:
             self.session_connections[session_id] = set()
         self.session_connections[session_id].add(connection_id)
         
-        logger.info(f"WebSocket连接建立: {connection_id}, 会话: {session_id}")
+        logger.info(f"WebSocket连接建立: {connection_id}, 会话: {session_id}, 编码: {codec.encoding}")
+        return connection_id
     
-    def disconnect(self, connection_id: str, session_id: str):
+    async def disconnect(self, connection_id: str, session_id: str):
         """断开WebSocket连接"""
         if connection_id in self.active_connections:
             del self.active_connections[connection_id]
         
+        # 连接已断开，停止转发该连接上进行中的对话；对话在宽限期内未被恢复时中止上游模型请求
+        tasks = list(self.stream_tasks.pop(connection_id, {}).values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            logger.info(f"连接断开，已停止转发 {len(tasks)} 个进行中的对话: {connection_id}")
+        
+        queue = self.outbound_queues.pop(connection_id, None)
+        if queue:
+            await queue.close()
+            for key, value in queue.stats().items():
+                if key in self.closed_stats:
+                    self.closed_stats[key] += value
+        
         if session_id in self.session_connections:
             self.session_connections[session_id].discard(connection_id)
             if not self.session_connections[session_id]:
@@ -42,88 +85,238 @@ class WebSocketManager:
         
         logger.info(f"WebSocket连接断开: {connection_id}, 会话: {session_id}")
     
+    def codec(self, connection_id: str) -> WireCodec:
+        """连接协商的消息编码"""
+        queue = self.outbound_queues.get(connection_id)
+        if not queue:
+            raise OutboundQueueClosed(f"连接不存在: {connection_id}")
+        return queue.codec
+    
     async def send_message(self, connection_id: str, message: dict):
-        """发送消息到指定连接"""
-        if connection_id in self.active_connections:
-            try:
-                await self.active_connections[connection_id].send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"发送消息失败: {str(e)}")
-                self.disconnect(connection_id, "")
+        """发送消息到指定连接（进入出站队列，队列满时按背压策略处理）"""
+        queue = self.outbound_queues.get(connection_id)
+        if not queue:
+            raise OutboundQueueClosed(f"连接不存在: {connection_id}")
+        await queue.put(message)
+    
+    def start_stream(self, connection_id: str, message_id: str, coro: Coroutine) -> asyncio.Task:
+        """以独立任务转发一个流式对话，结束后自动移除"""
+        tasks = self.stream_tasks.setdefault(connection_id, {})
+        task = asyncio.create_task(coro)
+        tasks[message_id] = task
+        task.add_done_callback(lambda _: tasks.pop(message_id, None))
+        return task
+    
+    def active_streams(self, connection_id: str) -> int:
+        """连接上进行中的流式对话数"""
+        return len(self.stream_tasks.get(connection_id, {}))
+    
+    def stats(self) -> Dict[str, Any]:
+        """出站队列统计，用于评估服务器容量"""
+        queues = list(self.outbound_queues.values())
+        depths = [queue.depth for queue in queues]
+        totals = dict(self.closed_stats)
+        for queue in queues:
+            for key, value in queue.stats().items():
+                if key in totals:
+                    totals[key] += value
+        totals["paused_seconds"] = round(totals["paused_seconds"], 3)
+        return {
+            "connections": len(queues),
+            "active_streams": sum(len(tasks) for tasks in self.stream_tasks.values()),
+            "policy": settings.ws_slow_consumer_policy,
+            "queue_size": settings.ws_send_queue_size,
+            "total_depth": sum(depths),
+            "max_depth": max(depths, default=0),
+            "peak_depth": max((queue.max_depth for queue in queues), default=0),
+            "encodings": dict(self.encodings),
+            **totals
+        }
 
 
 # 全局WebSocket管理器
 websocket_manager = WebSocketManager()
 
 
-async def websocket_endpoint(websocket: WebSocket, session_id: str = None):
+async def websocket_endpoint(websocket: WebSocket, session_id: str = None, encoding: str = None):
     """WebSocket端点处理函数"""
     if not session_id:
         session_id = str(uuid.uuid4())
     
-    await websocket_manager.connect(websocket, session_id)
+    connection_id = await websocket_manager.connect(websocket, session_id, encoding)
+    codec = websocket_manager.codec(connection_id)
     
     try:
-        # 发送连接成功消息
-        await websocket.send_text(json.dumps({
+        # 发送连接成功消息，附带协商的编码
+        await websocket_manager.send_message(connection_id, {
             "type": "system",
             "message": "连接成功",
-            "session_id": session_id
-        }))
+            "session_id": session_id,
+            **codec.handshake()
+        })
         
         # 处理消息
         while True:
             try:
-                # 接收消息
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                # 接收消息（文本帧为JSON，二进制帧按协商的编码解码）
+                received = await websocket.receive()
+                if received["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(received.get("code", 1000))
+                data = received.get("text")
+                message_data = codec.decode(data if data is not None else received.get("bytes", b""))
                 
                 # 处理聊天消息
                 message_type = message_data.get("type", "")
                 
                 if message_type == "chat":
-                    # 流式聊天消息
-                    await handle_stream_chat(websocket, message_data, session_id)
+                    # 流式聊天消息，每条消息作为独立任务运行，接收循环不被阻塞
+                    await start_stream_chat(connection_id, message_data, session_id)
+                elif message_type == "cancel":
+                    # 取消指定的流式对话
+                    await handle_cancel(connection_id, message_data, session_id)
+                elif message_type == "resume":
+                    # 断线重连后从最后收到的序号继续接收
+                    await handle_resume(connection_id, message_data, session_id)
+                elif message_type == "map_viewport":
+                    # 地图平移缩放后按视口查询已缓存的POI聚合
+                    await handle_map_viewport(connection_id, message_data, session_id)
                 else:
-                    await websocket.send_text(json.dumps({
+                    await websocket_manager.send_message(connection_id, {
                         "type": "error",
                         "error": "不支持的消息类型",
                         "session_id": session_id
-                    }))
-                
-            except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({
+                    })
+            
+            except (ValueError, AttributeError):
+                await websocket_manager.send_message(connection_id, {
                     "type": "error",
                     "error": "消息格式错误",
                     "session_id": session_id
-                }))
-                
+                })
+    
     except WebSocketDisconnect:
         logger.info(f"WebSocket连接断开: {session_id}")
+    except OutboundQueueClosed as e:
+        logger.info(f"WebSocket出站队列已关闭: {str(e)}")
     except Exception as e:
         logger.error(f"WebSocket处理错误: {str(e)}")
+    finally:
+        await websocket_manager.disconnect(connection_id, session_id)
 
 
-async def handle_stream_chat(websocket: WebSocket, message_data: dict, session_id: str):
-    """处理流式聊天消息"""
+async def start_stream_chat(connection_id: str, message_data: dict, session_id: str):
+    """为聊天消息启动流式对话，对话在后台运行，由转发任务把事件发送到连接"""
+    message_id = message_data.get("message_id") or str(uuid.uuid4())
+    message = message_data.get("message", "")
+    
+    error = None
+    if not message:
+        error = "消息内容不能为空"
+    elif (
+        websocket_manager.stream_tasks.get(connection_id, {}).get(message_id)
+        or stream_registry.is_running(message_id)
+    ):
+        error = "消息ID重复"
+    elif websocket_manager.active_streams(connection_id) >= settings.ws_max_concurrent_streams:
+        error = f"并发对话数已达上限: {settings.ws_max_concurrent_streams}"
+    
+    if error:
+        await websocket_manager.send_message(connection_id, {
+            "type": "error",
+            "message_id": message_id,
+            "error": error,
+            "session_id": session_id
+        })
+        return
+    
+    stream = stream_registry.start(message, session_id, message_id, bool(message_data.get("bypass_cache")))
+    websocket_manager.start_stream(connection_id, message_id, forward_stream(connection_id, stream))
+
+
+async def handle_resume(connection_id: str, message_data: dict, session_id: str):
+    """处理恢复消息，从 last_seq 之后继续发送（可以是断线前的另一个连接上开始的消息）"""
+    message_id = message_data.get("message_id", "")
+    
+    last_seq = message_data.get("last_seq", 0)
+    stream = stream_registry.get(message_id, session_id)
+    
+    error = None
+    if not isinstance(last_seq, int) or last_seq < 0:
+        error = "last_seq格式错误"
+    elif stream is None:
+        error = "消息不存在或已过期，无法恢复"
+    elif websocket_manager.stream_tasks.get(connection_id, {}).get(message_id):
+        error = "消息ID重复"
+    elif websocket_manager.active_streams(connection_id) >= settings.ws_max_concurrent_streams:
+        error = f"并发对话数已达上限: {settings.ws_max_concurrent_streams}"
+    
+    if error:
+        await websocket_manager.send_message(connection_id, {
+            "type": "error",
+            "message_id": message_id,
+            "error": error,
+            "session_id": session_id
+        })
+        return
+    
+    websocket_manager.start_stream(connection_id, message_id, forward_stream(connection_id, stream, last_seq))
+
+
+async def handle_cancel(connection_id: str, message_data: dict, session_id: str):
+    """处理取消消息，中止上游请求后订阅者会收到 stream_cancelled 通知"""
+    message_id = message_data.get("message_id", "")
+    stream = stream_registry.get(message_id, session_id)
+    if stream is None or not stream.cancel():
+        await websocket_manager.send_message(connection_id, {
+            "type": "error",
+            "message_id": message_id,
+            "error": "消息不存在或已结束",
+            "session_id": session_id
+        })
+
+
+async def handle_map_viewport(connection_id: str, message_data: dict, session_id: str):
+    """处理视口变化消息，返回视口内的POI聚合显示指令"""
+    result_id = message_data.get("result_id", "")
     try:
-        message = message_data.get("message", "")
-        if not message:
-            await websocket.send_text(json.dumps({
-                "type": "error",
-                "error": "消息内容不能为空",
-                "session_id": session_id
-            }))
-            return
-        
-        # 调用流式聊天服务
-        async for response in stream_chat_service.stream_chat(message, session_id):
-            await websocket.send_text(json.dumps(response))
-            
-    except Exception as e:
-        logger.error(f"流式聊天处理失败: {str(e)}")
-        await websocket.send_text(json.dumps({
+        bbox = parse_bbox(message_data.get("bbox", ""))
+        zoom = float(message_data.get("zoom", 0))
+    except (TypeError, ValueError) as e:
+        await websocket_manager.send_message(connection_id, {
+            "type": "error",
+            "error": f"视口参数错误: {str(e)}",
+            "session_id": session_id
+        })
+        return
+    
+    action = cluster_store.clusters_action(result_id, bbox, zoom, session_id)
+    if action is None:
+        await websocket_manager.send_message(connection_id, {
             "type": "error",
-            "error": f"聊天服务出错: {str(e)}",
+            "error": "POI结果集不存在或已过期",
             "session_id": session_id
-        })) 
\ No newline at end of file
+        })
+        return
+    await websocket_manager.send_message(connection_id, action.model_dump(mode="json"))
+
+
+async def forward_stream(connection_id: str, stream: ResumableStream, last_seq: int = 0):
+    """把可恢复流中 last_seq 之后的事件（带序号 seq）经出站队列发送到连接
+
+    连接断开时转发任务被取消，对话在后台继续运行，宽限期内可在新连接上以 resume 消息恢复。
+    """
+    events = stream_registry.subscribe(stream, last_seq)
+    try:
+        async for seq, event in events:
+            await websocket_manager.send_message(connection_id, {**event, "seq": seq})
+    except ResumeGapError as e:
+        await websocket_manager.send_message(connection_id, {
+            "type": "error",
+            "message_id": stream.message_id,
+            "error": str(e),
+            "session_id": stream.session_id
+        })
+    except OutboundQueueClosed:
+        logger.info(f"连接已关闭，停止转发流式对话: {stream.message_id}")
+    finally:
+        await events.aclose()
@@ -13,6 +13,138 @@ class Settings(BaseSettings):
     dashscope_model: Optional[str] = None
     dashscope_base_url: Optional[str] = None
     
+    # LLM HTTP连接池配置（所有模型调用共享同一个连接池）
+    llm_max_connections: int = 100
+    llm_max_keepalive_connections: int = 20
+    llm_keepalive_expiry: float = 30.0
+    llm_connect_timeout: float = 5.0
+    llm_read_timeout: float = 60.0
+    llm_max_retries: int = 2
+    
+    # 规则意图快速路径配置（置信度达到阈值时不再调用LLM）
+    intent_fast_path_enabled: bool = True
+    intent_fast_path_threshold: float = 0.85
+    intent_fast_path_max_length: int = 32
+    
+    # 意图缓存配置
+    intent_cache_enabled: bool = True
+    intent_cache_capacity: int = 2048
+    intent_cache_ttl: float = 600.0
+    
+    # 语义缓存配置（意图缓存与回答缓存的语义查找层，换一种说法的相同问题也能命中）
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.9  # 余弦相似度阈值
+    semantic_cache_capacity: int = 10000  # 每个缓存的最大条目数，向量矩阵按此预分配（capacity × dim × 4字节）
+    semantic_cache_dim: int = 128  # 问题向量的维度（3/4为字符n-gram哈希，1/4为地名等守卫词哈希）
+    semantic_cache_ivf_threshold: int = 8192  # 条目数达到此值后建立IVF索引，之前逐条比较
+    semantic_cache_ivf_nprobe: int = 8  # IVF索引查找时扫描的簇数
+    
+    # 回答缓存配置（与上下文无关的问题重放缓存的回答，不请求上游模型）
+    answer_cache_enabled: bool = True
+    answer_cache_capacity: int = 512
+    answer_cache_ttl: float = 3600.0
+    answer_cache_replay_chunk_chars: int = 16  # 重放时每个文本片段的字符数，0为整段一次发送
+    answer_cache_replay_interval_ms: int = 20  # 重放时相邻片段的间隔，0为不等待
+    
+    # 流式片段合并配置
+    stream_coalesce_enabled: bool = True
+    stream_coalesce_max_delay_ms: int = 40
+    stream_coalesce_max_bytes: int = 256
+    stream_coalesce_flush_on_punctuation: bool = True
+    
+    # 可恢复流配置
+    stream_replay_buffer_size: int = 1024  # 每条消息保留的事件数（环形缓冲区）
+    stream_replay_capacity: int = 1024  # 同时保留缓冲区的消息数
+    stream_replay_ttl: float = 300.0  # 消息结束后缓冲区的保留时间（秒）
+    stream_resume_grace: float = 30.0  # 客户端断开后等待恢复的时间（秒），超时中止上游请求，0为立即中止
+    
+    # 会话记忆配置（多轮对话上下文）
+    session_memory_enabled: bool = True
+    session_memory_context_tokens: int = 1500  # 每轮提示词中历史对话的token预算
+    session_memory_max_turns: int = 20  # 每个会话保留的最大轮数
+    session_memory_turn_max_tokens: int = 500  # 单条消息或回答保存的最大token数，超出部分截断
+    session_memory_max_sessions: int = 10000  # 保留记忆的会话数上限，超出时淘汰最久未活跃的会话
+    session_memory_max_tokens: int = 5_000_000  # 所有会话记忆的总token数上限
+    session_memory_ttl: float = 3600.0  # 会话未活跃多久后清除记忆（秒），0为不过期
+    session_memory_summary_enabled: bool = False  # 超出预算的早期轮次由模型折叠为滚动摘要，否则直接丢弃
+    session_memory_summary_tokens: int = 300  # 滚动摘要的最大token数
+    
+    # WebSocket出站队列配置
+    ws_send_queue_size: int = 256
+    ws_slow_consumer_policy: str = "merge"  # merge: 合并片段, pause: 暂停上游, disconnect: 断开慢速客户端
+    ws_backpressure_timeout: float = 30.0  # pause策略下最长暂停时间，超时断开连接
+    ws_max_concurrent_streams: int = 4  # 单个连接上同时进行的流式对话数上限
+    
+    # WebSocket消息编码配置
+    ws_default_encoding: str = "json"  # 客户端未协商时的编码: json / msgpack（需安装msgpack）
+    ws_compress_threshold: int = 2048  # msgpack编码下达到此字节数的消息在应用层deflate压缩，0为不压缩
+    ws_per_message_deflate: bool = True  # 传输层permessage-deflate扩展，开启后客户端支持时所有帧都会压缩
+    
+    # 插件结果缓存配置
+    plugin_cache_enabled: bool = True
+    plugin_cache_capacity: int = 1024  # 每个插件的最大缓存条目数
+    
+    # 插件HTTP连接池配置（每个上游主机一个连接池）
+    plugin_http_max_connections: int = 50
+    plugin_http_max_keepalive_connections: int = 10
+    plugin_http_keepalive_expiry: float = 30.0
+    plugin_http_connect_timeout: float = 3.0
+    plugin_http_read_timeout: float = 10.0
+    plugin_http2_enabled: bool = True  # 需要安装h2（pip install httpx[http2]）
+    
+    # 插件熔断与对冲请求配置
+    plugin_breaker_failure_threshold: int = 5  # 连续失败多少次后熔断
+    plugin_breaker_recovery_timeout: float = 30.0  # 熔断多久后进入半开状态探测恢复
+    plugin_breaker_half_open_max_calls: int = 1  # 半开状态下放行的探测请求数
+    plugin_hedge_enabled: bool = False  # 幂等查询慢于p95时发起对冲请求
+    plugin_hedge_percentile: float = 0.95
+    plugin_hedge_min_samples: int = 20  # 耗时样本不足时不对冲
+    plugin_hedge_min_delay_ms: int = 50
+    
+    # 地名库配置
+    gazetteer_file: Optional[str] = None  # 为空时使用内置的 app/data/gazetteer.tsv
+    
+    # POI空间索引配置
+    poi_data_file: Optional[str] = None  # .npz格式的POI数据，为空时在各城市周边生成示例数据
+    poi_demo_size: int = 20000  # 示例POI数量
+    poi_index_cell_size: float = 0.01  # 网格大小（度），约1公里
+    poi_max_search_radius: float = 50000.0  # 近邻查询的最大搜索半径（米）
+    
+    # POI聚合配置
+    cluster_radius: int = 60  # 聚合半径（像素）
+    cluster_extent: int = 512  # 瓦片尺寸（像素）
+    cluster_min_zoom: int = 0
+    cluster_max_zoom: int = 16  # 超过此级别不再聚合，直接显示POI
+    cluster_cache_capacity: int = 256  # 缓存的结果集数量
+    cluster_cache_ttl: float = 1800.0  # 结果集聚合索引的有效期（秒）
+    poi_cluster_limit: int = 5000  # 对话中POI搜索用于聚合显示的最大结果数
+    
+    # 矢量瓦片配置
+    tile_extent: int = 4096  # 瓦片坐标范围
+    tile_buffer: int = 64  # 瓦片缓冲区（瓦片坐标单位），避免边界处的要素被截断
+    tile_max_zoom: int = 22
+    tile_cache_capacity: int = 4096  # 缓存的瓦片数量
+    tile_layer_capacity: int = 512  # 所有会话登记的结果图层数量上限
+    tile_layer_ttl: float = 1800.0  # 结果图层的有效期（秒）
+    
+    # 热力图配置
+    heatmap_cell_px: int = 16  # 聚合单元的屏幕尺寸（像素），缩放级别越高单元覆盖的地理范围越小
+    heatmap_max_zoom: int = 16  # 聚合金字塔的最高级别，更高的缩放级别使用此级别的单元
+    heatmap_cache_capacity: int = 64  # 缓存的点集数量
+    heatmap_cache_ttl: float = 1800.0  # 点集及其聚合金字塔的有效期（秒）
+    heatmap_max_points: int = 5_000_000  # 单次上传的最大点数
+    
+    # 本地路网配置
+    road_graph_dir: Optional[str] = None  # 路网CSR数组目录（.npy），以内存映射方式加载，多进程共享
+    road_osm_file: Optional[str] = None  # OSM XML路网数据，路网目录不存在时从此构建并保存到路网目录
+    road_landmarks: int = 8  # A*启发函数使用的地标数量
+    road_max_snap_distance: float = 5000.0  # 起终点到最近道路节点的最大距离（米）
+    road_snap_cell_size: float = 0.005  # 起终点吸附使用的节点网格大小（度），约500米
+    
+    # 几何压缩配置
+    geometry_simplify_pixels: float = 1.0  # 路线等折线抽稀的最大偏差（目标缩放级别下的屏幕像素）
+    polyline_precision: int = 5  # 编码折线的坐标精度（小数位数），5位约1米
+    
     # 服务器配置
     host: str = "0.0.0.0"
     port: int = 8000
@@ -28,6 +160,7 @@ class Settings(BaseSettings):
     
     # 和风天气API
     qweather_api_key: Optional[str] = None
+    qweather_base_url: str = "https://devapi.qweather.com/v7"
     
     # 日志配置
     log_level: str = "INFO"
@@ -4,10 +4,12 @@ AI引擎模块 - 负责意图解析和自然语言理解
 """
 import json
 from typing import Dict, Any
-from openai import OpenAI
 from loguru import logger
 
 from app.config import settings
+from app.core.intent_cache import intent_cache, prompt_namespace
+from app.core.intent_classifier import intent_classifier
+from app.core.llm_provider import llm_provider
 from app.models.message import IntentResult, IntentType
 
 
@@ -15,18 +17,12 @@ class QwenAIProvider:
     """Qwen AI提供商"""
     
     def __init__(self):
-        if not settings.qwen_api_key:
-            raise ValueError("Qwen API Key未配置")
+        if not settings.dashscope_api_key:
+            raise ValueError("阿里云百炼API Key未配置")
         
-        self.api_key = settings.qwen_api_key
-        self.model = settings.qwen_model
-        self.base_url = settings.qwen_base_url
-        
-        # 初始化OpenAI兼容客户端
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
+        # 复用全局异步LLM提供商及其共享连接池
+        self.provider = llm_provider
+        self.model = self.provider.model
         logger.info(f"初始化Qwen模型: {self.model}")
     
     async def call_model(self, prompt: str, system_prompt: str = None) -> str:
@@ -37,13 +33,11 @@ class QwenAIProvider:
                 messages.append({"role": "system", "content": system_prompt})
             messages.append({"role": "user", "content": prompt})
             
-            response = self.client.chat.completions.create(
-                model=self.model,
+            return await self.provider.complete(
                 messages=messages,
                 temperature=0.1,
                 max_tokens=500
             )
-            return response.choices[0].message.content
                 
         except Exception as e:
             logger.error(f"Qwen API调用失败: {str(e)}")
@@ -86,20 +80,23 @@ class AIEngine:
 """
         
         self.system_prompt = "你是一个专业的地理信息助手，请严格按照JSON格式返回结果。"
+        # 意图缓存按提示词划分命名空间，不与StreamChatService（提示词不同）共享解析结果
+        self.intent_cache_namespace = prompt_namespace("engine", self.system_prompt + self.intent_prompt)
     
     async def parse_intent(self, user_input: str, session_id: str) -> IntentResult:
         """解析用户意图"""
         try:
             logger.info(f"开始解析用户意图: {user_input}")
             
-            # 构建完整的Prompt
-            full_prompt = self.intent_prompt.format(user_input=user_input)
-            
-            # 调用AI模型
-            response = await self.provider.call_model(full_prompt, self.system_prompt)
+            # 优先使用本地规则快速路径
+            fast_result = intent_classifier.classify(user_input, session_id)
+            if fast_result:
+                return fast_result
             
-            # 解析响应
-            intent_data = self._parse_response(response)
+            # 相同查询命中缓存，未命中时调用AI模型
+            intent_data = await intent_cache.get_or_load(
+                user_input, self._call_intent_model, self.intent_cache_namespace
+            )
             
             # 构建意图结果
             intent_result = IntentResult(
@@ -124,6 +121,19 @@ class AIEngine:
                 session_id=session_id
             )
     
+    async def _call_intent_model(self, user_input: str) -> Dict[str, Any]:
+        """调用AI模型并解析响应"""
+        # 构建完整的Prompt（模板中含JSON花括号，不能使用str.format）
+        full_prompt = self.intent_prompt.replace("{user_input}", user_input)
+        
+        # 调用AI模型
+        response = await self.provider.call_model(full_prompt, self.system_prompt)
+        
+        # 解析响应，非法的意图类型直接抛出，避免写入缓存
+        intent_data = self._parse_response(response)
+        IntentType(intent_data.get("intent", "unknown"))
+        return intent_data
+    
     def _parse_response(self, response: str) -> Dict[str, Any]:
         """解析AI响应"""
         try:
@@ -0,0 +1,102 @@
+"""
+回答缓存模块 - 完全相同的问题直接重放已生成的回答
+“你能做什么”等与实时数据无关的问题回答几乎相同，命中时不再请求上游模型；
+缓存key为归一化的问题加会话上下文的哈希，同一问题在不同对话上下文中分别缓存；
+没有历史对话时还会按语义查找换一种说法的相同问题
+"""
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.config import settings
+from app.core.semantic_cache import SemanticCache
+from app.models.message import IntentType
+from app.utils.cache import TTLCache
+from app.utils.event_encoding import dumps
+from app.utils.tokenizer import normalize_query
+
+# 回答不依赖实时数据和地点的意图，只有这些意图的回答会被缓存
+CONTEXT_FREE_INTENTS = {IntentType.UNKNOWN.value}
+
+
+class AnswerCache:
+    """回答缓存"""
+
+    def __init__(self):
+        self.cache = TTLCache(settings.answer_cache_capacity, settings.answer_cache_ttl)
+        self.semantic = (
+            SemanticCache("answer", ttl=settings.answer_cache_ttl) if settings.semantic_cache_enabled else None
+        )
+        self.stored = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def key(message: str, history: List[Dict[str, str]]) -> Optional[str]:
+        """归一化问题 + 会话上下文哈希，问题归一化后为空时返回None"""
+        normalized = normalize_query(message)
+        if not normalized:
+            return None
+        context = hashlib.sha1(dumps(history)).hexdigest()[:16] if history else ""
+        return f"{context}:{normalized}"
+
+    def get(
+        self,
+        message: str,
+        history: List[Dict[str, str]],
+        bypass: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """查找缓存的回答，返回 {"answer": 回答文本, "intent": 意图解析结果}
+
+        bypass 为True时跳过查找（本次生成的回答仍会写入缓存，相当于刷新）。
+        """
+        key = self.key(message, history)
+        if not settings.answer_cache_enabled or key is None:
+            return None
+        if bypass:
+            self.bypassed += 1
+            return None
+        cached = self.cache.get(key)
+        if cached is None and not history and self.semantic is not None:
+            cached = self.semantic.get(message)
+            if cached is not None:
+                logger.info(f"回答语义缓存命中: {message[:50]}")
+        if cached is None:
+            return None
+        return {"answer": cached["answer"], "intent": dict(cached["intent"])}
+
+    def set(self, message: str, history: List[Dict[str, str]], answer: str, intent_result: Dict[str, Any]):
+        """缓存回答，意图依赖实时数据或地点时不缓存"""
+        key = self.key(message, history)
+        if not settings.answer_cache_enabled or key is None or not answer:
+            return
+        if not self.cacheable(intent_result):
+            return
+        entry = {"answer": answer, "intent": dict(intent_result)}
+        self.cache.set(key, entry)
+        if not history and self.semantic is not None:
+            self.semantic.set(message, entry)
+        self.stored += 1
+        logger.debug(f"回答已缓存: {key}")
+
+    @staticmethod
+    def cacheable(intent_result: Dict[str, Any]) -> bool:
+        """意图与上下文无关：不需要插件数据、没有地点等参数、解析没有出错"""
+        return (
+            intent_result.get("intent") in CONTEXT_FREE_INTENTS
+            and not intent_result.get("parameters")
+            and "error" not in intent_result
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        stats = self.cache.stats()
+        stats["stored"] = self.stored
+        stats["bypassed"] = self.bypassed
+        if self.semantic is not None:
+            stats["semantic"] = self.semantic.stats()
+        return stats
+
+
+# 全局回答缓存实例
+answer_cache = AnswerCache()
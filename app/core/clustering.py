@@ -0,0 +1,260 @@
+"""
+POI聚合模块 - 服务端按缩放级别聚合POI（supercluster式分层网格聚合）
+每个结果集只构建一次聚合层级并缓存，平移和缩放只需按视口查询对应层级
+"""
+import hashlib
+import json
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+from app.models.message import MapAction
+from app.utils.cache import TTLCache
+from app.utils.geometry import project, unproject
+
+
+class ClusterLevel:
+    """单个缩放级别的聚合结果"""
+
+    def __init__(self, xs: np.ndarray, ys: np.ndarray, counts: np.ndarray, ids: np.ndarray):
+        self.xs = xs
+        self.ys = ys
+        self.counts = counts
+        self.ids = ids
+
+
+class ClusterIndex:
+    """分层网格聚合索引
+
+    从最大缩放级别开始，每一级把上一级中距离小于 radius 像素的点合并为一个聚合点
+    （按数量加权的中心），直到最小缩放级别。id小于点数的是原始POI，其余是聚合点。
+    """
+
+    def __init__(
+        self,
+        lngs: Sequence[float],
+        lats: Sequence[float],
+        properties: List[Dict[str, Any]],
+        radius: int = None,
+        extent: int = None,
+        min_zoom: int = None,
+        max_zoom: int = None
+    ):
+        self.radius = radius or settings.cluster_radius
+        self.extent = extent or settings.cluster_extent
+        self.min_zoom = settings.cluster_min_zoom if min_zoom is None else min_zoom
+        self.max_zoom = settings.cluster_max_zoom if max_zoom is None else max_zoom
+        self.properties = properties
+        self.size = len(properties)
+
+        # 聚合点信息：id -> (创建时的缩放级别, 子节点id列表)
+        self.children: Dict[int, List[int]] = {}
+        self.cluster_zoom: Dict[int, int] = {}
+
+        xs, ys = project(lngs, lats)
+        level = ClusterLevel(xs, ys, np.ones(self.size, dtype=np.int64), np.arange(self.size, dtype=np.int64))
+        self.levels: Dict[int, ClusterLevel] = {self.max_zoom + 1: level}
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            level = self._cluster(level, zoom)
+            self.levels[zoom] = level
+
+    def _cluster(self, level: ClusterLevel, zoom: int) -> ClusterLevel:
+        """把上一级的点按半径合并，生成当前缩放级别"""
+        r = self.radius / (self.extent * 2 ** zoom)
+        r2 = r * r
+        xs, ys, counts, ids = level.xs, level.ys, level.counts, level.ids
+
+        # 以半径为边长的网格分桶，邻居只可能出现在相邻的9个网格中
+        cell_x = (xs / r).astype(np.int64)
+        cell_y = (ys / r).astype(np.int64)
+        buckets: Dict[Tuple[int, int], List[int]] = {}
+        for i, key in enumerate(zip(cell_x.tolist(), cell_y.tolist())):
+            buckets.setdefault(key, []).append(i)
+
+        assigned = np.zeros(len(xs), dtype=bool)
+        out_x, out_y, out_count, out_id = [], [], [], []
+        for i in range(len(xs)):
+            if assigned[i]:
+                continue
+            assigned[i] = True
+            members = [i]
+            cx, cy = cell_x[i], cell_y[i]
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for j in buckets.get((cx + dx, cy + dy), ()):
+                        if not assigned[j] and (xs[j] - xs[i]) ** 2 + (ys[j] - ys[i]) ** 2 <= r2:
+                            assigned[j] = True
+                            members.append(j)
+
+            if len(members) == 1:
+                out_x.append(xs[i])
+                out_y.append(ys[i])
+                out_count.append(counts[i])
+                out_id.append(ids[i])
+                continue
+
+            weights = counts[members]
+            total = int(weights.sum())
+            cluster_id = self.size + len(self.children)
+            self.children[cluster_id] = ids[members].tolist()
+            self.cluster_zoom[cluster_id] = zoom
+            out_x.append(float(np.dot(xs[members], weights) / total))
+            out_y.append(float(np.dot(ys[members], weights) / total))
+            out_count.append(total)
+            out_id.append(cluster_id)
+
+        return ClusterLevel(
+            np.array(out_x, dtype=np.float64),
+            np.array(out_y, dtype=np.float64),
+            np.array(out_count, dtype=np.int64),
+            np.array(out_id, dtype=np.int64)
+        )
+
+    def expansion_zoom(self, cluster_id: int) -> int:
+        """聚合点展开（分裂为多个子节点）的缩放级别"""
+        zoom = self.cluster_zoom[cluster_id] + 1
+        children = self.children[cluster_id]
+        while len(children) == 1 and children[0] in self.children:
+            zoom = self.cluster_zoom[children[0]] + 1
+            children = self.children[children[0]]
+        return min(zoom, self.max_zoom + 1)
+
+    def leaves(self, cluster_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """聚合点包含的原始POI"""
+        result = []
+        stack = [cluster_id]
+        while stack and len(result) < limit:
+            node = stack.pop()
+            if node < self.size:
+                result.append(self.properties[node])
+            else:
+                stack.extend(self.children[node])
+        return result
+
+    def get_clusters(self, bbox: Sequence[float], zoom: float) -> List[Dict[str, Any]]:
+        """视口(西, 南, 东, 北)内指定缩放级别的聚合点与POI"""
+        zoom = max(self.min_zoom, min(int(zoom), self.max_zoom + 1))
+        level = self.levels[zoom]
+        west, south, east, north = bbox
+        (x0, x1), (y1, y0) = project([west, east], [south, north])
+        mask = (level.xs >= x0) & (level.xs <= x1) & (level.ys >= y0) & (level.ys <= y1)
+
+        features = []
+        for x, y, count, node in zip(
+            level.xs[mask].tolist(), level.ys[mask].tolist(),
+            level.counts[mask].tolist(), level.ids[mask].tolist()
+        ):
+            lng, lat = unproject(x, y)
+            feature = {
+                "id": node,
+                "longitude": round(lng, 6),
+                "latitude": round(lat, 6),
+                "count": count,
+                "cluster": node >= self.size,
+            }
+            if node >= self.size:
+                feature["expansion_zoom"] = self.expansion_zoom(node)
+            else:
+                feature["properties"] = self.properties[node]
+            features.append(feature)
+        return features
+
+
+def parse_bbox(value: Union[str, Sequence[float]]) -> Tuple[float, float, float, float]:
+    """解析视口范围，支持"西,南,东,北"字符串或4个数值的列表"""
+    parts = value.split(",") if isinstance(value, str) else list(value)
+    if len(parts) != 4:
+        raise ValueError("视口范围格式应为: 西,南,东,北")
+    west, south, east, north = (float(v) for v in parts)
+    if west > east or south > north:
+        raise ValueError("视口范围无效: 西/南边界不能大于东/北边界")
+    return west, south, east, north
+
+
+def zoom_for_radius(latitude: float, radius: float, viewport_px: int = 1024) -> int:
+    """能在视口宽度内显示给定半径（米）的缩放级别"""
+    meters_per_px = 2 * radius / viewport_px
+    zoom = math.log2(156543.03392 * math.cos(math.radians(latitude)) / meters_per_px)
+    return max(0, min(int(zoom), settings.cluster_max_zoom))
+
+
+def bbox_for_radius(longitude: float, latitude: float, radius: float) -> Tuple[float, float, float, float]:
+    """以中心点和半径（米）确定的视口范围(西, 南, 东, 北)"""
+    dlat = radius / 111320.0
+    dlng = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+    return (
+        round(longitude - dlng, 6), round(latitude - dlat, 6),
+        round(longitude + dlng, 6), round(latitude + dlat, 6)
+    )
+
+
+class ClusterStore:
+    """POI结果集的聚合索引缓存，按结果集id查询"""
+
+    def __init__(self):
+        self.cache = TTLCache(settings.cluster_cache_capacity, settings.cluster_cache_ttl)
+
+    @staticmethod
+    def result_id(parameters: Dict[str, Any]) -> str:
+        """结果集id：相同查询参数共享同一聚合索引"""
+        raw = json.dumps(parameters, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def build(self, parameters: Dict[str, Any], poi_data: Dict[str, Any]) -> str:
+        """为POI插件结果构建聚合索引，已缓存时直接返回结果集id"""
+        result_id = self.result_id(parameters)
+        if self.cache.get(result_id) is None:
+            results = poi_data.get("results", [])
+            index = ClusterIndex(
+                [item["longitude"] for item in results],
+                [item["latitude"] for item in results],
+                results
+            )
+            self.cache.set(result_id, index)
+            logger.info(f"POI聚合索引已构建: {result_id}, {len(results)} 个POI")
+        return result_id
+
+    def get(self, result_id: str) -> Optional[ClusterIndex]:
+        return self.cache.get(result_id)
+
+    def clusters_action(
+        self,
+        result_id: str,
+        bbox: Sequence[float],
+        zoom: float,
+        session_id: str
+    ) -> Optional[MapAction]:
+        """构建视口内的聚合显示指令，结果集已过期时返回None"""
+        index = self.get(result_id)
+        if index is None:
+            return None
+        clusters = index.get_clusters(bbox, zoom)
+        return MapAction(
+            action="show_clusters",
+            parameters={
+                "result_id": result_id,
+                "zoom": int(zoom),
+                "bbox": list(bbox),
+                "total": index.size,
+                "clusters": clusters
+            },
+            session_id=session_id
+        )
+
+    def initial_action(self, result_id: str, poi_data: Dict[str, Any], session_id: str) -> Optional[MapAction]:
+        """按POI搜索的中心和半径确定初始视口，构建聚合显示指令"""
+        center = poi_data["center"]
+        radius = poi_data["radius"]
+        bbox = bbox_for_radius(center["longitude"], center["latitude"], radius)
+        zoom = zoom_for_radius(center["latitude"], radius)
+        return self.clusters_action(result_id, bbox, zoom, session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
+
+
+# 全局聚合索引缓存实例
+cluster_store = ClusterStore()
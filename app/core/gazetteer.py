@@ -0,0 +1,246 @@
+"""
+地名库模块 - 进程内的行政区划与地标地理编码
+从本地数据文件加载，按名称、全称、别名和拼音建立前缀树索引，
+微秒级返回坐标与范围，地图飞行无需调用任何上游接口
+"""
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from loguru import logger
+
+from app.config import settings
+from app.models.message import MapAction
+from app.utils.trie import Trie
+
+DEFAULT_DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "gazetteer.tsv")
+
+# 行政级别，由高到低
+LEVEL_PROVINCE = "province"
+LEVEL_CITY = "city"
+LEVEL_DISTRICT = "district"
+LEVEL_LANDMARK = "landmark"
+LEVELS = (LEVEL_PROVINCE, LEVEL_CITY, LEVEL_DISTRICT, LEVEL_LANDMARK)
+
+# 各级别飞行时的地图缩放级别
+ZOOM_LEVELS = {
+    LEVEL_PROVINCE: 6,
+    LEVEL_CITY: 10,
+    LEVEL_DISTRICT: 12,
+    LEVEL_LANDMARK: 15,
+}
+
+
+class Place(NamedTuple):
+    """地名条目"""
+    name: str
+    full_name: str
+    level: str
+    longitude: float
+    latitude: float
+    bbox: Tuple[float, float, float, float]  # 西, 南, 东, 北
+    pinyin: str
+    weight: int
+    ancestors: Tuple[str, ...]  # 上级行政区名称，由近及远
+
+
+class Gazetteer:
+    """地名库
+
+    同名地名按以下顺序消歧：指定的行政级别、文本中出现的上级行政区、权重。
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or settings.gazetteer_file or DEFAULT_DATA_FILE
+        self.places: List[Place] = []
+        self.index = Trie()
+        self._by_full_name: Dict[str, Place] = {}
+        self._chains: Dict[str, Tuple[str, ...]] = {}
+        # 数据中出现的行政区划后缀（市、区、自治州等），解析带上级行政区的写法时可省略或保留
+        self._suffixes = set()
+        self._suffix_pattern: Optional[re.Pattern] = None
+        self._loaded = False
+
+    def load(self):
+        """加载数据文件并建立索引"""
+        if self._loaded:
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                self._add(line.rstrip("\n").split("\t"))
+        self._suffix_pattern = re.compile(
+            "(?:" + "|".join(sorted(map(re.escape, self._suffixes), key=len, reverse=True)) + ")*"
+        )
+        self._loaded = True
+        logger.info(f"地名库加载完成: {len(self.places)} 条, 文件: {self.path}")
+
+    def _add(self, columns: List[str]):
+        """解析一行数据并登记索引"""
+        name, suffix, level, parent, lng, lat, bbox, pinyin, aliases, weight = columns
+        parent_place = self._by_full_name.get(parent) if parent else None
+        if parent and parent_place is None:
+            raise ValueError(f"地名库上级行政区不存在: {parent}（{name}）")
+        if suffix:
+            self._suffixes.add(suffix)
+
+        # 各级全称链，如 ("浙江省", "杭州市", "西湖区")
+        ancestors: Tuple[str, ...] = ()
+        chain: Tuple[str, ...] = (name + suffix,)
+        if parent_place:
+            ancestors = (parent_place.name,) + parent_place.ancestors
+            chain = self._chains[parent_place.full_name] + chain
+        qualified = "".join(chain)
+
+        place = Place(
+            name=name,
+            full_name=qualified,
+            level=level,
+            longitude=float(lng),
+            latitude=float(lat),
+            bbox=tuple(float(v) for v in bbox.split(",")),
+            pinyin=pinyin,
+            weight=int(weight),
+            ancestors=ancestors
+        )
+        self.places.append(place)
+
+        # 完整全称总是唯一；省略部分上级的写法（如"杭州市西湖区"、"朝阳区"）在不冲突时也可用于定位上级
+        tails = ["".join(chain[i:]) for i in range(len(chain))]
+        self._chains[qualified] = chain
+        self._by_full_name[qualified] = place
+        for tail in tails[1:]:
+            self._by_full_name.setdefault(tail, place)
+
+        keys = {name, *tails}
+        keys.update(alias for alias in aliases.split("|") if alias)
+        if pinyin:
+            syllables = pinyin.split()
+            keys.add("".join(syllables))
+            keys.add("".join(syllable[0] for syllable in syllables))
+        for key in keys:
+            self._index(key.lower(), place)
+
+    def _index(self, key: str, place: Place):
+        entries = self.index.get(key)
+        if entries is None:
+            self.index.insert(key, [place])
+        elif place not in entries:
+            entries.append(place)
+
+    def candidates(self, query: str) -> List[Place]:
+        """名称、全称、别名或拼音完全匹配的所有地名"""
+        if not self._loaded:
+            self.load()
+        return list(self.index.get(query.strip().lower().replace(" ", ""), ()))
+
+    def lookup(self, query: str, level: str = None, context: Tuple[str, ...] = ()) -> Optional[Place]:
+        """精确查找并消歧，context为文本中出现的上级行政区名称"""
+        return self._best(self.candidates(query), level, context)
+
+    def resolve(self, text: str, level: str = None) -> Optional[Place]:
+        """解析地名文本，支持"北京朝阳"、"杭州市西湖区"等带上级行政区的写法
+
+        没有完全匹配时，文本须由至少两个字的地名和行政区划后缀组成，以最后一个地名为准；
+        "南京路"、"长安街"等只包含地名或单字简称的文本不算地名，返回None。
+        """
+        place = self.lookup(text, level)
+        if place is not None:
+            return place
+
+        text = text.strip().lower().replace(" ", "")
+        matches = [match for match in self.index.find_all(text) if match[1] - match[0] >= 2]
+        if not matches:
+            return None
+        position = 0
+        for start, end, _ in matches + [(len(text), len(text), None)]:
+            if not self._suffix_pattern.fullmatch(text, position, start):
+                return None
+            position = end
+        context = tuple(
+            candidate.name
+            for _, _, entries in matches[:-1]
+            for candidate in entries
+        )
+        return self._best(matches[-1][2], level, context)
+
+    def mentions(self, text: str) -> List[Tuple[int, int, Place]]:
+        """文本中出现的地名（不重叠的最长匹配），返回(起始, 结束, 地名)列表，位置对应 text.lower()
+
+        同名地名按前面出现的地名作为上级行政区消歧。
+        """
+        if not self._loaded:
+            self.load()
+        found = []
+        context: Tuple[str, ...] = ()
+        for start, end, entries in self.index.find_all(text.lower()):
+            if end - start < 2:
+                continue
+            place = self._best(entries, context=context)
+            found.append((start, end, place))
+            context += (place.name,)
+        return found
+
+    def search(self, prefix: str, limit: int = 10, level: str = None) -> List[Place]:
+        """前缀搜索（输入联想），按权重排序"""
+        if not self._loaded:
+            self.load()
+        found: Dict[int, Place] = {}
+        for _, entries in self.index.with_prefix(prefix.strip().lower()):
+            for place in entries:
+                if level is None or place.level == level:
+                    found[id(place)] = place
+        return sorted(found.values(), key=lambda place: -place.weight)[:limit]
+
+    @staticmethod
+    def _best(entries: List[Place], level: str = None, context: Tuple[str, ...] = ()) -> Optional[Place]:
+        """同名地名消歧"""
+        if not entries:
+            return None
+        if level:
+            entries = [place for place in entries if place.level == level] or entries
+        if context:
+            entries = [
+                place for place in entries
+                if any(name in place.ancestors for name in context)
+            ] or entries
+        return max(entries, key=lambda place: place.weight)
+
+    def names(self) -> List[Tuple[str, str]]:
+        """供意图分类器使用的(中文名称或别名, 规范名称)列表
+
+        同名地名以全称作为规范名称，保留行政级别信息。
+        """
+        if not self._loaded:
+            self.load()
+        pairs = []
+        for key, entries in self.index.with_prefix(""):
+            if len(key) < 2 or key.isascii():
+                continue
+            canonical = {place.name for place in entries}
+            if len(canonical) > 1:
+                continue
+            place = entries[0]
+            name_shared = len(self.index.get(place.name.lower(), ())) > 1
+            pairs.append((key, key if name_shared and key != place.name else place.name))
+        return pairs
+
+    def fly_to_action(self, place: Place, session_id: str) -> MapAction:
+        """构建地图飞行指令"""
+        return MapAction(
+            action="fly_to",
+            parameters={
+                "location": place.name,
+                "full_name": place.full_name,
+                "level": place.level,
+                "longitude": place.longitude,
+                "latitude": place.latitude,
+                "zoom": ZOOM_LEVELS.get(place.level, 12),
+                "bbox": list(place.bbox)
+            },
+            session_id=session_id
+        )
+
+
+# 全局地名库实例
+gazetteer = Gazetteer()
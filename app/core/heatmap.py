@@ -0,0 +1,209 @@
+"""
+热力图聚合模块 - 把点集按网格或六边形单元向量化聚合
+每个点集的各缩放级别聚合结果（金字塔）只计算一次并缓存，缩放时只需按视口筛选单元
+"""
+import hashlib
+import math
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+from app.utils.cache import TTLCache
+from app.utils.geometry import TILE_SIZE, project
+
+CELL_SQUARE = "square"
+CELL_HEX = "hex"
+CELL_TYPES = (CELL_SQUARE, CELL_HEX)
+
+# 单元坐标编码为一个int64键时的偏移，使负坐标也能编码
+_KEY_OFFSET = 1 << 30
+_SQRT3 = math.sqrt(3)
+
+
+def _pack(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return ((a + _KEY_OFFSET) << 32) | (b + _KEY_OFFSET)
+
+
+def _unpack(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return (keys >> 32) - _KEY_OFFSET, (keys & 0xFFFFFFFF) - _KEY_OFFSET
+
+
+def _reduce(keys: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按单元键合并权重，返回(单元键, 权重和)"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=weights, minlength=len(unique))
+
+
+def _unproject_arrays(xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """墨卡托坐标数组还原为经纬度"""
+    lngs = (xs - 0.5) * 360
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ys))))
+    return lngs, lats
+
+
+class HeatmapLevel:
+    """单个缩放级别的聚合结果：单元键、单元中心（墨卡托坐标）与权重和"""
+
+    def __init__(self, keys: np.ndarray, xs: np.ndarray, ys: np.ndarray, values: np.ndarray):
+        self.keys = keys
+        self.xs = xs
+        self.ys = ys
+        self.values = values
+
+
+class HeatmapDataset:
+    """点集及其聚合金字塔
+
+    方格：最高级别由原始点聚合一次，较低级别由上一级单元坐标右移一位后合并得到，
+    每一级的计算量只与上一级的非空单元数有关。
+    六边形：各级单元不嵌套，按需由原始点聚合，每个级别只计算一次。
+    """
+
+    def __init__(self, dataset_id: str, lngs: Sequence[float], lats: Sequence[float], weights: Sequence[float] = None):
+        self.dataset_id = dataset_id
+        self.xs, self.ys = project(lngs, lats)
+        self.weights = (
+            np.ones(len(self.xs), dtype=np.float64) if weights is None
+            else np.asarray(weights, dtype=np.float64)
+        )
+        if len(self.weights) != len(self.xs):
+            raise ValueError("权重数量与点数量不一致")
+        self.cell_px = settings.heatmap_cell_px
+        self.max_zoom = settings.heatmap_max_zoom
+        self.levels: Dict[Tuple[str, int], HeatmapLevel] = {}
+
+    def __len__(self) -> int:
+        return len(self.xs)
+
+    def cell_size(self, zoom: int) -> float:
+        """缩放级别下单元的墨卡托边长（方格）或宽度（六边形）"""
+        return self.cell_px / (TILE_SIZE * 2 ** zoom)
+
+    def level(self, cell: str, zoom: int) -> HeatmapLevel:
+        """获取（必要时计算并缓存）指定单元类型和缩放级别的聚合结果"""
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        level = self.levels.get((cell, zoom))
+        if level is None:
+            level = self._square(zoom) if cell == CELL_SQUARE else self._hex(zoom)
+            self.levels[(cell, zoom)] = level
+        return level
+
+    def _square(self, zoom: int) -> HeatmapLevel:
+        if zoom == self.max_zoom:
+            size = self.cell_size(zoom)
+            keys, values = _reduce(
+                _pack((self.xs / size).astype(np.int64), (self.ys / size).astype(np.int64)),
+                self.weights
+            )
+        else:
+            finer = self.level(CELL_SQUARE, zoom + 1)
+            cx, cy = _unpack(finer.keys)
+            keys, values = _reduce(_pack(cx >> 1, cy >> 1), finer.values)
+        cx, cy = _unpack(keys)
+        size = self.cell_size(zoom)
+        return HeatmapLevel(keys, (cx + 0.5) * size, (cy + 0.5) * size, values)
+
+    def _hex(self, zoom: int) -> HeatmapLevel:
+        """尖顶六边形网格，轴坐标(q, r)由立方坐标取整得到"""
+        radius = self.cell_size(zoom) / _SQRT3
+        q = (_SQRT3 / 3 * self.xs - self.ys / 3) / radius
+        r = (2 / 3 * self.ys) / radius
+        s = -q - r
+        rq, rr, rs = np.rint(q), np.rint(r), np.rint(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+
+        keys, values = _reduce(_pack(rq.astype(np.int64), rr.astype(np.int64)), self.weights)
+        hq, hr = _unpack(keys)
+        xs = radius * _SQRT3 * (hq + hr / 2)
+        ys = radius * 1.5 * hr
+        return HeatmapLevel(keys, xs, ys, values)
+
+    def query(self, cell: str, zoom: int, bbox: Sequence[float]) -> Dict[str, Any]:
+        """视口内的聚合单元，以列式数组返回"""
+        zoom = max(0, min(int(zoom), self.max_zoom))
+        level = self.level(cell, zoom)
+        west, south, east, north = bbox
+        (x0, x1), (y1, y0) = project([west, east], [south, north])
+        pad = self.cell_size(zoom)
+        mask = (
+            (level.xs >= x0 - pad) & (level.xs <= x1 + pad)
+            & (level.ys >= y0 - pad) & (level.ys <= y1 + pad)
+        )
+        lngs, lats = _unproject_arrays(level.xs[mask], level.ys[mask])
+        values = level.values[mask]
+        return {
+            "source": self.dataset_id,
+            "cell": cell,
+            "zoom": zoom,
+            "cell_px": self.cell_px,
+            "bbox": list(bbox),
+            "count": int(mask.sum()),
+            "max": float(values.max()) if len(values) else 0.0,
+            "total": float(level.values.sum()),
+            "lng": np.round(lngs, 6).tolist(),
+            "lat": np.round(lats, 6).tolist(),
+            "value": np.round(values, 3).tolist()
+        }
+
+
+class HeatmapStore:
+    """热力图点集缓存：上传的点集与对话中POI搜索的结果集"""
+
+    def __init__(self):
+        self.datasets = TTLCache(settings.heatmap_cache_capacity, settings.heatmap_cache_ttl)
+
+    @staticmethod
+    def dataset_id(lngs: np.ndarray, lats: np.ndarray, weights: Optional[np.ndarray]) -> str:
+        digest = hashlib.sha1(np.ascontiguousarray(lngs, dtype=np.float64).tobytes())
+        digest.update(np.ascontiguousarray(lats, dtype=np.float64).tobytes())
+        if weights is not None:
+            digest.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+        return digest.hexdigest()[:16]
+
+    def add_points(self, lngs: Sequence[float], lats: Sequence[float], weights: Sequence[float] = None) -> HeatmapDataset:
+        """登记上传的点集，相同数据返回同一个点集"""
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        if len(lngs) != len(lats):
+            raise ValueError("经度与纬度数量不一致")
+        if len(lngs) > settings.heatmap_max_points:
+            raise ValueError(f"点数量超过上限: {settings.heatmap_max_points}")
+        weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+        dataset_id = self.dataset_id(lngs, lats, weights)
+        dataset = self.datasets.get(dataset_id)
+        if dataset is None:
+            dataset = HeatmapDataset(dataset_id, lngs, lats, weights)
+            self.datasets.set(dataset_id, dataset)
+            logger.info(f"热力图点集已登记: {dataset_id}, {len(dataset)} 个点")
+        return dataset
+
+    def get(self, source: str) -> Optional[HeatmapDataset]:
+        """按点集id或POI结果集id获取点集"""
+        dataset = self.datasets.get(source)
+        if dataset is None:
+            from app.core.clustering import cluster_store
+
+            index = cluster_store.get(source)
+            if index is None:
+                return None
+            results = index.properties
+            dataset = HeatmapDataset(
+                source,
+                [item["longitude"] for item in results],
+                [item["latitude"] for item in results]
+            )
+            self.datasets.set(source, dataset)
+        return dataset
+
+    def stats(self) -> Dict[str, Any]:
+        return self.datasets.stats()
+
+
+# 全局热力图点集缓存实例
+heatmap_store = HeatmapStore()
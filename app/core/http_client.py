@@ -0,0 +1,80 @@
+"""
+插件HTTP客户端模块 - 第三方API共享的异步HTTP连接池
+每个上游主机一个keep-alive连接池，由应用启动/关闭事件管理生命周期
+"""
+from typing import Dict
+from urllib.parse import urlsplit
+import httpx
+from loguru import logger
+
+from app.config import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HTTPClientPool:
+    """按上游主机共享的httpx.AsyncClient连接池"""
+
+    def __init__(self):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+
+    @staticmethod
+    def host_key(base_url: str) -> str:
+        """上游主机标识（协议+主机+端口），同一主机的不同路径共享连接池"""
+        parts = urlsplit(base_url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def get_client(self, base_url: str) -> httpx.AsyncClient:
+        """获取上游主机对应的客户端，不存在时创建"""
+        key = self.host_key(base_url)
+        client = self.clients.get(key)
+        if client is None or client.is_closed:
+            client = self.clients[key] = self._create_client()
+            logger.info(f"插件HTTP连接池已创建: {key}, HTTP/2: {self.http2}")
+        return client
+
+    @property
+    def http2(self) -> bool:
+        """是否启用HTTP/2（需要安装h2）"""
+        return settings.plugin_http2_enabled and HTTP2_AVAILABLE
+
+    def _create_client(self) -> httpx.AsyncClient:
+        """创建带keep-alive连接池的客户端"""
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=settings.plugin_http_max_connections,
+                max_keepalive_connections=settings.plugin_http_max_keepalive_connections,
+                keepalive_expiry=settings.plugin_http_keepalive_expiry
+            ),
+            timeout=httpx.Timeout(
+                settings.plugin_http_read_timeout,
+                connect=settings.plugin_http_connect_timeout
+            ),
+            headers={"User-Agent": "geo-agent"}
+        )
+
+    async def shutdown(self):
+        """应用关闭时释放所有连接池"""
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for client in clients:
+            await client.aclose()
+        if clients:
+            logger.info(f"插件HTTP连接池已关闭: {len(clients)} 个")
+
+    def stats(self) -> Dict[str, object]:
+        """连接池概况"""
+        return {
+            "hosts": sorted(self.clients),
+            "http2": self.http2,
+            "max_connections_per_host": settings.plugin_http_max_connections
+        }
+
+
+# 全局插件HTTP连接池实例
+http_client_pool = HTTPClientPool()
@@ -0,0 +1,115 @@
+"""
+意图缓存模块 - 归一化查询作为key的意图解析结果缓存
+由StreamChatService与AIEngine共享，重复查询不再触发LLM调用；
+两者的意图提示词不同，缓存按提示词划分命名空间，互不读取对方的解析结果
+"""
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+from loguru import logger
+
+from app.config import settings
+from app.core.semantic_cache import SemanticCache
+from app.models.message import IntentType
+from app.utils.cache import SingleFlight, TTLCache
+from app.utils.tokenizer import normalize_query
+
+_INTENT_TYPES = {intent.value for intent in IntentType}
+
+
+def prompt_namespace(name: str, prompt: str) -> str:
+    """由调用方名称和意图提示词生成缓存命名空间，提示词修改后旧的解析结果不再命中"""
+    return f"{name}:{hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]}"
+
+
+class IntentCache:
+    """意图解析结果缓存"""
+
+    def __init__(self):
+        self.cache = TTLCache(settings.intent_cache_capacity, settings.intent_cache_ttl)
+        self.singleflight = SingleFlight()
+        # 每个命名空间一个语义缓存
+        self.semantic: Dict[str, SemanticCache] = {}
+
+    def _semantic(self, namespace: str) -> Optional[SemanticCache]:
+        """命名空间的语义缓存，未启用时返回None"""
+        if not settings.semantic_cache_enabled:
+            return None
+        semantic = self.semantic.get(namespace)
+        if semantic is None:
+            semantic = self.semantic[namespace] = SemanticCache(
+                f"intent:{namespace}", ttl=settings.intent_cache_ttl
+            )
+        return semantic
+
+    async def get_or_load(
+        self,
+        text: str,
+        loader: Callable[[str], Awaitable[Dict[str, Any]]],
+        namespace: str = ""
+    ) -> Dict[str, Any]:
+        """读取缓存，未命中时调用loader解析；相同查询的并发未命中只调用一次loader
+
+        namespace 区分使用不同意图提示词的调用方（见 prompt_namespace）。
+        精确匹配未命中时先查找语义相近且地名、数字、时间词一致的查询的解析结果。
+        """
+        if not settings.intent_cache_enabled:
+            return await loader(text)
+
+        key = (namespace, normalize_query(text))
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info(f"意图缓存命中: {text}")
+            return self._copy(cached)
+
+        semantic = self._semantic(namespace)
+
+        async def load() -> Dict[str, Any]:
+            similar = semantic.get(text) if semantic is not None else None
+            if similar is not None:
+                logger.info(f"意图语义缓存命中: {text}")
+                self.cache.set(key, self._copy(similar))
+                return similar
+
+            result = await loader(text)
+            if self._cacheable(result):
+                self.cache.set(key, self._copy(result))
+                if semantic is not None:
+                    semantic.set(text, self._copy(result))
+            return result
+
+        return self._copy(await self.singleflight.do(key, load))
+
+    @staticmethod
+    def _cacheable(result: Dict[str, Any]) -> bool:
+        """解析失败、意图类型非法、参数格式错误或置信度为0的结果不缓存"""
+        try:
+            confidence = float(result.get("confidence", 0.0))
+        except (TypeError, ValueError):
+            return False
+        return (
+            "error" not in result
+            and result.get("intent") in _INTENT_TYPES
+            and isinstance(result.get("parameters", {}), dict)
+            and confidence > 0
+        )
+
+    @staticmethod
+    def _copy(result: Dict[str, Any]) -> Dict[str, Any]:
+        """返回副本，避免调用方修改缓存内容"""
+        copied = dict(result)
+        parameters = result.get("parameters") or {}
+        if isinstance(parameters, dict):
+            copied["parameters"] = dict(parameters)
+        return copied
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        stats = self.cache.stats()
+        stats["coalesced"] = self.singleflight.coalesced
+        if self.semantic:
+            stats["semantic"] = {namespace: semantic.stats() for namespace, semantic in self.semantic.items()}
+        return stats
+
+
+# 全局意图缓存实例
+intent_cache = IntentCache()
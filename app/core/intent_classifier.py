@@ -0,0 +1,206 @@
+"""
+规则意图分类器 - 本地快速路径意图识别
+基于关键词/模式表和地名前缀树（地名来自地名库），在微秒级返回意图解析结果，
+置信度不足时交由LLM解析
+"""
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.config import settings
+from app.core.gazetteer import gazetteer
+from app.models.message import IntentResult, IntentType
+from app.utils.trie import Trie
+
+
+# 行政区划后缀，便于匹配手动添加地名的全称，如"北京市"、"浙江省"
+PLACE_SUFFIXES = ["市", "省", "自治区", "特别行政区"]
+
+# 各意图的关键词表
+WEATHER_KEYWORDS = [
+    "天气", "气温", "温度", "下雨", "下雪", "降雨", "降温", "空气质量", "雾霾",
+    "湿度", "风力", "预报", "冷不冷", "热不热", "几度", "晴天", "阴天",
+]
+
+POI_CATEGORIES = [
+    "餐厅", "饭店", "饭馆", "美食", "小吃", "火锅", "烧烤", "咖啡", "咖啡店",
+    "咖啡馆", "奶茶", "酒店", "宾馆", "民宿", "景点", "公园", "博物馆", "加油站",
+    "充电桩", "停车场", "银行", "ATM", "医院", "药店", "超市", "便利店", "商场",
+    "地铁站", "公交站", "厕所", "洗手间", "学校", "电影院", "健身房", "酒吧", "网吧",
+]
+
+NEARBY_WORDS = ["附近", "周边", "周围", "旁边", "身边"]
+
+ROUTE_KEYWORDS = ["路线", "路径", "怎么走", "怎么去", "如何去", "导航", "开车去", "坐车去", "多远"]
+
+FLY_KEYWORDS = ["飞到", "飞往", "飞去", "定位到", "跳转到", "跳到", "切换到", "转到", "带我去"]
+
+LOCATION_KEYWORDS = ["在哪里", "在哪儿", "在哪", "位置", "哪个省", "哪个城市"]
+
+# "从A到B"结构
+ROUTE_PATTERN = re.compile(r"从(?P<start>.+?)(?:到|去|至)(?P<end>.+)")
+
+# 意图对应的query_type，与LLM解析结果保持一致
+QUERY_TYPES = {
+    IntentType.WEATHER_QUERY: "天气",
+    IntentType.POI_SEARCH: "POI搜索",
+    IntentType.ROUTE_PLANNING: "路径规划",
+    IntentType.MAP_FLY_TO: "地图飞行",
+    IntentType.LOCATION_SEARCH: "地点搜索",
+}
+
+
+# 词典标签
+TAG_PLACE = "place"
+TAG_WEATHER = "weather"
+TAG_POI = "poi"
+TAG_NEARBY = "nearby"
+TAG_ROUTE = "route"
+TAG_FLY = "fly"
+TAG_LOCATION = "location"
+
+KEYWORD_TABLES = {
+    TAG_WEATHER: WEATHER_KEYWORDS,
+    TAG_POI: POI_CATEGORIES,
+    TAG_NEARBY: NEARBY_WORDS,
+    TAG_ROUTE: ROUTE_KEYWORDS,
+    TAG_FLY: FLY_KEYWORDS,
+    TAG_LOCATION: LOCATION_KEYWORDS,
+}
+
+
+class RuleIntentClassifier:
+    """基于规则的本地意图分类器
+
+    地名和各意图关键词登记在同一棵带标签的前缀树中，一次扫描即可完成匹配。
+    """
+
+    def __init__(self, place_names: List[str] = None):
+        self.lexicon = Trie()
+        if place_names is None:
+            # 地名库中的名称、全称和中文别名，别名识别为规范名称
+            for surface, name in gazetteer.names():
+                self.lexicon.insert(surface, (TAG_PLACE, name))
+        else:
+            for name in place_names:
+                self.add_place(name)
+        for tag, words in KEYWORD_TABLES.items():
+            for word in words:
+                self.lexicon.insert(word, (tag, word))
+
+        # 统计信息
+        self.total = 0
+        self.hits = 0
+        self.fallbacks = 0
+
+    def add_place(self, name: str):
+        """添加地名（同时登记带行政区划后缀的全称）"""
+        self.lexicon.insert(name, (TAG_PLACE, name))
+        for suffix in PLACE_SUFFIXES:
+            self.lexicon.insert(name + suffix, (TAG_PLACE, name))
+
+    def classify(self, text: str, session_id: str = "") -> Optional[IntentResult]:
+        """本地分类，置信度达到阈值时返回意图结果，否则返回None交由LLM处理"""
+        if not settings.intent_fast_path_enabled:
+            return None
+
+        self.total += 1
+        text = text.strip()
+        candidate = None
+        if 0 < len(text) <= settings.intent_fast_path_max_length:
+            candidate = self._score(text)
+
+        if candidate is None or candidate[1] < settings.intent_fast_path_threshold:
+            self.fallbacks += 1
+            return None
+
+        intent, confidence, parameters = candidate
+        self.hits += 1
+        parameters["query_type"] = QUERY_TYPES[intent]
+        return IntentResult(
+            intent=intent,
+            confidence=confidence,
+            parameters=parameters,
+            raw_text=text,
+            session_id=session_id
+        )
+
+    def _score(self, text: str) -> Optional[Tuple[IntentType, float, Dict[str, Any]]]:
+        """为每种意图打分，返回得分最高的(意图, 置信度, 参数)"""
+        matches: Dict[str, List[str]] = {}
+        place_end = -1
+        for start, end, (tag, value) in self.lexicon.find_all(text):
+            # 相邻的地名合并为一个，保留上级行政区用于消歧，如"北京朝阳"
+            if tag == TAG_PLACE and start == place_end:
+                matches[TAG_PLACE][-1] += value
+            else:
+                matches.setdefault(tag, []).append(value)
+            if tag == TAG_PLACE:
+                place_end = end
+
+        places = matches.get(TAG_PLACE, [])
+        candidates: List[Tuple[IntentType, float, Dict[str, Any]]] = []
+
+        # 天气查询：天气关键词 + 地名
+        if TAG_WEATHER in matches:
+            if places:
+                candidates.append((IntentType.WEATHER_QUERY, 0.95, {"location": places[0]}))
+            else:
+                candidates.append((IntentType.WEATHER_QUERY, 0.6, {}))
+
+        # POI搜索：类别关键词 + 地名或"附近"
+        if TAG_POI in matches:
+            keyword = matches[TAG_POI][0]
+            if places:
+                candidates.append((IntentType.POI_SEARCH, 0.92, {"location": places[0], "keyword": keyword}))
+            elif TAG_NEARBY in matches:
+                candidates.append((IntentType.POI_SEARCH, 0.92, {"location": "附近", "keyword": keyword}))
+            else:
+                candidates.append((IntentType.POI_SEARCH, 0.7, {"location": "附近", "keyword": keyword}))
+
+        # 路径规划："从A到B"结构或路线关键词 + 两个地名
+        route_match = ROUTE_PATTERN.search(text)
+        has_route_keyword = TAG_ROUTE in matches
+        if len(places) >= 2 and (route_match or has_route_keyword):
+            candidates.append((IntentType.ROUTE_PLANNING, 0.95, {
+                "start_location": places[0],
+                "end_location": places[1]
+            }))
+        elif has_route_keyword and places:
+            candidates.append((IntentType.ROUTE_PLANNING, 0.7, {"end_location": places[-1]}))
+
+        # 地图飞行：飞行关键词 + 地名
+        if TAG_FLY in matches:
+            if places:
+                candidates.append((IntentType.MAP_FLY_TO, 0.95, {"location": places[-1]}))
+            else:
+                candidates.append((IntentType.MAP_FLY_TO, 0.5, {}))
+
+        # 地点搜索：位置关键词 + 地名
+        if TAG_LOCATION in matches and places:
+            candidates.append((IntentType.LOCATION_SEARCH, 0.9, {"location": places[-1]}))
+
+        if not candidates:
+            return None
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        intent, confidence, parameters = candidates[0]
+
+        # 多个意图同时较强时说明输入存在歧义，降低置信度
+        if len(candidates) > 1 and candidates[1][1] >= 0.6:
+            confidence -= candidates[1][1] * 0.3
+
+        return intent, round(confidence, 2), parameters
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        return {
+            "total": self.total,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(self.hits / self.total, 4) if self.total else 0.0,
+            "fallback_rate": round(self.fallbacks / self.total, 4) if self.total else 0.0,
+        }
+
+
+# 全局规则意图分类器实例
+intent_classifier = RuleIntentClassifier()
@@ -0,0 +1,113 @@
+"""
+LLM提供商模块 - 基于AsyncOpenAI的异步模型调用层
+所有模型调用共享同一个keep-alive连接池，避免阻塞事件循环
+"""
+from typing import AsyncGenerator, Dict, Any, List, Optional
+import httpx
+from openai import AsyncOpenAI
+from loguru import logger
+
+from app.config import settings
+
+
+class LLMProvider:
+    """异步LLM提供商（阿里云百炼OpenAI兼容接口）"""
+
+    def __init__(self):
+        self.model = settings.dashscope_model
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """获取共享客户端，未启动时惰性创建"""
+        if self._client is None:
+            self._create_client()
+        return self._client
+
+    def _create_client(self):
+        """创建共享连接池和AsyncOpenAI客户端"""
+        if not settings.dashscope_api_key:
+            raise ValueError("阿里云百炼API Key未配置")
+
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.llm_max_connections,
+                max_keepalive_connections=settings.llm_max_keepalive_connections,
+                keepalive_expiry=settings.llm_keepalive_expiry
+            ),
+            timeout=httpx.Timeout(
+                settings.llm_read_timeout,
+                connect=settings.llm_connect_timeout
+            )
+        )
+        self._client = AsyncOpenAI(
+            api_key=settings.dashscope_api_key,
+            base_url=settings.dashscope_base_url,
+            max_retries=settings.llm_max_retries,
+            http_client=self._http_client
+        )
+        logger.info(
+            f"LLM连接池已创建: 最大连接数 {settings.llm_max_connections}, "
+            f"keep-alive连接数 {settings.llm_max_keepalive_connections}"
+        )
+
+    async def startup(self):
+        """应用启动时预先创建连接池"""
+        if self._client is None:
+            self._create_client()
+
+    async def shutdown(self):
+        """应用关闭时释放连接池"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._http_client = None
+            logger.info("LLM连接池已关闭")
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.1,
+        max_tokens: int = 500,
+        **kwargs: Any
+    ) -> str:
+        """非流式调用，返回完整文本"""
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        return response.choices[0].message.content
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        **kwargs: Any
+    ) -> AsyncGenerator[str, None]:
+        """流式调用，逐个返回文本片段
+
+        生成器被关闭或任务被取消时会立即关闭上游HTTP响应，释放连接。
+        """
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.response.aclose()
+
+
+# 全局LLM提供商实例
+llm_provider = LLMProvider()
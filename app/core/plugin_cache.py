@@ -0,0 +1,126 @@
+"""
+插件结果缓存模块 - 按插件类型分别缓存插件调用结果
+支持每个插件独立的TTL与缓存key、相同请求合并以及过期后先返回旧值再后台刷新（stale-while-revalidate）
+"""
+import asyncio
+import copy
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Set
+from loguru import logger
+
+from app.config import settings
+from app.models.message import PluginType
+from app.utils.cache import SingleFlight, TTLCache
+
+
+class PluginCache:
+    """插件结果缓存
+
+    条目保存 (新鲜截止时间, 结果)，在缓存中的存活时间为 cache_ttl + cache_stale_ttl：
+    新鲜期内直接返回；过期但仍在 stale 窗口内时返回旧值并在后台刷新；之后视为未命中。
+    """
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or settings.plugin_cache_capacity
+        self.caches: Dict[PluginType, TTLCache] = {}
+        self.flights: Dict[PluginType, SingleFlight] = {}
+        self._refresh_tasks: Set[asyncio.Task] = set()
+
+        # 统计信息，按插件类型计数
+        self.stale_hits: Dict[PluginType, int] = {}
+        self.refreshes: Dict[PluginType, int] = {}
+        self.refresh_failures: Dict[PluginType, int] = {}
+
+    def _cache_for(self, plugin_type: PluginType) -> TTLCache:
+        cache = self.caches.get(plugin_type)
+        if cache is None:
+            cache = self.caches[plugin_type] = TTLCache(self.capacity)
+            self.flights[plugin_type] = SingleFlight()
+        return cache
+
+    async def get_or_load(
+        self,
+        plugin_type: PluginType,
+        key: Hashable,
+        ttl: float,
+        stale_ttl: float,
+        loader: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """读取缓存，未命中时调用loader；相同key的并发未命中只调用一次loader"""
+        cache = self._cache_for(plugin_type)
+        entry = cache.get(key)
+        if entry is not None:
+            fresh_until, data = entry
+            if fresh_until <= time.monotonic():
+                self.stale_hits[plugin_type] = self.stale_hits.get(plugin_type, 0) + 1
+                self._refresh(plugin_type, key, ttl, stale_ttl, loader)
+            return copy.deepcopy(data)
+
+        data = await self.flights[plugin_type].do(
+            key,
+            lambda: self._load(plugin_type, key, ttl, stale_ttl, loader)
+        )
+        return copy.deepcopy(data)
+
+    async def _load(
+        self,
+        plugin_type: PluginType,
+        key: Hashable,
+        ttl: float,
+        stale_ttl: float,
+        loader: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """调用上游并写入缓存，失败的调用不缓存"""
+        data = await loader()
+        self._cache_for(plugin_type).set(key, (time.monotonic() + ttl, data), ttl=ttl + stale_ttl)
+        return data
+
+    def _refresh(
+        self,
+        plugin_type: PluginType,
+        key: Hashable,
+        ttl: float,
+        stale_ttl: float,
+        loader: Callable[[], Awaitable[Dict[str, Any]]]
+    ):
+        """后台刷新过期条目，同一key同时只有一个刷新"""
+        flight = self.flights[plugin_type]
+        if key in flight:
+            return
+        self.refreshes[plugin_type] = self.refreshes.get(plugin_type, 0) + 1
+
+        async def refresh():
+            try:
+                await flight.do(
+                    key,
+                    lambda: self._load(plugin_type, key, ttl, stale_ttl, loader)
+                )
+            except Exception as e:
+                # 刷新失败时保留旧值，直到其超出stale窗口
+                self.refresh_failures[plugin_type] = self.refresh_failures.get(plugin_type, 0) + 1
+                logger.warning(f"插件缓存后台刷新失败: {plugin_type}, {str(e)}")
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def clear(self, plugin_type: PluginType = None):
+        """清空指定插件或全部插件的缓存"""
+        caches = [self.caches.get(plugin_type)] if plugin_type else list(self.caches.values())
+        for cache in caches:
+            if cache is not None:
+                cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """按插件类型统计命中率，用于评估第三方API配额消耗"""
+        result = {}
+        for plugin_type, cache in self.caches.items():
+            stats = cache.stats()
+            stale_hits = self.stale_hits.get(plugin_type, 0)
+            stats["fresh_hits"] = stats["hits"] - stale_hits
+            stats["stale_hits"] = stale_hits
+            stats["refreshes"] = self.refreshes.get(plugin_type, 0)
+            stats["refresh_failures"] = self.refresh_failures.get(plugin_type, 0)
+            stats["coalesced"] = self.flights[plugin_type].coalesced
+            result[plugin_type.value] = stats
+        return result
@@ -1,19 +1,52 @@
 """
 插件管理器 - 负责插件的注册、管理和调用
 """
-from typing import Dict, Any, Optional, Type
+import asyncio
+import json
+import time
+from typing import Dict, Any, Hashable, List, Optional, Type
 from abc import ABC, abstractmethod
+import httpx
 from loguru import logger
 
+from app.config import settings
+from app.core.http_client import http_client_pool
+from app.core.plugin_cache import PluginCache
+from app.core.resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, is_upstream_failure
 from app.models.message import PluginType, PluginResult, PluginRequest
 
 
 class BasePlugin(ABC):
     """插件基类"""
     
+    # 同一插件同时执行的最大调用数
+    max_concurrency: int = 4
+    # 单次调用的超时时间（秒），包含排队等待时间
+    timeout: float = 10.0
+    # 结果缓存时间（秒），0表示不缓存
+    cache_ttl: float = 0
+    # 缓存过期后仍可返回旧值并在后台刷新的时间（秒）
+    cache_stale_ttl: float = 0
+    # 第三方接口地址，非空时由插件管理器注入该主机共享的HTTP客户端
+    base_url: Optional[str] = None
+    # 幂等查询，重复调用不会产生副作用
+    idempotent: bool = False
+    # 可以发起对冲请求（慢于p95时再发一次，取先返回的结果）；只适用于调用远程接口的幂等查询，
+    # 本地计算的插件对冲只会重复占用CPU
+    hedgeable: bool = False
+    
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
+        self.http_client: Optional[httpx.AsyncClient] = None
+    
+    def bind_http_client(self, client: Optional[httpx.AsyncClient]):
+        """注入共享HTTP客户端，测试时可注入指向本地替身服务的客户端"""
+        self.http_client = client
+    
+    def cache_key(self, parameters: Dict[str, Any]) -> Optional[Hashable]:
+        """结果缓存key，返回None表示本次调用不缓存；默认使用全部参数"""
+        return json.dumps(parameters, sort_keys=True, ensure_ascii=False, default=str)
     
     @abstractmethod
     async def execute(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
@@ -31,12 +64,41 @@ class PluginManager:
     
     def __init__(self):
         self.plugins: Dict[PluginType, BasePlugin] = {}
+        self.semaphores: Dict[PluginType, asyncio.Semaphore] = {}
+        self.cache = PluginCache()
+        self.breakers: Dict[PluginType, CircuitBreaker] = {}
+        self.latencies: Dict[PluginType, LatencyWindow] = {}
+        self.hedged: Dict[PluginType, int] = {}
+        self.hedge_wins: Dict[PluginType, int] = {}
     
     def register_plugin(self, plugin_type: PluginType, plugin: BasePlugin):
         """注册插件"""
         self.plugins[plugin_type] = plugin
+        self.semaphores[plugin_type] = asyncio.Semaphore(plugin.max_concurrency)
+        self.breakers[plugin_type] = CircuitBreaker(plugin_type.value)
+        self.latencies[plugin_type] = LatencyWindow()
+        self.hedged[plugin_type] = 0
+        self.hedge_wins[plugin_type] = 0
+        self._bind_http_client(plugin)
         logger.info(f"插件注册成功: {plugin_type} - {plugin.name}")
     
+    def _bind_http_client(self, plugin: BasePlugin):
+        """为需要访问第三方接口的插件注入共享HTTP客户端"""
+        if plugin.base_url and plugin.http_client is None:
+            plugin.bind_http_client(http_client_pool.get_client(plugin.base_url))
+    
+    async def startup(self):
+        """应用启动时为已注册插件注入HTTP客户端"""
+        for plugin in self.plugins.values():
+            self._bind_http_client(plugin)
+    
+    async def shutdown(self):
+        """应用关闭时释放插件HTTP连接池"""
+        for plugin in self.plugins.values():
+            if plugin.base_url:
+                plugin.bind_http_client(None)
+        await http_client_pool.shutdown()
+    
     def get_plugin(self, plugin_type: PluginType) -> Optional[BasePlugin]:
         """获取插件"""
         return self.plugins.get(plugin_type)
@@ -45,18 +107,63 @@ class PluginManager:
         """列出所有插件"""
         return {plugin_type: plugin.name for plugin_type, plugin in self.plugins.items()}
     
-    async def execute_plugin(self, request: PluginRequest) -> PluginResult:
-        """执行插件"""
+    async def execute_plugin(self, request: PluginRequest, timeout: Optional[float] = None) -> PluginResult:
+        """执行插件
+        
+        调用受插件的并发上限约束，超过 timeout（默认为插件声明的超时时间）返回失败结果并计为熔断器失败；
+        结果缓存的加载被 shield 保护、不会因超时取消，超时也在这里记录。
+        """
+        plugin = self.get_plugin(request.plugin)
+        if not plugin:
+            return PluginResult(
+                plugin=request.plugin,
+                success=False,
+                error=f"插件未找到: {request.plugin}",
+                session_id=request.session_id
+            )
+        
+        if timeout is None:
+            timeout = plugin.timeout
+        
         try:
+            return await asyncio.wait_for(self._execute(plugin, request), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"插件执行超时: {request.plugin}, 超时时间: {timeout}秒")
+            self.breakers[request.plugin].record_failure()
+            return PluginResult(
+                plugin=request.plugin,
+                success=False,
+                error=f"插件执行超时: {timeout}秒",
+                session_id=request.session_id
+            )
+    
+    async def execute_many(self, requests: List[PluginRequest], timeout: Optional[float] = None) -> List[PluginResult]:
+        """并发执行多个插件请求
+        
+        每个插件类型有独立的并发上限，每个调用的超时时间取插件声明值与整体截止时间的较小值。
+        部分调用失败或超时不影响其他调用，结果按请求顺序返回。
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        
+        def call_timeout(request: PluginRequest) -> Optional[float]:
             plugin = self.get_plugin(request.plugin)
-            if not plugin:
-                return PluginResult(
-                    plugin=request.plugin,
-                    success=False,
-                    error=f"插件未找到: {request.plugin}",
-                    session_id=request.session_id
-                )
-            
+            plugin_timeout = plugin.timeout if plugin else None
+            if deadline is None:
+                return plugin_timeout
+            remaining = max(0.0, deadline - time.monotonic())
+            return remaining if plugin_timeout is None else min(plugin_timeout, remaining)
+        
+        results = await asyncio.gather(
+            *(self.execute_plugin(request, call_timeout(request)) for request in requests)
+        )
+        
+        failed = sum(1 for result in results if not result.success)
+        logger.info(f"批量执行插件完成: 共 {len(results)} 个, 失败 {failed} 个")
+        return list(results)
+    
+    async def _execute(self, plugin: BasePlugin, request: PluginRequest) -> PluginResult:
+        """验证参数并执行插件"""
+        try:
             # 验证参数
             if not plugin.validate_parameters(request.parameters):
                 return PluginResult(
@@ -67,8 +174,7 @@ class PluginManager:
                 )
             
             # 执行插件
-            logger.info(f"执行插件: {request.plugin}")
-            result_data = await plugin.execute(request.parameters)
+            result_data = await self._fetch(plugin, request)
             
             return PluginResult(
                 plugin=request.plugin,
@@ -85,6 +191,106 @@ class PluginManager:
                 error=str(e),
                 session_id=request.session_id
             )
+    
+    async def _fetch(self, plugin: BasePlugin, request: PluginRequest) -> Dict[str, Any]:
+        """读取结果缓存，未命中时调用插件；缓存命中不占用插件并发名额"""
+        key = plugin.cache_key(request.parameters) if plugin.cache_ttl > 0 else None
+        if key is None or not settings.plugin_cache_enabled:
+            return await self._execute_limited(request.plugin, plugin, request.parameters)
+        
+        return await self.cache.get_or_load(
+            request.plugin,
+            key,
+            plugin.cache_ttl,
+            plugin.cache_stale_ttl,
+            lambda: self._execute_limited(request.plugin, plugin, request.parameters)
+        )
+    
+    async def _execute_limited(self, plugin_type: PluginType, plugin: BasePlugin, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """经过熔断器并在插件并发上限内执行
+        
+        只有上游故障（网络错误、超时、5xx等）计为熔断器失败；请求本身无效或被取消（客户端取消、
+        断开或外层超时，外层超时由 execute_plugin 记录）的调用不影响熔断器状态，占用的半开探测名额归还。
+        """
+        breaker = self.breakers[plugin_type]
+        if not breaker.allow():
+            raise CircuitOpenError(f"插件熔断中: {plugin_type.value}")
+        
+        started_at = None
+        try:
+            async with self.semaphores[plugin_type]:
+                logger.info(f"执行插件: {plugin_type}")
+                started_at = time.monotonic()
+                if plugin.hedgeable and settings.plugin_hedge_enabled:
+                    result = await self._execute_hedged(plugin_type, plugin, parameters)
+                else:
+                    result = await plugin.execute(parameters)
+        except BaseException as e:
+            if started_at is not None and is_upstream_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        
+        breaker.record_success()
+        self.latencies[plugin_type].add(time.monotonic() - started_at)
+        return result
+    
+    def _hedge_delay(self, plugin_type: PluginType) -> Optional[float]:
+        """对冲请求的发起延迟：近期耗时的p95，样本不足时不对冲"""
+        latencies = self.latencies[plugin_type]
+        if len(latencies) < settings.plugin_hedge_min_samples:
+            return None
+        return max(
+            latencies.percentile(settings.plugin_hedge_percentile),
+            settings.plugin_hedge_min_delay_ms / 1000
+        )
+    
+    async def _execute_hedged(self, plugin_type: PluginType, plugin: BasePlugin, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """首个请求超过p95仍未返回时再发一个相同请求，取先成功的结果"""
+        delay = self._hedge_delay(plugin_type)
+        if delay is None:
+            return await plugin.execute(parameters)
+        
+        primary = asyncio.create_task(plugin.execute(parameters))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            
+            self.hedged[plugin_type] += 1
+            tasks.append(asyncio.create_task(plugin.execute(parameters)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins[plugin_type] += 1
+                        return task.result()
+            # 两个请求都失败时抛出首个请求的异常
+            return primary.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    def stats(self) -> Dict[str, Any]:
+        """按插件统计结果缓存命中情况"""
+        return self.cache.stats()
+    
+    def status(self) -> Dict[str, Any]:
+        """各插件的熔断器状态、延迟与对冲统计"""
+        result = {}
+        for plugin_type in self.plugins:
+            p95 = self.latencies[plugin_type].percentile(0.95)
+            result[plugin_type.value] = {
+                "breaker": self.breakers[plugin_type].snapshot(),
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "hedged": self.hedged[plugin_type],
+                "hedge_wins": self.hedge_wins[plugin_type]
+            }
+        return result
 
 
 # 全局插件管理器实例
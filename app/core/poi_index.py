@@ -0,0 +1,374 @@
+"""
+POI空间索引模块 - 基于NumPy的网格索引与向量化距离计算
+POI坐标保存在连续数组中并按网格单元排序，查询只需对少量连续切片做向量化计算，
+百万级POI的近邻、半径和范围查询在毫秒内完成
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+
+# 地球平均半径（米）
+EARTH_RADIUS = 6371008.8
+# 每度纬度对应的米数
+METERS_PER_DEGREE = np.pi * EARTH_RADIUS / 180
+
+# POI类别及其同义词，查询关键词命中同义词时按类别过滤，否则按名称包含过滤
+CATEGORY_SYNONYMS: Dict[str, List[str]] = {
+    "餐厅": ["餐厅", "饭店", "饭馆", "美食", "餐馆"],
+    "小吃": ["小吃"],
+    "火锅": ["火锅"],
+    "烧烤": ["烧烤"],
+    "咖啡": ["咖啡", "咖啡店", "咖啡馆", "咖啡厅"],
+    "奶茶": ["奶茶"],
+    "酒店": ["酒店", "宾馆", "民宿", "住宿"],
+    "景点": ["景点", "景区"],
+    "公园": ["公园"],
+    "博物馆": ["博物馆"],
+    "加油站": ["加油站"],
+    "充电桩": ["充电桩", "充电站"],
+    "停车场": ["停车场", "停车"],
+    "银行": ["银行", "ATM"],
+    "医院": ["医院"],
+    "药店": ["药店", "药房"],
+    "超市": ["超市"],
+    "便利店": ["便利店"],
+    "商场": ["商场", "购物中心"],
+    "地铁站": ["地铁站", "地铁"],
+    "公交站": ["公交站", "公交"],
+    "厕所": ["厕所", "洗手间", "卫生间"],
+    "学校": ["学校"],
+    "电影院": ["电影院", "影院"],
+    "健身房": ["健身房"],
+    "酒吧": ["酒吧"],
+    "网吧": ["网吧"],
+}
+
+SORT_DISTANCE = "distance"
+SORT_RATING = "rating"
+
+
+def haversine(lng: float, lat: float, lngs: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    """一个点到一组点的球面距离（米），向量化计算"""
+    lng1, lat1 = np.radians(lng), np.radians(lat)
+    lng2, lat2 = np.radians(lngs), np.radians(lats)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def radius_bbox(lng: float, lat: float, radius: float) -> Tuple[float, float, float, float]:
+    """半径（米）对应的经纬度外接框"""
+    dlat = radius / METERS_PER_DEGREE
+    dlng = dlat / max(np.cos(np.radians(lat)), 1e-6)
+    return lng - dlng, lat - dlat, lng + dlng, lat + dlat
+
+
+class GridIndex:
+    """经纬度网格分桶
+
+    经纬度按 cell_size 度划分网格，点按网格编号（行优先）排序，order 为排序后各位置对应的原始下标。
+    查询范围内的每一行网格对应排序数组中的一个连续切片，通过二分查找定位，
+    内存占用与点数成正比，与网格总数无关。
+    """
+
+    def __init__(self, lngs: np.ndarray, lats: np.ndarray, cell_size: float):
+        self.cell_size = cell_size
+        self.min_lng = float(lngs.min()) if len(lngs) else 0.0
+        self.min_lat = float(lats.min()) if len(lats) else 0.0
+        self.cols = int((float(lngs.max()) - self.min_lng) / self.cell_size) + 1 if len(lngs) else 1
+        self.rows = int((float(lats.max()) - self.min_lat) / self.cell_size) + 1 if len(lats) else 1
+
+        cells = self._cell_ids(lngs, lats)
+        self.order = np.argsort(cells, kind="stable")
+        self.cells = cells[self.order]
+
+    def _cell_ids(self, lngs: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        cols = ((lngs - self.min_lng) / self.cell_size).astype(np.int64)
+        rows = ((lats - self.min_lat) / self.cell_size).astype(np.int64)
+        return rows * self.cols + cols
+
+    def query(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """范围覆盖的所有网格中的点在排序后的位置（可能包含范围外的点）"""
+        col0 = max(0, int((west - self.min_lng) / self.cell_size))
+        col1 = min(self.cols - 1, int((east - self.min_lng) / self.cell_size))
+        row0 = max(0, int((south - self.min_lat) / self.cell_size))
+        row1 = min(self.rows - 1, int((north - self.min_lat) / self.cell_size))
+        if col0 > col1 or row0 > row1:
+            return np.empty(0, dtype=np.int64)
+
+        row_ids = np.arange(row0, row1 + 1, dtype=np.int64) * self.cols
+        starts = np.searchsorted(self.cells, row_ids + col0, side="left")
+        ends = np.searchsorted(self.cells, row_ids + col1, side="right")
+        return np.concatenate([
+            np.arange(start, end) for start, end in zip(starts, ends) if end > start
+        ] or [np.empty(0, dtype=np.int64)])
+
+
+class POIIndex:
+    """POI网格空间索引
+
+    POI按 GridIndex 的网格顺序排序存储，查询只需对少量连续切片做向量化计算。
+    """
+
+    def __init__(
+        self,
+        lngs: np.ndarray,
+        lats: np.ndarray,
+        names: Sequence[str],
+        categories: np.ndarray,
+        category_names: Sequence[str],
+        ratings: Optional[np.ndarray] = None,
+        addresses: Optional[Sequence[str]] = None,
+        cell_size: float = None
+    ):
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        self.grid = GridIndex(lngs, lats, cell_size or settings.poi_index_cell_size)
+        self.cell_size = self.grid.cell_size
+        order = self.grid.order
+
+        self.lngs = lngs[order]
+        self.lats = lats[order]
+        self.categories = np.asarray(categories, dtype=np.int16)[order]
+        self.ratings = (
+            np.asarray(ratings, dtype=np.float32)[order]
+            if ratings is not None else np.zeros(len(order), dtype=np.float32)
+        )
+        # 名称按排序后的顺序拼接为以NUL分隔的UTF-8字节数组，第i个名称从 name_offsets[i] 开始，
+        # 内存按实际长度计算；名称关键词过滤在候选POI的字节上向量化匹配
+        encoded = [names[i].encode("utf-8") + b"\0" for i in order]
+        self.name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=self.name_offsets[1:])
+        self.name_bytes = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        self.addresses = [addresses[i] for i in order] if addresses is not None else None
+        self.category_names = list(category_names)
+
+        self._category_codes: Dict[str, int] = {}
+        for code, category in enumerate(self.category_names):
+            for synonym in CATEGORY_SYNONYMS.get(category, [category]):
+                self._category_codes[synonym.lower()] = code
+
+    def __len__(self) -> int:
+        return len(self.lngs)
+
+    @classmethod
+    def load(cls, path: str) -> "POIIndex":
+        """从 .npz 文件加载
+
+        文件包含 lng、lat、name、category、category_names 数组，rating、address 可选。
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(
+                lngs=data["lng"],
+                lats=data["lat"],
+                names=data["name"].tolist(),
+                categories=data["category"],
+                category_names=data["category_names"].tolist(),
+                ratings=data["rating"] if "rating" in data else None,
+                addresses=data["address"].tolist() if "address" in data else None
+            )
+        logger.info(f"POI数据加载完成: {len(index)} 条, 文件: {path}")
+        return index
+
+    def save(self, path: str):
+        """保存为 .npz 文件"""
+        arrays = {
+            "lng": self.lngs,
+            "lat": self.lats,
+            "name": np.array([self.name(i) for i in range(len(self))]),
+            "category": self.categories,
+            "category_names": np.array(self.category_names),
+            "rating": self.ratings,
+        }
+        if self.addresses is not None:
+            arrays["address"] = np.array(self.addresses)
+        np.savez_compressed(path, **arrays)
+
+    def _candidates(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        """范围覆盖的所有网格中的POI下标（可能包含范围外的点）"""
+        return self.grid.query(west, south, east, north)
+
+    def category_code(self, keyword: str) -> Optional[int]:
+        """关键词对应的类别编号，非类别关键词返回None"""
+        return self._category_codes.get(keyword.strip().lower()) if keyword else None
+
+    def _filter(self, indices: np.ndarray, keyword: Optional[str]) -> np.ndarray:
+        """按类别或名称关键词过滤候选POI"""
+        if not keyword or len(indices) == 0:
+            return indices
+        code = self.category_code(keyword)
+        if code is not None:
+            return indices[self.categories[indices] == code]
+        return indices[self._names_contain(indices, keyword)]
+
+    def name(self, i: int) -> str:
+        """第i个POI的名称"""
+        return self.name_bytes[self.name_offsets[i]:self.name_offsets[i + 1] - 1].tobytes().decode("utf-8")
+
+    def _names_contain(self, indices: np.ndarray, keyword: str) -> np.ndarray:
+        """候选POI的名称是否包含关键词
+
+        候选下标按连续段（网格的一行）切片收集名称字节，对关键词的每个字节做一次向量化比较，
+        命中位置按各候选在收集结果中的起始位置二分查找归属。名称之间以NUL分隔，匹配不会跨越两个名称；
+        UTF-8编码的关键词只会在字符边界上匹配。
+        """
+        found = np.zeros(len(indices), dtype=bool)
+        pattern = keyword.encode("utf-8")
+        if len(indices) == 0 or b"\0" in pattern:
+            return found
+
+        breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+        run_starts = indices[np.concatenate(([0], breaks))].tolist()
+        run_ends = (indices[np.concatenate((breaks - 1, [len(indices) - 1]))] + 1).tolist()
+        offsets = self.name_offsets
+        gathered = np.concatenate([
+            self.name_bytes[offsets[start]:offsets[end]] for start, end in zip(run_starts, run_ends)
+        ])
+
+        width = len(gathered) - len(pattern) + 1
+        if width <= 0:
+            return found
+        matched = gathered[:width] == pattern[0]
+        for offset in range(1, len(pattern)):
+            matched &= gathered[offset:offset + width] == pattern[offset]
+        lengths = offsets[indices + 1] - offsets[indices]
+        starts = np.cumsum(lengths) - lengths
+        found[np.searchsorted(starts, np.flatnonzero(matched), side="right") - 1] = True
+        return found
+
+    def _sorted(self, indices: np.ndarray, distances: np.ndarray, sort: str) -> Tuple[np.ndarray, np.ndarray]:
+        if sort == SORT_RATING:
+            order = np.lexsort((distances, -self.ratings[indices]))
+        else:
+            order = np.argsort(distances, kind="stable")
+        return indices[order], distances[order]
+
+    def within_radius(
+        self,
+        lng: float,
+        lat: float,
+        radius: float,
+        keyword: str = None,
+        limit: int = None,
+        sort: str = SORT_DISTANCE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """半径查询，返回(POI下标, 距离米)"""
+        indices = self._filter(self._candidates(*radius_bbox(lng, lat, radius)), keyword)
+        distances = haversine(lng, lat, self.lngs[indices], self.lats[indices])
+        inside = distances <= radius
+        indices, distances = self._sorted(indices[inside], distances[inside], sort)
+        return indices[:limit], distances[:limit]
+
+    def nearest(
+        self,
+        lng: float,
+        lat: float,
+        k: int = 10,
+        keyword: str = None,
+        max_radius: float = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """k近邻查询，搜索半径从一个网格开始逐次加倍，返回按距离排序的(POI下标, 距离米)"""
+        max_radius = max_radius or settings.poi_max_search_radius
+        radius = min(self.cell_size * METERS_PER_DEGREE, max_radius)
+        while True:
+            indices = self._filter(self._candidates(*radius_bbox(lng, lat, radius)), keyword)
+            if len(indices) >= k or radius >= max_radius:
+                distances = haversine(lng, lat, self.lngs[indices], self.lats[indices])
+                # 外接框内找到k个点后，只有半径内的前k个才是确定的近邻
+                inside = distances <= radius
+                if inside.sum() >= k or radius >= max_radius:
+                    indices, distances = indices[inside], distances[inside]
+                    if len(indices) > k:
+                        top = np.argpartition(distances, k - 1)[:k]
+                        indices, distances = indices[top], distances[top]
+                    return self._sorted(indices, distances, SORT_DISTANCE)
+            radius = min(radius * 2, max_radius)
+
+    def within_bbox(
+        self,
+        west: float,
+        south: float,
+        east: float,
+        north: float,
+        keyword: str = None,
+        limit: int = None,
+        sort: str = SORT_RATING
+    ) -> np.ndarray:
+        """范围查询，默认按评分排序，返回POI下标"""
+        # 先在网格候选（连续切片）上按关键词过滤，再裁剪到范围内
+        indices = self._filter(self._candidates(west, south, east, north), keyword)
+        lngs, lats = self.lngs[indices], self.lats[indices]
+        indices = indices[(lngs >= west) & (lngs <= east) & (lats >= south) & (lats <= north)]
+        if sort == SORT_RATING:
+            indices = indices[np.argsort(-self.ratings[indices], kind="stable")]
+        return indices[:limit]
+
+    def record(self, i: int, distance: float = None) -> Dict[str, object]:
+        """POI详情"""
+        item = {
+            "name": self.name(i),
+            "category": self.category_names[self.categories[i]],
+            "address": self.addresses[i] if self.addresses is not None else "",
+            "longitude": round(float(self.lngs[i]), 6),
+            "latitude": round(float(self.lats[i]), 6),
+            "rating": round(float(self.ratings[i]), 1),
+        }
+        if distance is not None:
+            item["distance_m"] = int(distance)
+            item["distance"] = format_distance(distance)
+        return item
+
+
+def format_distance(meters: float) -> str:
+    """距离显示文本，如"500米"、"1.2公里" """
+    if meters < 1000:
+        return f"{int(meters)}米"
+    return f"{meters / 1000:.1f}公里"
+
+
+def build_demo_index(size: int, seed: int = 42) -> POIIndex:
+    """未配置POI数据文件时，在地名库各城市周边生成确定性的示例POI"""
+    from app.core.gazetteer import LEVEL_CITY, LEVEL_DISTRICT, LEVEL_LANDMARK, gazetteer
+
+    gazetteer.load()
+    centers = [
+        place for place in gazetteer.places
+        if place.level in (LEVEL_CITY, LEVEL_DISTRICT, LEVEL_LANDMARK)
+    ]
+    rng = np.random.default_rng(seed)
+    category_names = list(CATEGORY_SYNONYMS)
+
+    owners = rng.integers(0, len(centers), size)
+    spread = np.array([0.08 if centers[i].level == LEVEL_CITY else 0.02 for i in owners])
+    lngs = np.array([centers[i].longitude for i in owners]) + rng.normal(0, 1, size) * spread
+    lats = np.array([centers[i].latitude for i in owners]) + rng.normal(0, 1, size) * spread
+    categories = rng.integers(0, len(category_names), size)
+    ratings = np.round(rng.uniform(3.0, 5.0, size), 1)
+    names = [
+        f"{centers[o].name}{category_names[c]}{n}号"
+        for n, (o, c) in enumerate(zip(owners, categories))
+    ]
+    addresses = [f"{centers[o].full_name}示例路{n % 300 + 1}号" for n, o in enumerate(owners)]
+    return POIIndex(lngs, lats, names, categories, category_names, ratings, addresses)
+
+
+_poi_index: Optional[POIIndex] = None
+
+
+def get_poi_index() -> POIIndex:
+    """获取全局POI索引，首次调用时加载数据文件（未配置时生成示例数据）"""
+    global _poi_index
+    if _poi_index is None:
+        path = settings.poi_data_file
+        if path and os.path.exists(path):
+            _poi_index = POIIndex.load(path)
+        else:
+            _poi_index = build_demo_index(settings.poi_demo_size)
+            logger.info(f"未配置POI数据文件，已生成示例POI: {len(_poi_index)} 条")
+    return _poi_index
@@ -0,0 +1,149 @@
+"""
+插件容错模块 - 熔断器与延迟统计
+第三方接口故障时快速失败，避免慢请求拖累所有用户；延迟分位数用于对冲请求
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+
+from app.config import settings
+
+# 熔断器状态
+STATE_CLOSED = "closed"        # 正常放行
+STATE_OPEN = "open"            # 熔断中，直接拒绝
+STATE_HALF_OPEN = "half_open"  # 恢复探测，只放行少量请求
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，请求被直接拒绝"""
+
+
+class PluginInputError(ValueError):
+    """请求本身无法处理（如地名无法解析），与上游是否健康无关，不计入熔断器失败"""
+
+
+class UpstreamError(Exception):
+    """上游接口返回了错误结果，计入熔断器失败"""
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """是否为上游故障：网络错误、超时、5xx响应或上游返回的错误结果
+
+    取消（客户端取消或断开、外层超时）不算上游故障，外层超时由调用方单独记录。
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError, UpstreamError))
+
+
+class CircuitBreaker:
+    """单个上游的熔断器
+
+    连续失败达到 failure_threshold 次后打开；打开 recovery_timeout 秒后进入半开状态，
+    放行最多 half_open_max_calls 个探测请求：探测成功则关闭，失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = None,
+        recovery_timeout: float = None,
+        half_open_max_calls: int = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.plugin_breaker_failure_threshold
+        self.recovery_timeout = (
+            settings.plugin_breaker_recovery_timeout if recovery_timeout is None else recovery_timeout
+        )
+        self.half_open_max_calls = half_open_max_calls or settings.plugin_breaker_half_open_max_calls
+
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.consecutive_failures = 0
+
+        # 统计信息
+        self.opened_count = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        """当前状态，打开超过恢复时间后自动进入半开"""
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = STATE_HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """是否放行本次调用，放行后调用方必须记录成功、失败或调用 release"""
+        state = self.state
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+            self._half_open_calls += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """放行的调用没有可记录的结果（排队时被取消或请求本身无效），归还半开探测名额"""
+        if self._state == STATE_HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def record_success(self):
+        """记录成功调用"""
+        self.consecutive_failures = 0
+        if self._state != STATE_CLOSED:
+            self._state = STATE_CLOSED
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        """记录失败调用"""
+        self.consecutive_failures += 1
+        if self._state == STATE_HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self._state != STATE_OPEN:
+                self.opened_count += 1
+            self._state = STATE_OPEN
+            self._opened_at = time.monotonic()
+            self._half_open_calls = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """熔断器状态"""
+        state = self.state
+        retry_in = (
+            max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+            if state == STATE_OPEN else 0.0
+        )
+        return {
+            "state": state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+            "retry_in": round(retry_in, 3)
+        }
+
+
+class LatencyWindow:
+    """最近N次成功调用的耗时窗口"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """第q分位耗时（秒），无样本时返回None"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
@@ -0,0 +1,514 @@
+"""
+路网模块 - 本地路网的紧凑存储与最短路径查询
+路网以CSR（压缩稀疏行）数组保存为.npy文件，以内存映射方式加载，多个工作进程共享同一份物理内存；
+最短路径使用A*算法，启发函数为地标（ALT）三角不等式给出的下界
+"""
+import heapq
+import json
+import os
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+from app.core.poi_index import METERS_PER_DEGREE, GridIndex, haversine, radius_bbox
+
+# 各道路等级的默认车速（公里/小时），不在表中的道路（人行道、小路等）不参与路径规划
+HIGHWAY_SPEEDS = {
+    "motorway": 100,
+    "motorway_link": 60,
+    "trunk": 80,
+    "trunk_link": 50,
+    "primary": 60,
+    "primary_link": 40,
+    "secondary": 50,
+    "secondary_link": 35,
+    "tertiary": 40,
+    "tertiary_link": 30,
+    "unclassified": 30,
+    "residential": 25,
+    "living_street": 10,
+    "service": 15,
+    "road": 30,
+}
+
+# 保存为.npy文件的数组，地标数组可选
+ARRAYS = ("lngs", "lats", "indptr", "indices", "durations", "lengths")
+LANDMARK_ARRAYS = ("landmark_from", "landmark_to")
+META_FILE = "meta.json"
+
+
+class Route(NamedTuple):
+    """最短路径"""
+    nodes: List[int]
+    distance: float  # 米
+    duration: float  # 秒
+    coordinates: List[List[float]]  # [[经度, 纬度], ...]
+    settled: int  # 搜索过程中确定最短距离的节点数
+
+
+class RoadGraph:
+    """CSR格式的有向路网
+
+    节点 u 的出边为 indices[indptr[u]:indptr[u + 1]]，对应的行驶时间（秒）和长度（米）
+    保存在 durations、lengths 的同一位置。landmark_from[v, l] 为地标 l 到 v 的最短时间，
+    landmark_to[v, l] 为 v 到地标 l 的最短时间，按节点存储使一次查询的地标距离连续。
+    """
+
+    def __init__(
+        self,
+        lngs: np.ndarray,
+        lats: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        durations: np.ndarray,
+        lengths: np.ndarray,
+        landmark_from: Optional[np.ndarray] = None,
+        landmark_to: Optional[np.ndarray] = None
+    ):
+        self.lngs = lngs
+        self.lats = lats
+        self.indptr = indptr
+        self.indices = indices
+        self.durations = durations
+        self.lengths = lengths
+        self.landmark_from = landmark_from
+        self.landmark_to = landmark_to
+        # 起终点吸附使用的节点网格索引，首次吸附时建立
+        self._grid: Optional[GridIndex] = None
+        self._grid_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.lngs)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def from_edges(
+        cls,
+        lngs: np.ndarray,
+        lats: np.ndarray,
+        sources: np.ndarray,
+        targets: np.ndarray,
+        durations: np.ndarray,
+        lengths: np.ndarray
+    ) -> "RoadGraph":
+        """由边列表构建CSR数组，平行边只保留行驶时间最短的一条"""
+        size = len(lngs)
+        order = np.lexsort((durations, targets, sources))
+        sources, targets = sources[order], targets[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        keep &= sources != targets
+        order = order[keep]
+        sources, targets = sources[keep], targets[keep]
+
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+        return cls(
+            np.asarray(lngs, dtype=np.float64),
+            np.asarray(lats, dtype=np.float64),
+            indptr,
+            targets.astype(np.int32),
+            durations[order].astype(np.float32),
+            lengths[order].astype(np.float32)
+        )
+
+    def reverse(self) -> "RoadGraph":
+        """反向图（所有边反转），用于计算到地标的距离"""
+        sources = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+        return RoadGraph.from_edges(
+            self.lngs, self.lats, np.asarray(self.indices, dtype=np.int64), sources,
+            np.asarray(self.durations), np.asarray(self.lengths)
+        )
+
+    def dijkstra(self, source: int) -> np.ndarray:
+        """单源最短行驶时间（秒），不可达为inf"""
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        durations = self.durations.tolist()
+        dist = [float("inf")] * len(self)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + durations[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return np.asarray(dist, dtype=np.float32)
+
+    def compute_landmarks(self, count: int, seed: int = 0):
+        """选择地标并预计算到所有节点的最短时间
+
+        地标按"最远优先"选择：每次选取与已选地标的最短时间最大的可达节点，
+        使地标分布在路网边缘，下界更紧。
+        """
+        if count <= 0 or len(self) == 0:
+            return
+        reverse = self.reverse()
+        rng = np.random.default_rng(seed)
+        start = int(rng.integers(len(self)))
+        nearest = self.dijkstra(start)
+
+        landmarks, forward, backward = [], [], []
+        for _ in range(min(count, len(self))):
+            reachable = np.where(np.isfinite(nearest), nearest, -1)
+            landmark = int(np.argmax(reachable))
+            if landmark in landmarks:
+                break
+            landmarks.append(landmark)
+            forward.append(self.dijkstra(landmark))
+            backward.append(reverse.dijkstra(landmark))
+            nearest = forward[-1] if len(landmarks) == 1 else np.minimum(nearest, forward[-1])
+
+        self.landmark_from = np.ascontiguousarray(np.vstack(forward).T)
+        self.landmark_to = np.ascontiguousarray(np.vstack(backward).T)
+        logger.info(f"路网地标预计算完成: {len(landmarks)} 个地标, {len(self)} 个节点")
+
+    def _snap_grid(self) -> GridIndex:
+        """节点网格索引（可在多个线程中调用）"""
+        if self._grid is None:
+            with self._grid_lock:
+                if self._grid is None:
+                    self._grid = GridIndex(self.lngs, self.lats, settings.road_snap_cell_size)
+        return self._grid
+
+    def nearest_node(self, lng: float, lat: float, max_distance: float = None) -> Tuple[int, float]:
+        """距离给定坐标最近的节点及距离（米）
+
+        在节点网格索引中从一个网格开始逐次加倍搜索半径，只计算附近网格中节点的距离；
+        max_distance（默认为 ROAD_MAX_SNAP_DISTANCE）内没有节点时返回(-1, inf)。
+        """
+        max_distance = max_distance or settings.road_max_snap_distance
+        grid = self._snap_grid()
+        radius = min(grid.cell_size * METERS_PER_DEGREE, max_distance)
+        while True:
+            nodes = grid.order[grid.query(*radius_bbox(lng, lat, radius))]
+            if len(nodes):
+                distances = haversine(lng, lat, self.lngs[nodes], self.lats[nodes])
+                best = int(np.argmin(distances))
+                # 半径内最近的节点一定在外接框内
+                if distances[best] <= radius:
+                    return int(nodes[best]), float(distances[best])
+            if radius >= max_distance:
+                return -1, float("inf")
+            radius = min(radius * 2, max_distance)
+
+    def _heuristic(self, target: int):
+        """ALT启发函数：max(d(l,t) - d(l,v), d(v,l) - d(t,l))，对所有地标取最大值"""
+        zeros = lambda nodes: np.zeros(len(nodes))
+        if self.landmark_from is None:
+            return zeros
+        # 只使用与终点双向连通的地标：此时 d(v,l) 为inf说明v无法到达终点，下界inf仍然成立，不会出现 inf - inf
+        usable = np.isfinite(self.landmark_from[target]) & np.isfinite(self.landmark_to[target])
+        if not usable.any():
+            return zeros
+        columns = np.nonzero(usable)[0]
+        lf, lt = self.landmark_from, self.landmark_to
+        from_target = lf[target, columns].astype(np.float64)
+        to_target = lt[target, columns].astype(np.float64)
+        if usable.all():
+            columns = slice(None)
+
+        def heuristic(nodes: np.ndarray) -> np.ndarray:
+            bound = np.maximum(from_target - lf[nodes][:, columns], lt[nodes][:, columns] - to_target)
+            return bound.max(axis=1, initial=0.0)
+
+        return heuristic
+
+    def route(self, source: int, target: int) -> Optional[Route]:
+        """A*最短行驶时间路径，不可达时返回None"""
+        indptr, indices, durations = self.indptr, self.indices, self.durations
+        heuristic = self._heuristic(target)
+
+        best = {source: 0.0}
+        parent_edge: Dict[int, int] = {source: -1}
+        settled = set()
+        heap = [(float(heuristic(np.array([source]))[0]), 0.0, source)]
+        while heap:
+            _, g, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if u == target:
+                break
+            start, end = int(indptr[u]), int(indptr[u + 1])
+            if start == end:
+                continue
+            neighbors = np.asarray(indices[start:end])
+            costs = g + np.asarray(durations[start:end], dtype=np.float64)
+            estimates = heuristic(neighbors)
+            for offset, (v, cost, h) in enumerate(zip(neighbors.tolist(), costs.tolist(), estimates.tolist())):
+                if cost < best.get(v, float("inf")):
+                    best[v] = cost
+                    parent_edge[v] = start + offset
+                    heapq.heappush(heap, (cost + h, cost, v))
+        else:
+            return None
+
+        # 由父边回溯路径
+        edges = []
+        node = target
+        while parent_edge[node] >= 0:
+            edges.append(parent_edge[node])
+            node = int(np.searchsorted(indptr, parent_edge[node], side="right") - 1)
+        edges.reverse()
+        nodes = [source] + [int(indices[e]) for e in edges]
+        node_array = np.asarray(nodes)
+        coordinates = np.column_stack([self.lngs[node_array], self.lats[node_array]]).round(6).tolist()
+        return Route(
+            nodes=nodes,
+            distance=float(np.asarray(self.lengths)[edges].sum()) if edges else 0.0,
+            duration=best[target],
+            coordinates=coordinates,
+            settled=len(settled)
+        )
+
+    def save(self, directory: str):
+        """保存为.npy文件目录，可用 load 以内存映射方式加载"""
+        os.makedirs(directory, exist_ok=True)
+        names = ARRAYS + (LANDMARK_ARRAYS if self.landmark_from is not None else ())
+        for name in names:
+            np.save(os.path.join(directory, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "nodes": len(self),
+                "edges": self.edge_count,
+                "landmarks": 0 if self.landmark_from is None else len(self.landmark_from)
+            }, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "RoadGraph":
+        """加载路网目录，默认以只读内存映射方式打开，多进程共享页缓存"""
+        mode = "r" if mmap else None
+        # np.memmap子类的切片开销较大，转为共享同一映射的普通ndarray视图
+        arrays = {
+            name: np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode))
+            for name in ARRAYS
+        }
+        for name in LANDMARK_ARRAYS:
+            path = os.path.join(directory, f"{name}.npy")
+            arrays[name] = np.asarray(np.load(path, mmap_mode=mode)) if os.path.exists(path) else None
+        graph = cls(**arrays)
+        logger.info(f"路网加载完成: {len(graph)} 个节点, {graph.edge_count} 条边, 目录: {directory}")
+        return graph
+
+
+def _parse_speed(value: Optional[str]) -> Optional[float]:
+    """解析OSM maxspeed标签，如"60"、"60 km/h"、"30 mph" """
+    if not value:
+        return None
+    parts = value.replace("km/h", "").split()
+    try:
+        speed = float(parts[0])
+    except (IndexError, ValueError):
+        return None
+    return speed * 1.609 if "mph" in parts else speed
+
+
+def _largest_component(size: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """弱连通分量中最大的一个的节点掩码，避免起终点吸附到孤立路段上"""
+    parent = list(range(size))
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(sources.tolist(), targets.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+    roots = np.array([find(x) for x in range(size)])
+    return roots == np.bincount(roots).argmax()
+
+
+def build_from_osm(path: str) -> RoadGraph:
+    """从OSM XML数据构建路网
+
+    只保留 HIGHWAY_SPEEDS 中的道路，按 oneway 标签建立单向或双向边，
+    行驶时间按 maxspeed（缺省为道路等级的默认车速）计算，只保留最大的连通路网。
+    """
+    coords: Dict[int, Tuple[float, float]] = {}
+    ways: List[Tuple[List[int], float, int]] = []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            coords[int(element.get("id"))] = (float(element.get("lon")), float(element.get("lat")))
+            element.clear()
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            highway = tags.get("highway")
+            if highway in HIGHWAY_SPEEDS:
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                speed = _parse_speed(tags.get("maxspeed")) or HIGHWAY_SPEEDS[highway]
+                oneway = tags.get("oneway")
+                direction = (
+                    -1 if oneway == "-1"
+                    else 1 if oneway in ("yes", "true", "1") or highway == "motorway"
+                    else 0
+                )
+                ways.append((refs, speed, direction))
+            element.clear()
+
+    # 只保留道路上的节点，重新编号为连续下标
+    used = sorted({ref for refs, _, _ in ways for ref in refs if ref in coords})
+    index = {ref: i for i, ref in enumerate(used)}
+    lngs = np.array([coords[ref][0] for ref in used], dtype=np.float64)
+    lats = np.array([coords[ref][1] for ref in used], dtype=np.float64)
+
+    sources, targets, speeds = [], [], []
+    for refs, speed, direction in ways:
+        refs = [index[ref] for ref in refs if ref in index]
+        for a, b in zip(refs, refs[1:]):
+            if direction >= 0:
+                sources.append(a)
+                targets.append(b)
+                speeds.append(speed)
+            if direction <= 0:
+                sources.append(b)
+                targets.append(a)
+                speeds.append(speed)
+    return _build_graph(lngs, lats, np.array(sources), np.array(targets), np.array(speeds, dtype=np.float64))
+
+
+def _build_graph(
+    lngs: np.ndarray,
+    lats: np.ndarray,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    speeds: np.ndarray
+) -> RoadGraph:
+    """计算边长度与行驶时间，裁剪到最大连通路网并构建CSR图"""
+    keep = _largest_component(len(lngs), sources, targets)
+    remap = np.cumsum(keep) - 1
+    edge_keep = keep[sources]
+    sources, targets, speeds = remap[sources[edge_keep]], remap[targets[edge_keep]], speeds[edge_keep]
+    lngs, lats = lngs[keep], lats[keep]
+
+    lengths = haversine(lngs[sources], lats[sources], lngs[targets], lats[targets])
+    durations = lengths / (speeds / 3.6)
+    return RoadGraph.from_edges(lngs, lats, sources, targets, durations, lengths)
+
+
+def build_demo_graph(grid: int = 9, spacing: float = 0.01, seed: int = 42) -> RoadGraph:
+    """未配置路网数据时，生成覆盖地名库各城市的示例路网
+
+    每个城市（含直辖市）为一个网格状的城区路网（每隔3条为主干道），城市之间以途经插值点的高速公路
+    连接到最近的3个城市，高速公路入口位于城市中心。
+    """
+    from app.core.gazetteer import LEVEL_CITY, LEVEL_PROVINCE, gazetteer
+
+    gazetteer.load()
+    cities = [place for place in gazetteer.places if place.level == LEVEL_CITY]
+    # 直辖市、特别行政区没有下级城市，本身作为城市
+    parents = {ancestor for city in cities for ancestor in city.ancestors}
+    cities += [
+        place for place in gazetteer.places
+        if place.level == LEVEL_PROVINCE and place.name not in parents
+    ]
+    rng = np.random.default_rng(seed)
+    lngs: List[float] = []
+    lats: List[float] = []
+    sources: List[int] = []
+    targets: List[int] = []
+    speeds: List[float] = []
+
+    def connect(a: int, b: int, speed: float):
+        sources.extend((a, b))
+        targets.extend((b, a))
+        speeds.extend((speed, speed))
+
+    centers = []
+    half = grid // 2
+    for city in cities:
+        base = len(lngs)
+        for i in range(grid):
+            for j in range(grid):
+                lngs.append(city.longitude + (i - half) * spacing + rng.normal(0, spacing * 0.1))
+                lats.append(city.latitude + (j - half) * spacing + rng.normal(0, spacing * 0.1))
+        for i in range(grid):
+            for j in range(grid):
+                node = base + i * grid + j
+                if i + 1 < grid:
+                    connect(node, node + grid, HIGHWAY_SPEEDS["primary" if j % 3 == 0 else "residential"])
+                if j + 1 < grid:
+                    connect(node, node + 1, HIGHWAY_SPEEDS["primary" if i % 3 == 0 else "residential"])
+        centers.append(base + half * grid + half)
+
+    # 城际高速公路，每约5公里一个插值点，并加入横向偏移使线路有弯曲
+    city_lngs = np.array([city.longitude for city in cities])
+    city_lats = np.array([city.latitude for city in cities])
+    linked = set()
+    for a, city in enumerate(cities):
+        distances = haversine(city.longitude, city.latitude, city_lngs, city_lats)
+        for b in np.argsort(distances)[1:4].tolist():
+            if (min(a, b), max(a, b)) in linked:
+                continue
+            linked.add((min(a, b), max(a, b)))
+            steps = max(2, int(distances[b] / 5000))
+            bend = rng.normal(0, 0.05)
+            previous = centers[a]
+            for k in range(1, steps):
+                t = k / steps
+                offset = bend * np.sin(np.pi * t)
+                lngs.append(city.longitude + (city_lngs[b] - city.longitude) * t - offset * (city_lats[b] - city.latitude))
+                lats.append(city.latitude + (city_lats[b] - city.latitude) * t + offset * (city_lngs[b] - city.longitude))
+                connect(previous, len(lngs) - 1, HIGHWAY_SPEEDS["motorway"])
+                previous = len(lngs) - 1
+            connect(previous, centers[b], HIGHWAY_SPEEDS["motorway"])
+
+    return _build_graph(
+        np.array(lngs), np.array(lats),
+        np.array(sources), np.array(targets), np.array(speeds, dtype=np.float64)
+    )
+
+
+def format_duration(seconds: float) -> str:
+    """行驶时间显示文本，如"25分钟"、"2小时10分钟" """
+    minutes = max(1, int(round(seconds / 60)))
+    if minutes < 60:
+        return f"{minutes}分钟"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}小时{minutes}分钟" if minutes else f"{hours}小时"
+
+
+_road_graph: Optional[RoadGraph] = None
+_road_graph_lock = threading.Lock()
+
+
+def get_road_graph() -> RoadGraph:
+    """获取全局路网，首次调用时加载（可在线程中调用）
+
+    优先以内存映射方式加载 ROAD_GRAPH_DIR；目录不存在但配置了 ROAD_OSM_FILE 时，
+    从OSM数据构建并保存到该目录；都未配置时生成示例路网。
+    """
+    global _road_graph
+    with _road_graph_lock:
+        if _road_graph is None:
+            directory = settings.road_graph_dir
+            if directory and os.path.exists(os.path.join(directory, META_FILE)):
+                _road_graph = RoadGraph.load(directory)
+            else:
+                if settings.road_osm_file:
+                    graph = build_from_osm(settings.road_osm_file)
+                    logger.info(f"已从OSM数据构建路网: {len(graph)} 个节点, {graph.edge_count} 条边")
+                else:
+                    graph = build_demo_graph()
+                    logger.info(f"未配置路网数据，已生成示例路网: {len(graph)} 个节点, {graph.edge_count} 条边")
+                graph.compute_landmarks(settings.road_landmarks)
+                if directory:
+                    graph.save(directory)
+                    graph = RoadGraph.load(directory)
+                _road_graph = graph
+    return _road_graph
@@ -0,0 +1,300 @@
+"""
+语义缓存模块 - 换一种说法的相同问题也能命中意图和回答缓存
+问题转换为本地计算的字符n-gram哈希向量（无需网络和GPU），向量存放在预分配的NumPy矩阵中，
+查找时批量计算余弦相似度；条目超过阈值后改用倒排文件索引（IVF），只扫描最近的若干个簇。
+地名、数字和时间词从文本中取出作为守卫，必须完全一致才能命中，
+“北京天气怎么样”与“看看北京的天气”可以命中，与“上海天气怎么样”、“北京明天天气”不会命中
+"""
+import re
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+from app.core.gazetteer import gazetteer
+from app.utils.tokenizer import normalize_query
+
+# 不影响问题含义的语气词和客套词，计算向量前去除（按长度优先匹配）
+FILLER_WORDS = (
+    "请问", "请帮我", "帮我", "帮忙", "麻烦", "给我", "我想知道", "我想", "想知道", "告诉我",
+    "一下", "找一下", "搜一下", "看看", "查查", "查一下", "查询", "怎么样", "如何", "怎样", "是什么", "有哪些", "有什么", "有没有", "有吗",
+    "请", "的", "了", "吗", "呢", "吧", "啊", "呀",
+)
+# 改变问题含义的时间词，作为守卫必须一致
+TIME_WORDS = (
+    "今天", "明天", "后天", "大后天", "昨天", "前天", "现在", "今晚", "明晚", "早上", "上午", "中午",
+    "下午", "晚上", "周末", "本周", "下周", "这周", "未来", "最近",
+)
+# 替换文本中地名的占位字符（Unicode私用区）
+PLACE_MARK = "\ue000"
+
+_FILLER_PATTERN = re.compile("|".join(sorted(map(re.escape, FILLER_WORDS), key=len, reverse=True)))
+_GUARD_PATTERN = re.compile(
+    "|".join(sorted(map(re.escape, TIME_WORDS), key=len, reverse=True)) + r"|\d+(?:\.\d+)?"
+)
+NGRAM_SIZES = (1, 2, 3)
+# 向量中守卫部分的维数占比（1/GUARD_SHARE）
+GUARD_SHARE = 4
+
+# 候选条目数：相似度最高的几个条目中取第一个守卫一致的
+_CANDIDATES = 8
+
+
+def features(text: str) -> Tuple[str, Tuple[str, ...]]:
+    """把问题拆分为用于计算向量的模板和必须一致的守卫
+
+    模板为去除语气词、地名替换为占位符、数字和时间词去除后的文本；
+    守卫为按出现顺序的地名、数字和时间词。
+    """
+    text = normalize_query(text)
+    guard: List[str] = []
+    parts: List[str] = []
+    position = 0
+    for start, end, place in gazetteer.mentions(text):
+        parts.append(text[position:start])
+        parts.append(PLACE_MARK)
+        guard.append(place.full_name)
+        position = end
+    parts.append(text[position:])
+    template = "".join(parts)
+
+    guard.extend(_GUARD_PATTERN.findall(template))
+    template = _GUARD_PATTERN.sub("", template)
+    template = _FILLER_PATTERN.sub("", template)
+    return template, tuple(guard)
+
+
+def _hash_into(vector: np.ndarray, feature: str):
+    """带符号的特征哈希"""
+    h = zlib.crc32(feature.encode("utf-8"))
+    vector[h % len(vector)] += 1.0 if h & 0x80000000 else -1.0
+
+
+def _normalize(vector: np.ndarray, scale: float):
+    norm = float(np.linalg.norm(vector))
+    if norm > 0:
+        vector *= scale / norm
+
+
+def embed(template: str, guard: Tuple[str, ...], dim: int) -> np.ndarray:
+    """问题向量：模板的字符n-gram哈希与守卫词（带位置）的哈希拼接
+
+    两部分各自归一化到 1/√2，整体为单位向量。守卫相同的两个问题的余弦相似度为 (模板相似度 + 1) / 2，
+    守卫不同的条目因此排在守卫相同的条目之后，IVF的簇也按模板和守卫共同划分。
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    split = dim - dim // GUARD_SHARE
+    text_part, guard_part = vector[:split], vector[split:]
+    for n in NGRAM_SIZES:
+        for i in range(len(template) - n + 1):
+            _hash_into(text_part, template[i:i + n])
+    for i, word in enumerate(guard or ("",)):
+        _hash_into(guard_part, f"{i}:{word}")
+    _normalize(text_part, 0.5 ** 0.5)
+    _normalize(guard_part, 0.5 ** 0.5)
+    return vector
+
+
+class SemanticCache:
+    """按问题语义查找的缓存
+
+    - 条目向量存放在 capacity × dim 的预分配矩阵中，写满后覆盖最早写入的条目
+    - 模板和守卫完全相同的问题直接命中，无需计算相似度
+    - 条目数少于 ivf_threshold 时对全部向量做一次矩阵-向量乘法；
+      达到阈值时用已有条目训练 2·sqrt(capacity) 个簇中心（球面k-means），之后写入的条目分配到最近的簇，
+      查找时只扫描与问题最相近的 nprobe 个簇
+    - 守卫一致、模板的余弦相似度不低于 threshold 且未过期的条目才算命中
+    """
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int = None,
+        ttl: float = 0,
+        threshold: float = None,
+        dim: int = None,
+        ivf_threshold: int = None,
+        nprobe: int = None
+    ):
+        self.name = name
+        self.capacity = settings.semantic_cache_capacity if capacity is None else capacity
+        self.ttl = ttl
+        self.threshold = settings.semantic_cache_threshold if threshold is None else threshold
+        self.dim = settings.semantic_cache_dim if dim is None else dim
+        self.ivf_threshold = settings.semantic_cache_ivf_threshold if ivf_threshold is None else ivf_threshold
+        self.nprobe = settings.semantic_cache_ivf_nprobe if nprobe is None else nprobe
+
+        self.vectors = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        self.expires = np.zeros(self.capacity, dtype=np.float64)
+        self.values: List[Any] = [None] * self.capacity
+        self.guards: List[Optional[Tuple[str, ...]]] = [None] * self.capacity
+        self.keys: List[Optional[Tuple[str, Tuple[str, ...]]]] = [None] * self.capacity
+        self._slots: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+        self.size = 0
+        self._next = 0
+
+        # 倒排文件索引，训练前为None
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.full(self.capacity, -1, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._arrays: List[Optional[np.ndarray]] = []
+
+        # 统计信息
+        self.hits = 0
+        self.exact_hits = 0
+        self.misses = 0
+        self.guard_rejects = 0
+
+    def get(self, text: str) -> Optional[Any]:
+        """查找语义相近且守卫一致的条目"""
+        template, guard = features(text)
+        if not template:
+            return None
+
+        now = time.monotonic()
+        slot = self._slots.get((template, guard))
+        if slot is not None and self.expires[slot] > now:
+            self.hits += 1
+            self.exact_hits += 1
+            return self.values[slot]
+
+        # 守卫相同时向量相似度为 (模板相似度 + 1) / 2
+        min_score = (self.threshold + 1) / 2
+        rejected = False
+        for slot, score in self.search(embed(template, guard, self.dim)):
+            if score < min_score:
+                break
+            if self.expires[slot] <= now:
+                continue
+            if self.guards[slot] != guard:
+                rejected = True
+                continue
+            self.hits += 1
+            logger.debug(f"语义缓存命中({self.name}): {text} 模板相似度 {score * 2 - 1:.3f}")
+            return self.values[slot]
+        if rejected:
+            self.guard_rejects += 1
+        self.misses += 1
+        return None
+
+    def search(self, query: np.ndarray, k: int = _CANDIDATES) -> List[Tuple[int, float]]:
+        """相似度最高的k个条目，返回按相似度降序的(位置, 相似度)列表"""
+        if self.size == 0:
+            return []
+        if self.centroids is None:
+            slots = None
+            scores = self.vectors[:self.size] @ query
+        else:
+            slots = self._probe(query)
+            if slots.size == 0:
+                return []
+            scores = self.vectors[slots] @ query
+
+        if scores.size > k:
+            top = np.argpartition(scores, -k)[-k:]
+        else:
+            top = np.arange(scores.size)
+        top = top[np.argsort(scores[top])[::-1]]
+        if slots is not None:
+            return [(int(slots[i]), float(scores[i])) for i in top]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def _probe(self, query: np.ndarray) -> np.ndarray:
+        """与问题最相近的 nprobe 个簇中的全部条目位置"""
+        nearest = self.centroids @ query
+        nprobe = min(self.nprobe, len(nearest))
+        probed = np.argpartition(nearest, -nprobe)[-nprobe:]
+        arrays = []
+        for cluster in probed:
+            array = self._arrays[cluster]
+            if array is None:
+                array = self._arrays[cluster] = np.array(self._lists[cluster], dtype=np.int64)
+            arrays.append(array)
+        return np.concatenate(arrays)
+
+    def set(self, text: str, value: Any):
+        """写入条目，模板和守卫相同的条目被替换"""
+        template, guard = features(text)
+        if not template or self.capacity <= 0:
+            return
+
+        key = (template, guard)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._next
+            self._next = (self._next + 1) % self.capacity
+            if self.keys[slot] is not None:
+                del self._slots[self.keys[slot]]
+            else:
+                self.size += 1
+            self._slots[key] = slot
+            self.keys[slot] = key
+            self.guards[slot] = guard
+            self.vectors[slot] = embed(template, guard, self.dim)
+            self._assign(slot)
+
+        self.values[slot] = value
+        self.expires[slot] = time.monotonic() + self.ttl if self.ttl > 0 else np.inf
+
+        if self.centroids is None and self.size >= self.ivf_threshold:
+            self._train()
+
+    def _assign(self, slot: int):
+        """把条目分配到最近的簇（已训练时）"""
+        if self.centroids is None:
+            return
+        previous = self.assignments[slot]
+        if previous >= 0:
+            self._lists[previous].remove(slot)
+            self._arrays[previous] = None
+        cluster = int(np.argmax(self.centroids @ self.vectors[slot]))
+        self.assignments[slot] = cluster
+        self._lists[cluster].append(slot)
+        self._arrays[cluster] = None
+
+    def _train(self, iterations: int = 6):
+        """用已有条目训练簇中心并分配全部条目"""
+        started = time.perf_counter()
+        vectors = self.vectors[:self.size]
+        nlist = max(1, min(int(2 * self.capacity ** 0.5), self.size))
+        rng = np.random.default_rng(0)
+        centroids = vectors[rng.choice(self.size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # 空簇保留原中心
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments[:self.size] = labels
+        self._lists = [[] for _ in range(nlist)]
+        for slot, cluster in enumerate(labels.tolist()):
+            self._lists[cluster].append(slot)
+        self._arrays = [None] * nlist
+        logger.info(
+            f"语义缓存({self.name})建立IVF索引: {self.size} 条, {nlist} 个簇, "
+            f"耗时 {(time.perf_counter() - started) * 1000:.0f}ms"
+        )
+
+    def __len__(self) -> int:
+        return self.size
+
+    def stats(self) -> Dict[str, Any]:
+        """命中、未命中与索引统计"""
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "capacity": self.capacity,
+            "ivf_clusters": 0 if self.centroids is None else len(self.centroids),
+            "hits": self.hits,
+            "exact_hits": self.exact_hits,
+            "misses": self.misses,
+            "guard_rejects": self.guard_rejects,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,228 @@
+"""
+会话记忆模块 - 按 session_id 保存多轮对话，供追问时补充上下文
+每个会话只保留按token预算截取的最近若干轮，更早的轮次可折叠为滚动摘要，
+每轮提示词的大小因此不随对话轮数增长；所有会话的总token数有上限，超出时淘汰最久未活跃的会话
+"""
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config import settings
+from app.utils.tokenizer import estimate_tokens, truncate_tokens
+
+
+class Turn:
+    """一轮对话的紧凑记录"""
+
+    __slots__ = ("user", "assistant", "tokens")
+
+    def __init__(self, user: str, assistant: str):
+        self.user = user
+        self.assistant = assistant
+        self.tokens = estimate_tokens(user) + estimate_tokens(assistant)
+
+
+class Session:
+    """单个会话的记忆：最近的轮次、滚动摘要及待折叠进摘要的轮次"""
+
+    __slots__ = ("turns", "summary", "pending", "tokens", "touched_at", "summarizing")
+
+    def __init__(self):
+        self.turns: Deque[Turn] = deque()
+        self.summary = ""
+        self.pending: List[Turn] = []
+        self.tokens = 0
+        self.touched_at = time.monotonic()
+        self.summarizing = False
+
+    def footprint(self) -> int:
+        """会话占用的token数，计入总量上限"""
+        return self.tokens + estimate_tokens(self.summary) + sum(turn.tokens for turn in self.pending)
+
+
+class SessionMemory:
+    """按 session_id 索引的多轮对话记忆
+
+    - 每轮记录用户消息和回答，回答超过 turn_max_tokens 时截断
+    - 会话内的轮次总token数超过 context_tokens 或轮数超过 max_turns 时移出最早的轮次，
+      启用摘要时移出的轮次等待折叠进摘要，否则直接丢弃
+    - 会话数超过 max_sessions 或所有会话的总token数超过 max_tokens 时按LRU淘汰会话，
+      超过 ttl 秒未活跃的会话在访问时清除
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = None,
+        max_tokens: int = None,
+        context_tokens: int = None,
+        max_turns: int = None,
+        turn_max_tokens: int = None,
+        ttl: float = None,
+        summary_enabled: bool = None
+    ):
+        self.max_sessions = settings.session_memory_max_sessions if max_sessions is None else max_sessions
+        self.max_tokens = settings.session_memory_max_tokens if max_tokens is None else max_tokens
+        self.context_tokens = settings.session_memory_context_tokens if context_tokens is None else context_tokens
+        self.max_turns = settings.session_memory_max_turns if max_turns is None else max_turns
+        self.turn_max_tokens = (
+            settings.session_memory_turn_max_tokens if turn_max_tokens is None else turn_max_tokens
+        )
+        self.ttl = settings.session_memory_ttl if ttl is None else ttl
+        self.summary_enabled = (
+            settings.session_memory_summary_enabled if summary_enabled is None else summary_enabled
+        )
+
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._footprints: Dict[str, int] = {}
+        self.tokens = 0
+
+        # 统计信息
+        self.evicted_sessions = 0
+        self.expired_sessions = 0
+        self.dropped_turns = 0
+        self.summarized_turns = 0
+        self.summaries = 0
+
+    def _get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self.ttl > 0 and time.monotonic() - session.touched_at > self.ttl:
+            self._remove(session_id)
+            self.expired_sessions += 1
+            return None
+        return session
+
+    def _remove(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self.tokens -= self._footprints.pop(session_id, 0)
+
+    def _account(self, session_id: str, session: Session):
+        """重新计算会话占用并按LRU淘汰超出上限的会话"""
+        footprint = session.footprint()
+        self.tokens += footprint - self._footprints.get(session_id, 0)
+        self._footprints[session_id] = footprint
+        while self._sessions and (len(self._sessions) > self.max_sessions or self.tokens > self.max_tokens):
+            oldest = next(iter(self._sessions))
+            if oldest == session_id and len(self._sessions) == 1:
+                break
+            self._remove(oldest)
+            self.evicted_sessions += 1
+
+    def context(self, session_id: Optional[str], budget: int = None) -> List[Dict[str, str]]:
+        """构建历史消息（摘要 + 最近的轮次），总token数不超过 budget
+
+        从最近一轮向前选取，放不下的更早轮次不再加入。
+        """
+        if not session_id:
+            return []
+        session = self._get(session_id)
+        if session is None:
+            return []
+
+        budget = self.context_tokens if budget is None else budget
+        selected: List[Turn] = []
+        used = 0
+        for turn in reversed(session.turns):
+            if used + turn.tokens > budget:
+                break
+            selected.append(turn)
+            used += turn.tokens
+
+        messages: List[Dict[str, str]] = []
+        if session.summary:
+            messages.append({"role": "system", "content": f"此前对话的摘要：{session.summary}"})
+        for turn in reversed(selected):
+            messages.append({"role": "user", "content": turn.user})
+            messages.append({"role": "assistant", "content": turn.assistant})
+        return messages
+
+    def record(self, session_id: Optional[str], user: str, assistant: str) -> bool:
+        """记录一轮对话，返回是否有轮次等待折叠进摘要"""
+        if not session_id or not user or not assistant:
+            return False
+        session = self._get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = Session()
+        else:
+            self._sessions.move_to_end(session_id)
+        session.touched_at = time.monotonic()
+
+        turn = Turn(
+            truncate_tokens(user, self.turn_max_tokens),
+            truncate_tokens(assistant, self.turn_max_tokens)
+        )
+        session.turns.append(turn)
+        session.tokens += turn.tokens
+
+        # 移出超出预算的最早轮次，至少保留最近一轮
+        while len(session.turns) > 1 and (
+            session.tokens > self.context_tokens or len(session.turns) > self.max_turns
+        ):
+            oldest = session.turns.popleft()
+            session.tokens -= oldest.tokens
+            if self.summary_enabled:
+                session.pending.append(oldest)
+            else:
+                self.dropped_turns += 1
+
+        self._account(session_id, session)
+        return bool(session.pending) and not session.summarizing
+
+    def take_pending(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """取出待折叠的轮次和当前摘要，由调用方生成新摘要后通过 set_summary 写回"""
+        session = self._get(session_id)
+        if session is None or not session.pending or session.summarizing:
+            return None
+        session.summarizing = True
+        turns, session.pending = session.pending, []
+        return {
+            "summary": session.summary,
+            "turns": [{"user": turn.user, "assistant": turn.assistant} for turn in turns]
+        }
+
+    def set_summary(self, session_id: str, summary: Optional[str], turns: int = 0):
+        """写回滚动摘要；summary 为None表示生成失败，保留原摘要
+
+        生成摘要期间新移出的轮次留在待折叠列表中，调用方应再次调用 take_pending。
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        session.summarizing = False
+        if summary is None:
+            self.dropped_turns += turns
+        else:
+            session.summary = truncate_tokens(summary.strip(), settings.session_memory_summary_tokens)
+            self.summarized_turns += turns
+            self.summaries += 1
+        self._account(session_id, session)
+
+    def clear(self, session_id: str):
+        """清除会话记忆"""
+        self._remove(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        """会话数、占用token数与淘汰统计"""
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "tokens": self.tokens,
+            "max_tokens": self.max_tokens,
+            "turns": sum(len(session.turns) for session in self._sessions.values()),
+            "evicted_sessions": self.evicted_sessions,
+            "expired_sessions": self.expired_sessions,
+            "dropped_turns": self.dropped_turns,
+            "summarized_turns": self.summarized_turns,
+            "summaries": self.summaries
+        }
+
+
+# 全局会话记忆实例
+session_memory = SessionMemory()
@@ -0,0 +1,215 @@
+"""
+矢量瓦片模块 - 把插件结果图层按需编码为矢量瓦片（MVT）
+结果图层按会话登记，瓦片按需生成并缓存，客户端只请求视口内的瓦片
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.config import settings
+from app.core.clustering import ClusterIndex
+from app.utils.cache import TTLCache
+from app.utils.geometry import TILE_SIZE, project, simplify_mask
+from app.utils.mvt import GEOM_LINESTRING, GEOM_POINT, GEOM_POLYGON, LayerEncoder, encode_tile
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+GEOMETRY_TYPES = {
+    "Point": GEOM_POINT,
+    "LineString": GEOM_LINESTRING,
+    "Polygon": GEOM_POLYGON,
+}
+
+
+def tile_bounds(z: int, x: int, y: int, buffer: float = 0.0) -> Tuple[float, float, float, float]:
+    """瓦片在[0, 1]墨卡托坐标中的范围，buffer为占瓦片边长的比例"""
+    scale = 2 ** z
+    pad = buffer / scale
+    return x / scale - pad, y / scale - pad, (x + 1) / scale + pad, (y + 1) / scale + pad
+
+
+class TileLayer:
+    """结果图层：经纬度几何的要素集合
+
+    要素格式为 {"type": "Point" | "LineString" | "Polygon", "coordinates": [...], "properties": {...}}，
+    坐标与GeoJSON相同（[经度, 纬度]）。构建时投影到墨卡托坐标并记录各要素范围，
+    生成瓦片时按范围向量化筛选。
+    """
+
+    def __init__(self, name: str, features: List[Dict[str, Any]], version: str = None):
+        self.name = name
+        self.version = version or hashlib.sha1(
+            json.dumps(features, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+
+        self.types: List[int] = []
+        self.properties: List[Dict[str, Any]] = []
+        # 每个要素的几何：环或线的列表，每个元素为(n, 2)的墨卡托坐标数组
+        self.parts: List[List[np.ndarray]] = []
+        bounds = []
+        for feature in features:
+            geom_type = GEOMETRY_TYPES.get(feature.get("type"))
+            if geom_type is None:
+                raise ValueError(f"不支持的几何类型: {feature.get('type')}")
+            coordinates = feature["coordinates"]
+            if geom_type == GEOM_POINT:
+                coordinates = [[coordinates]]
+            elif geom_type == GEOM_LINESTRING:
+                coordinates = [coordinates]
+            parts = []
+            for part in coordinates:
+                lnglat = np.asarray(part, dtype=np.float64).reshape(-1, 2)
+                xs, ys = project(lnglat[:, 0], lnglat[:, 1])
+                parts.append(np.column_stack([xs, ys]))
+            merged = np.concatenate(parts)
+            bounds.append((*merged.min(axis=0), *merged.max(axis=0)))
+            self.types.append(geom_type)
+            self.properties.append(feature.get("properties") or {})
+            self.parts.append(parts)
+
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def render(self, encoder: LayerEncoder, z: int, x: int, y: int, buffer: float):
+        """把与瓦片相交的要素写入编码器"""
+        x0, y0, x1, y1 = tile_bounds(z, x, y, buffer)
+        b = self.bounds
+        hits = np.nonzero((b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0))[0]
+
+        scale = 2 ** z * encoder.extent
+        origin = np.array([x * encoder.extent, y * encoder.extent], dtype=np.float64)
+        for i in hits.tolist():
+            geom_type = self.types[i]
+            parts = [np.rint(part * scale - origin).astype(np.int64) for part in self.parts[i]]
+            if geom_type == GEOM_POINT:
+                geometry = [tuple(parts[0][0].tolist())]
+            elif geom_type == GEOM_LINESTRING:
+                # 先裁剪到瓦片，再按瓦片的缩放级别抽稀，偏差不超过配置的屏幕像素
+                tolerance = settings.geometry_simplify_pixels * encoder.extent / TILE_SIZE
+                geometry = [
+                    [tuple(p) for p in piece[simplify_mask(piece, tolerance)].tolist()]
+                    for piece in _clip_line(parts[0], encoder.extent, buffer)
+                ]
+            else:
+                geometry = [[tuple(p) for p in ring.tolist()] for ring in parts]
+            encoder.add_feature(geom_type, geometry, self.properties[i], i)
+
+
+def _clip_line(line: np.ndarray, extent: int, buffer: float) -> List[np.ndarray]:
+    """保留与瓦片（含缓冲区）相交的线段，按连续线段拆分为多段线
+
+    线段端点可能落在瓦片外，由渲染端裁剪；这里只去掉完全在瓦片外的部分，控制瓦片大小。
+    """
+    if len(line) < 2:
+        return []
+    lo, hi = -buffer * extent, (1 + buffer) * extent
+    a, b = line[:-1], line[1:]
+    keep = (
+        (np.minimum(a[:, 0], b[:, 0]) <= hi) & (np.maximum(a[:, 0], b[:, 0]) >= lo)
+        & (np.minimum(a[:, 1], b[:, 1]) <= hi) & (np.maximum(a[:, 1], b[:, 1]) >= lo)
+    )
+    lines = []
+    start = None
+    for i, kept in enumerate(keep.tolist() + [False]):
+        if kept and start is None:
+            start = i
+        elif not kept and start is not None:
+            lines.append(line[start:i + 1])
+            start = None
+    return lines
+
+
+class ClusterTileLayer:
+    """POI聚合图层：每个缩放级别的瓦片直接使用聚合索引中对应层级的聚合点"""
+
+    def __init__(self, name: str, index: ClusterIndex, version: str):
+        self.name = name
+        self.index = index
+        self.version = version
+
+    def __len__(self) -> int:
+        return self.index.size
+
+    def render(self, encoder: LayerEncoder, z: int, x: int, y: int, buffer: float):
+        """把瓦片范围内的聚合点和POI写入编码器"""
+        index = self.index
+        level = index.levels[max(index.min_zoom, min(z, index.max_zoom + 1))]
+        x0, y0, x1, y1 = tile_bounds(z, x, y, buffer)
+        mask = (level.xs >= x0) & (level.xs <= x1) & (level.ys >= y0) & (level.ys <= y1)
+
+        scale = 2 ** z * encoder.extent
+        txs = np.rint(level.xs[mask] * scale - x * encoder.extent).astype(np.int64).tolist()
+        tys = np.rint(level.ys[mask] * scale - y * encoder.extent).astype(np.int64).tolist()
+        for tx, ty, count, node in zip(txs, tys, level.counts[mask].tolist(), level.ids[mask].tolist()):
+            if node >= index.size:
+                properties = {
+                    "cluster": True,
+                    "count": count,
+                    "expansion_zoom": index.expansion_zoom(node)
+                }
+            else:
+                properties = {"cluster": False, "count": 1, **index.properties[node]}
+            encoder.add_feature(GEOM_POINT, [(tx, ty)], properties, node)
+
+
+class TileStore:
+    """按会话登记的结果图层与瓦片缓存
+
+    瓦片缓存键包含图层版本，图层更新后旧瓦片自然失效；ETag即图层版本，
+    客户端重新验证时未变化的瓦片返回304，无需重新编码和传输。
+    """
+
+    def __init__(self):
+        self.layers = TTLCache(settings.tile_layer_capacity, settings.tile_layer_ttl)
+        self.tiles = TTLCache(settings.tile_cache_capacity)
+        self.extent = settings.tile_extent
+        self.buffer = settings.tile_buffer / settings.tile_extent
+        self.rendered = 0
+        self.not_modified = 0
+
+    def set_layer(self, session_id: str, layer):
+        """登记或替换会话的结果图层"""
+        self.layers.set((session_id, layer.name), layer)
+        logger.info(f"矢量瓦片图层已登记: {session_id}/{layer.name}, 版本 {layer.version}, {len(layer)} 个要素")
+
+    def get_layer(self, session_id: str, name: str):
+        return self.layers.get((session_id, name))
+
+    @staticmethod
+    def etag(layer) -> str:
+        return f'"{layer.version}"'
+
+    @staticmethod
+    def tile_url(session_id: str, name: str) -> str:
+        """供前端地图库使用的瓦片URL模板"""
+        return f"/tiles/{name}/{{z}}/{{x}}/{{y}}.mvt?session_id={session_id}"
+
+    def cached_tile(self, layer, session_id: str, z: int, x: int, y: int) -> Optional[bytes]:
+        return self.tiles.get((session_id, layer.name, layer.version, z, x, y))
+
+    def render_tile(self, layer, z: int, x: int, y: int) -> bytes:
+        """编码瓦片（不访问缓存，可在线程中执行）"""
+        encoder = LayerEncoder(layer.name, self.extent)
+        layer.render(encoder, z, x, y, self.buffer)
+        return encode_tile([encoder])
+
+    def store_tile(self, layer, session_id: str, z: int, x: int, y: int, data: bytes):
+        self.rendered += 1
+        self.tiles.set((session_id, layer.name, layer.version, z, x, y), data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "layers": len(self.layers),
+            "rendered": self.rendered,
+            "not_modified": self.not_modified,
+            "tile_cache": self.tiles.stats()
+        }
+
+
+# 全局矢量瓦片存储实例
+tile_store = TileStore()
@@ -33,6 +33,7 @@ class PluginType(str, Enum):
     AMAP = "amap"
     QWEATHER = "qweather"
     GEONAMES = "geonames"
+    ROUTING = "routing"  # 本地路网路径规划
 
 
 class UserMessage(BaseModel):
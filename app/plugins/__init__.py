@@ -1 +1,17 @@
- 
\ No newline at end of file
+"""
+插件模块包
+"""
+
+from .poi_plugin import register_poi_plugin
+from .route_plugin import register_route_plugin
+from .weather_plugin import register_weather_plugin
+
+
+def register_all_plugins():
+    """注册所有内置插件"""
+    register_weather_plugin()
+    register_poi_plugin()
+    register_route_plugin()
+
+
+__all__ = ["register_all_plugins"]
@@ -1,16 +1,35 @@
 """
 POI搜索插件
 """
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional
 from loguru import logger
 
+from app.core.gazetteer import LEVEL_CITY, LEVEL_DISTRICT, LEVEL_LANDMARK, LEVEL_PROVINCE, gazetteer
 from app.core.plugin_manager import BasePlugin
+from app.core.poi_index import SORT_DISTANCE, SORT_RATING, get_poi_index
+from app.core.resilience import PluginInputError
 from app.models.message import PluginType
 
+DEFAULT_LIMIT = 10
+# 未指定半径时按地点的行政级别确定搜索半径（米）
+DEFAULT_RADIUS = 3000.0
+SEARCH_RADIUS = {
+    LEVEL_PROVINCE: 50000.0,
+    LEVEL_CITY: 20000.0,
+    LEVEL_DISTRICT: 5000.0,
+    LEVEL_LANDMARK: 2000.0,
+}
+
 
 class POIPlugin(BasePlugin):
     """POI搜索插件"""
     
+    # POI列表按天变化
+    cache_ttl = 86400.0
+    cache_stale_ttl = 3600.0
+    # 查询类接口，可安全重试；本地索引在事件循环中同步检索，不对冲
+    idempotent = True
+    
     def __init__(self):
         super().__init__(
             name="POI搜索",
@@ -22,38 +41,57 @@ class POIPlugin(BasePlugin):
         required_params = ["location", "keyword"]
         return all(param in parameters for param in required_params)
     
+    def cache_key(self, parameters: Dict[str, Any]) -> Optional[Hashable]:
+        """按地点、关键词和查询条件缓存"""
+        return (
+            str(parameters["location"]).strip(),
+            str(parameters["keyword"]).strip(),
+            parameters.get("longitude"),
+            parameters.get("latitude"),
+            parameters.get("radius"),
+            parameters.get("limit"),
+            parameters.get("sort")
+        )
+    
     async def execute(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
-        """执行POI搜索"""
+        """执行POI搜索
+        
+        中心点优先使用参数中的经纬度（如"附近"查询时的用户位置），否则在地名库中解析地点；
+        按距离排序时为k近邻查询，按评分排序时为半径查询。
+        """
         try:
             location = parameters["location"]
             keyword = parameters["keyword"]
+            limit = int(parameters.get("limit") or DEFAULT_LIMIT)
+            sort = parameters.get("sort") or SORT_DISTANCE
+            
+            if parameters.get("longitude") is not None and parameters.get("latitude") is not None:
+                lng, lat = float(parameters["longitude"]), float(parameters["latitude"])
+                radius = DEFAULT_RADIUS
+            else:
+                place = gazetteer.resolve(location)
+                if place is None:
+                    raise PluginInputError(f"无法定位地点: {location}")
+                lng, lat = place.longitude, place.latitude
+                radius = SEARCH_RADIUS.get(place.level, DEFAULT_RADIUS)
+            radius = float(parameters.get("radius") or radius)
+            
+            index = get_poi_index()
+            if sort == SORT_RATING:
+                indices, distances = index.within_radius(lng, lat, radius, keyword, limit, SORT_RATING)
+            else:
+                indices, distances = index.nearest(lng, lat, limit, keyword, max_radius=radius)
             
-            # 模拟POI搜索结果
             poi_data = {
                 "location": location,
                 "keyword": keyword,
-                "results": [
-                    {
-                        "name": f"{keyword}1",
-                        "address": f"{location}某街道1号",
-                        "latitude": 39.9042,
-                        "longitude": 116.4074,
-                        "distance": "500米",
-                        "rating": 4.5
-                    },
-                    {
-                        "name": f"{keyword}2", 
-                        "address": f"{location}某街道2号",
-                        "latitude": 39.9142,
-                        "longitude": 116.4174,
-                        "distance": "1.2公里",
-                        "rating": 4.2
-                    }
-                ],
-                "total_count": 2
+                "center": {"longitude": lng, "latitude": lat},
+                "radius": radius,
+                "results": [index.record(i, d) for i, d in zip(indices, distances)],
+                "total_count": len(indices)
             }
             
-            logger.info(f"POI搜索成功: {location} - {keyword}")
+            logger.info(f"POI搜索成功: {location} - {keyword}, 结果 {len(indices)} 条")
             return poi_data
             
         except Exception as e:
@@ -0,0 +1,115 @@
+"""
+路径规划插件
+"""
+import asyncio
+from typing import Dict, Any, Hashable, Optional, Tuple
+from loguru import logger
+
+from app.config import settings
+from app.core.gazetteer import gazetteer
+from app.core.plugin_manager import BasePlugin
+from app.core.poi_index import format_distance
+from app.core.resilience import PluginInputError
+from app.core.road_graph import format_duration, get_road_graph
+from app.models.message import PluginType
+
+
+class RoutePlugin(BasePlugin):
+    """路径规划插件，在本地路网上计算驾车最短时间路径"""
+
+    # 路网为本地静态数据，结果长期有效
+    cache_ttl = 86400.0
+    # 可安全重试；A*搜索在线程中执行且无法取消，对冲只会重复计算，不对冲
+    idempotent = True
+
+    def __init__(self):
+        super().__init__(
+            name="路径规划",
+            description="计算两地之间的驾车路线、距离和预计用时"
+        )
+
+    def validate_parameters(self, parameters: Dict[str, Any]) -> bool:
+        """验证参数"""
+        required_params = ["start_location", "end_location"]
+        return all(param in parameters for param in required_params)
+
+    def cache_key(self, parameters: Dict[str, Any]) -> Optional[Hashable]:
+        """按起终点缓存"""
+        return (
+            str(parameters["start_location"]).strip(),
+            str(parameters["end_location"]).strip(),
+            parameters.get("start_longitude"),
+            parameters.get("start_latitude"),
+            parameters.get("end_longitude"),
+            parameters.get("end_latitude")
+        )
+
+    async def execute(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """执行路径规划
+
+        起终点优先使用参数中的经纬度，否则在地名库中解析；路网加载和A*搜索为CPU密集操作，在线程中执行。
+        """
+        try:
+            start_location = parameters["start_location"]
+            end_location = parameters["end_location"]
+            start = self._resolve(start_location, parameters.get("start_longitude"), parameters.get("start_latitude"))
+            end = self._resolve(end_location, parameters.get("end_longitude"), parameters.get("end_latitude"))
+
+            route_data = await asyncio.to_thread(self._plan, start, end)
+            route_data.update({
+                "start_location": start_location,
+                "end_location": end_location
+            })
+
+            logger.info(
+                f"路径规划成功: {start_location} -> {end_location}, "
+                f"{route_data['distance']}, {route_data['duration']}"
+            )
+            return route_data
+
+        except Exception as e:
+            logger.error(f"路径规划失败: {str(e)}")
+            raise
+
+    @staticmethod
+    def _resolve(location: str, longitude: Any, latitude: Any) -> Tuple[float, float]:
+        """解析起点或终点坐标"""
+        if longitude is not None and latitude is not None:
+            return float(longitude), float(latitude)
+        place = gazetteer.resolve(str(location))
+        if place is None:
+            raise PluginInputError(f"无法定位地点: {location}")
+        return place.longitude, place.latitude
+
+    @staticmethod
+    def _plan(start: Tuple[float, float], end: Tuple[float, float]) -> Dict[str, Any]:
+        """在路网上吸附起终点并计算路径"""
+        graph = get_road_graph()
+        source, source_gap = graph.nearest_node(*start)
+        target, target_gap = graph.nearest_node(*end)
+        if max(source_gap, target_gap) > settings.road_max_snap_distance:
+            raise PluginInputError(f"起点或终点附近{format_distance(settings.road_max_snap_distance)}内没有道路")
+
+        route = graph.route(source, target)
+        if route is None:
+            raise PluginInputError("起点与终点之间没有可通行的道路")
+
+        lngs = [point[0] for point in route.coordinates]
+        lats = [point[1] for point in route.coordinates]
+        return {
+            "start": {"longitude": start[0], "latitude": start[1]},
+            "end": {"longitude": end[0], "latitude": end[1]},
+            "distance_m": int(route.distance),
+            "distance": format_distance(route.distance),
+            "duration_s": int(route.duration),
+            "duration": format_duration(route.duration),
+            "coordinates": route.coordinates,
+            "bbox": [min(lngs), min(lats), max(lngs), max(lats)]
+        }
+
+
+# 注册插件
+def register_route_plugin():
+    """注册路径规划插件"""
+    from app.core.plugin_manager import plugin_manager
+    plugin_manager.register_plugin(PluginType.ROUTING, RoutePlugin())
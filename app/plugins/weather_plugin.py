@@ -2,10 +2,11 @@
 天气查询插件
 """
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, Optional
 from loguru import logger
 
 from app.core.plugin_manager import BasePlugin
+from app.core.resilience import UpstreamError
 from app.models.message import PluginType
 from app.config import settings
 
@@ -13,26 +14,41 @@ from app.config import settings
 class WeatherPlugin(BasePlugin):
     """天气查询插件"""
     
+    # 天气数据最多几分钟更新一次
+    cache_ttl = 600.0
+    cache_stale_ttl = 300.0
+    # 查询类接口，可安全重试与对冲
+    idempotent = True
+    hedgeable = True
+    
     def __init__(self):
         super().__init__(
             name="天气查询",
             description="查询指定地区的天气信息"
         )
         self.api_key = settings.qweather_api_key
-        self.base_url = "https://devapi.qweather.com/v7"
+        self.base_url = settings.qweather_base_url
     
     def validate_parameters(self, parameters: Dict[str, Any]) -> bool:
         """验证参数"""
         required_params = ["location"]
         return all(param in parameters for param in required_params)
     
+    def cache_key(self, parameters: Dict[str, Any]) -> Optional[Hashable]:
+        """同一地区的天气共享缓存"""
+        return str(parameters["location"]).strip()
+    
     async def execute(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
         """执行天气查询"""
         try:
             location = parameters["location"]
             
-            # 这里使用模拟数据，实际应该调用和风天气API
-            # 由于没有真实的API key，我们返回模拟数据
+            if self.api_key and self.http_client is not None:
+                weather_data = await self._fetch_now(location)
+                logger.info(f"天气查询成功: {location}")
+                return weather_data
+            
+            # 未配置API key时返回模拟数据
             weather_data = {
                 "location": location,
                 "temperature": "25°C",
@@ -49,6 +65,28 @@ class WeatherPlugin(BasePlugin):
         except Exception as e:
             logger.error(f"天气查询失败: {str(e)}")
             raise
+    
+    async def _fetch_now(self, location: str) -> Dict[str, Any]:
+        """调用和风天气实时天气接口（通过共享连接池）"""
+        response = await self.http_client.get(
+            f"{self.base_url}/weather/now",
+            params={"location": location, "key": self.api_key}
+        )
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get("code") != "200":
+            raise UpstreamError(f"和风天气接口返回错误: {payload.get('code')}")
+        
+        now = payload.get("now", {})
+        return {
+            "location": location,
+            "temperature": f"{now.get('temp')}°C",
+            "weather": now.get("text"),
+            "humidity": f"{now.get('humidity')}%",
+            "wind": f"{now.get('windDir')} {now.get('windScale')}级",
+            "air_quality": None,
+            "update_time": payload.get("updateTime")
+        }
 
 
 # 注册插件
@@ -0,0 +1,82 @@
+"""
+流式片段合并模块 - 将模型输出的细碎片段合并后再发送
+减少WebSocket/SSE帧数与系统调用，同时保持打字机效果
+"""
+import time
+from typing import List, Optional
+
+from app.config import settings
+
+# 遇到这些字符时立即发送，保证句子完整地出现在前端
+FLUSH_PUNCTUATION = frozenset("，。！？；：、…,.!?;:\n")
+
+
+class ChunkCoalescer:
+    """流式片段合并器
+
+    满足以下任一条件时输出合并后的片段：
+    - 首个片段（保证首字延迟不受影响）
+    - 缓冲区字节数达到 max_bytes
+    - 片段以标点结尾（flush_on_punctuation）
+    - 缓冲区中最早的片段已等待 max_delay 秒（由调用方通过 timeout() 驱动）
+    """
+
+    def __init__(
+        self,
+        max_delay: float = None,
+        max_bytes: int = None,
+        flush_on_punctuation: bool = None,
+        enabled: bool = None
+    ):
+        self.max_delay = settings.stream_coalesce_max_delay_ms / 1000 if max_delay is None else max_delay
+        self.max_bytes = settings.stream_coalesce_max_bytes if max_bytes is None else max_bytes
+        self.flush_on_punctuation = (
+            settings.stream_coalesce_flush_on_punctuation
+            if flush_on_punctuation is None else flush_on_punctuation
+        )
+        self.enabled = settings.stream_coalesce_enabled if enabled is None else enabled
+
+        self._parts: List[str] = []
+        self._size = 0
+        self._first_at: Optional[float] = None
+
+        # 统计信息
+        self.chunks_in = 0
+        self.frames_out = 0
+
+    def add(self, text: str) -> Optional[str]:
+        """加入一个片段，触发发送条件时返回合并后的文本"""
+        self.chunks_in += 1
+        if not self.enabled or self.frames_out == 0:
+            self._parts.append(text)
+            return self.flush()
+
+        if not self._parts:
+            self._first_at = time.monotonic()
+        self._parts.append(text)
+        self._size += len(text.encode("utf-8"))
+
+        if (
+            self._size >= self.max_bytes
+            or (self.flush_on_punctuation and text[-1] in FLUSH_PUNCTUATION)
+            or time.monotonic() - self._first_at >= self.max_delay
+        ):
+            return self.flush()
+        return None
+
+    def timeout(self) -> Optional[float]:
+        """距离按时间发送还剩多少秒，缓冲区为空时返回None"""
+        if not self._parts:
+            return None
+        return max(0.0, self._first_at + self.max_delay - time.monotonic())
+
+    def flush(self) -> Optional[str]:
+        """输出缓冲区中的全部文本"""
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        self._first_at = None
+        self.frames_out += 1
+        return text
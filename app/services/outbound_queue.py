@@ -0,0 +1,194 @@
+"""
+WebSocket出站队列模块 - 每个连接一个有界发送队列和独立的写任务
+慢速客户端不再拖住上游模型流，也不会无限占用内存
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from fastapi import WebSocket
+from loguru import logger
+
+from app.config import settings
+from app.utils.wire_format import WireCodec
+
+
+# 慢消费者处理策略
+POLICY_MERGE = "merge"            # 队列满时把文本片段合并进同一消息的上一个片段
+POLICY_PAUSE = "pause"            # 队列满时暂停生产者，从而暂停读取上游模型流
+POLICY_DISCONNECT = "disconnect"  # 队列满时断开慢速客户端
+
+
+class OutboundQueueClosed(Exception):
+    """出站队列已关闭（连接已断开）"""
+
+
+class SlowConsumerError(OutboundQueueClosed):
+    """客户端消费过慢，连接被断开"""
+
+
+class OutboundQueue:
+    """单个WebSocket连接的有界出站队列"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        connection_id: str,
+        max_size: int = None,
+        policy: str = None,
+        pause_timeout: float = None,
+        codec: WireCodec = None
+    ):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.codec = codec or WireCodec()
+        self.max_size = max_size or settings.ws_send_queue_size
+        self.policy = policy or settings.ws_slow_consumer_policy
+        self.pause_timeout = settings.ws_backpressure_timeout if pause_timeout is None else pause_timeout
+
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._writer: Optional[asyncio.Task] = None
+        self._sending = False
+        self.closed = False
+
+        # 统计信息
+        self.sent = 0
+        self.merged = 0
+        self.overflowed = 0
+        self.pauses = 0
+        self.paused_seconds = 0.0
+        self.max_depth = 0
+        self.slow_consumer_disconnects = 0
+
+    @property
+    def depth(self) -> int:
+        """当前队列深度"""
+        return len(self._queue)
+
+    def start(self):
+        """启动写任务"""
+        self._writer = asyncio.create_task(self._run())
+
+    async def put(self, message: Dict[str, Any]):
+        """消息入队，队列满时按策略处理"""
+        if self.closed:
+            raise OutboundQueueClosed(f"连接已关闭: {self.connection_id}")
+
+        if len(self._queue) >= self.max_size:
+            if self.policy == POLICY_PAUSE:
+                await self._wait_not_full()
+            elif self.policy == POLICY_DISCONNECT:
+                await self._disconnect_slow_consumer()
+            elif self._merge(message):
+                return
+            else:
+                # 无法合并的消息（控制消息或新消息的首个片段）不能丢弃，允许超出上限
+                self.overflowed += 1
+
+        self._queue.append(message)
+        self.max_depth = max(self.max_depth, len(self._queue))
+        self._not_empty.set()
+        if len(self._queue) >= self.max_size:
+            self._not_full.clear()
+
+    def _merge(self, message: Dict[str, Any]) -> bool:
+        """把文本片段合并进同一消息在队列中的最后一个片段
+
+        只有当该消息在队列中的最后一项恰好是文本片段时才合并，保证单条消息内的事件顺序。
+        """
+        if message.get("type") != "stream_chunk":
+            return False
+        message_id = message.get("message_id")
+        for queued in reversed(self._queue):
+            if queued.get("message_id") != message_id:
+                continue
+            if queued.get("type") != "stream_chunk":
+                return False
+            queued["chunk"] += message["chunk"]
+            if "seq" in message:
+                # 合并后的片段以最后一个片段的序号发送，客户端据此恢复
+                queued["seq"] = message["seq"]
+            self.merged += 1
+            return True
+        return False
+
+    async def _wait_not_full(self):
+        """暂停生产者直到队列有空位，超时则断开连接"""
+        self.pauses += 1
+        paused_at = time.monotonic()
+        try:
+            await asyncio.wait_for(self._not_full.wait(), timeout=self.pause_timeout)
+        except asyncio.TimeoutError:
+            await self._disconnect_slow_consumer()
+        finally:
+            self.paused_seconds += time.monotonic() - paused_at
+        if self.closed:
+            raise OutboundQueueClosed(f"连接已关闭: {self.connection_id}")
+
+    async def _disconnect_slow_consumer(self):
+        """断开慢速客户端"""
+        logger.warning(f"WebSocket客户端消费过慢，断开连接: {self.connection_id}, 队列深度: {self.depth}")
+        self.slow_consumer_disconnects += 1
+        await self.close(drain=False)
+        try:
+            await self.websocket.close(code=1013, reason="slow consumer")
+        except Exception:
+            pass
+        raise SlowConsumerError(f"客户端消费过慢: {self.connection_id}")
+
+    async def _run(self):
+        """写任务：按顺序发送队列中的消息"""
+        try:
+            while True:
+                await self._not_empty.wait()
+                while self._queue:
+                    message = self._queue.popleft()
+                    if len(self._queue) < self.max_size:
+                        self._not_full.set()
+                    self._sending = True
+                    await self.codec.send(self.websocket, message)
+                    self._sending = False
+                    self.sent += 1
+                self._not_empty.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"发送消息失败: {str(e)}")
+        finally:
+            self._mark_closed()
+
+    def _mark_closed(self):
+        """标记关闭并唤醒所有等待中的生产者"""
+        self.closed = True
+        self._queue.clear()
+        self._not_full.set()
+
+    async def close(self, drain: bool = True, timeout: float = 5.0):
+        """关闭队列，drain为True时先尽量发送完剩余消息"""
+        if drain and self._writer and not self._writer.done():
+            deadline = time.monotonic() + timeout
+            while (self._queue or self._sending) and not self._writer.done() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+        self._mark_closed()
+        if self._writer and not self._writer.done() and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+            try:
+                await self._writer
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计"""
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "sent": self.sent,
+            "merged": self.merged,
+            "overflowed": self.overflowed,
+            "pauses": self.pauses,
+            "paused_seconds": round(self.paused_seconds, 3),
+            "slow_consumer_disconnects": self.slow_consumer_disconnects,
+        }
@@ -0,0 +1,260 @@
+"""
+可恢复流模块 - 对话流与传输连接解耦
+每条进行中的消息由独立任务读取对话流，事件带序号写入有界环形缓冲区；
+客户端断线重连后从最后收到的序号继续接收，不重新请求上游模型
+"""
+import asyncio
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Deque, Dict, Optional, Tuple
+
+from loguru import logger
+
+from app.config import settings
+from app.services.stream_chat_service import stream_chat_service
+from app.utils.cache import TTLCache
+from app.utils.event_encoding import TERMINAL_TYPES
+
+
+class ResumeGapError(Exception):
+    """请求恢复的位置已不在缓冲区中"""
+
+
+class ResumableStream:
+    """单条消息的事件缓冲区与订阅者管理
+
+    - 事件序号从1开始连续递增，缓冲区保留最近 capacity 个事件
+    - 生产者领先已投递位置达到 capacity 时暂停读取上游，保证未投递的事件不会被覆盖，
+      WebSocket的pause背压策略因此仍能传导到上游
+    - 最后一个订阅者断开后开始计时，宽限期内没有订阅者恢复则中止上游请求
+    - 生产者任务结束时（包括尚未开始执行就被取消）总会写入最后一个事件、标记结束并通知订阅者
+    """
+
+    def __init__(self, message_id: str, session_id: str, capacity: int = None, grace: float = None):
+        self.message_id = message_id
+        self.session_id = session_id
+        self.capacity = capacity or settings.stream_replay_buffer_size
+        self.grace = settings.stream_resume_grace if grace is None else grace
+
+        self.buffer: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=self.capacity)
+        self.seq = 0
+        self.delivered = 0
+        self.finished = False
+        self.subscribers = 0
+
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._producer: Optional[asyncio.Task] = None
+        self._stream: Optional[AsyncGenerator[Dict[str, Any], None]] = None
+        self._on_finished: Optional[Callable[["ResumableStream"], None]] = None
+        self._grace_timer: Optional[asyncio.TimerHandle] = None
+        self.expired = False
+
+    def start(
+        self,
+        stream: AsyncGenerator[Dict[str, Any], None],
+        on_finished: Callable[["ResumableStream"], None] = None
+    ):
+        """启动读取对话流的生产者任务，on_finished 在任务结束后调用"""
+        self._stream = stream
+        self._on_finished = on_finished
+        self._producer = asyncio.create_task(self._produce(stream))
+        self._producer.add_done_callback(self._producer_done)
+
+    def _producer_done(self, task: asyncio.Task):
+        """生产者任务结束后的收尾
+
+        任务在第一次执行前被取消时 _produce 的函数体不会运行，其中的 except 和 finally 都不会执行，
+        这里补写 stream_cancelled、标记结束并关闭对话流，避免订阅者一直等待。
+        """
+        if not self.finished:
+            last = self.buffer[-1][1] if self.buffer else None
+            if task.cancelled() and (last is None or last.get("type") not in TERMINAL_TYPES):
+                self._append({
+                    "type": "stream_cancelled",
+                    "message_id": self.message_id,
+                    "session_id": self.session_id
+                })
+            self.finished = True
+            self._cancel_grace_timer()
+            self._notify()
+            asyncio.get_running_loop().create_task(self._stream.aclose())
+        if self._on_finished is not None:
+            self._on_finished(self)
+
+    async def _produce(self, stream: AsyncGenerator[Dict[str, Any], None]):
+        try:
+            async for event in stream:
+                while self.seq - self.delivered >= self.capacity:
+                    self._drained.clear()
+                    await self._drained.wait()
+                self._append(event)
+                if event.get("type") in TERMINAL_TYPES:
+                    break
+        except asyncio.CancelledError:
+            # 先关闭对话流以立即中止上游模型请求，再通知订阅者
+            await stream.aclose()
+            self._append({
+                "type": "stream_cancelled",
+                "message_id": self.message_id,
+                "session_id": self.session_id
+            })
+        except Exception as e:
+            logger.error(f"流式对话读取失败: {str(e)}")
+            self._append({
+                "type": "error",
+                "message_id": self.message_id,
+                "error": f"聊天服务出错: {str(e)}",
+                "session_id": self.session_id
+            })
+        finally:
+            await stream.aclose()
+            self.finished = True
+            self._cancel_grace_timer()
+            self._notify()
+
+    def _append(self, event: Dict[str, Any]):
+        self.seq += 1
+        self.buffer.append((self.seq, event))
+        self._notify()
+
+    def _notify(self):
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    def cancel(self) -> bool:
+        """取消进行中的对话，订阅者随后收到 stream_cancelled"""
+        if self.finished or self._producer is None:
+            return False
+        self._producer.cancel()
+        return True
+
+    async def events(self, last_seq: int = 0) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        """从序号 last_seq 之后开始产出 (序号, 事件)，直到最后一个事件
+
+        缓冲区已不包含 last_seq 之后的第一个事件时抛出 ResumeGapError。
+        """
+        self._attach()
+        try:
+            while True:
+                wakeup = self._wakeup
+                first = self.buffer[0][0] if self.buffer else self.seq + 1
+                if last_seq + 1 < first:
+                    raise ResumeGapError(f"缓冲区最早的事件序号为 {first}，无法从 {last_seq} 之后恢复")
+                if last_seq < self.seq:
+                    seq, event = self.buffer[last_seq + 1 - first]
+                    yield seq, event
+                    last_seq = seq
+                    if seq > self.delivered:
+                        self.delivered = seq
+                        self._drained.set()
+                    continue
+                if self.finished:
+                    return
+                await wakeup.wait()
+        finally:
+            self._detach()
+
+    def _attach(self):
+        self.subscribers += 1
+        self._cancel_grace_timer()
+
+    def _detach(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.finished:
+            self._grace_timer = asyncio.get_running_loop().call_later(self.grace, self._expire)
+
+    def _cancel_grace_timer(self):
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+
+    def _expire(self):
+        self._grace_timer = None
+        if self.subscribers == 0 and not self.finished:
+            logger.info(f"宽限期内客户端未恢复，中止流式对话: {self.message_id}")
+            self.expired = True
+            self.cancel()
+
+
+class StreamRegistry:
+    """进行中与刚结束的消息，按 message_id 查找以恢复
+
+    缓冲区在消息开始和结束时各写入一次有效期，结束后保留 STREAM_REPLAY_TTL 秒供断线的客户端补齐。
+    """
+
+    def __init__(self):
+        self.streams = TTLCache(settings.stream_replay_capacity, settings.stream_replay_ttl)
+        self.started = 0
+        self.in_flight = 0
+        self.resumed = 0
+        self.expired = 0
+        self.gaps = 0
+
+    def start(self, message: str, session_id: str, message_id: str, bypass_cache: bool = False) -> ResumableStream:
+        """开始一条消息，对话流在后台读取"""
+        stream = ResumableStream(message_id, session_id)
+        stream.start(self._run(stream, message, bypass_cache), self._finished)
+        self.streams.set(message_id, stream)
+        self.started += 1
+        self.in_flight += 1
+        return stream
+
+    async def _run(self, stream: ResumableStream, message: str, bypass_cache: bool):
+        chat_stream = stream_chat_service.stream_chat(message, stream.session_id, stream.message_id, bypass_cache)
+        try:
+            async for event in chat_stream:
+                yield event
+        finally:
+            await chat_stream.aclose()
+
+    def _finished(self, stream: ResumableStream):
+        """生产者任务结束（包括开始前被取消）后更新统计"""
+        self.in_flight -= 1
+        if stream.expired:
+            self.expired += 1
+        # 结束后重新计算有效期
+        self.streams.set(stream.message_id, stream)
+
+    def get(self, message_id: str, session_id: Optional[str] = None) -> Optional[ResumableStream]:
+        """按 message_id 查找，指定 session_id 时必须一致"""
+        stream = self.streams.get(message_id)
+        if stream is None or (session_id and stream.session_id != session_id):
+            return None
+        return stream
+
+    def is_running(self, message_id: str) -> bool:
+        stream = self.streams.get(message_id)
+        return stream is not None and not stream.finished
+
+    async def subscribe(
+        self,
+        stream: ResumableStream,
+        last_seq: int = 0
+    ) -> AsyncGenerator[Tuple[int, Dict[str, Any]], None]:
+        """订阅事件并统计恢复与缺口，调用方提前结束迭代时应关闭生成器以及时释放订阅"""
+        if last_seq > 0:
+            self.resumed += 1
+            logger.info(f"恢复流式对话: {stream.message_id}, 从序号 {last_seq} 之后继续")
+        events = stream.events(last_seq)
+        try:
+            async for item in events:
+                yield item
+        except ResumeGapError:
+            self.gaps += 1
+            raise
+        finally:
+            await events.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "in_flight": self.in_flight,
+            "resumed": self.resumed,
+            "expired": self.expired,
+            "gaps": self.gaps,
+            "buffers": self.streams.stats()
+        }
+
+
+# 全局可恢复流注册表
+stream_registry = StreamRegistry()
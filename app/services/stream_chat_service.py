@@ -2,14 +2,35 @@
 流式聊天服务 - 支持实时流式输出和意图解析
 使用阿里云百炼API进行自然语言对话
 """
+import asyncio
 import json
+import time
 import uuid
-import os
-from typing import AsyncGenerator, Dict, Any
-from openai import OpenAI
+from typing import AsyncGenerator, Dict, Any, List, Optional
 from loguru import logger
 
 from app.config import settings
+from app.core.answer_cache import answer_cache
+from app.core.clustering import cluster_store
+from app.core.gazetteer import gazetteer
+from app.core.intent_cache import intent_cache, prompt_namespace
+from app.core.intent_classifier import intent_classifier
+from app.core.llm_provider import llm_provider
+from app.core.plugin_manager import plugin_manager
+from app.core.poi_index import SORT_RATING
+from app.core.session_memory import session_memory
+from app.core.tiles import ClusterTileLayer, TileLayer, tile_store
+from app.services.chunk_coalescer import ChunkCoalescer
+from app.models.message import IntentType, MapAction, PluginRequest, PluginType
+from app.utils.geometry import encode_polyline, simplify, zoom_for_bbox
+from app.utils.tokenizer import estimate_tokens
+
+# 需要地图飞行到指定地点的意图
+FLY_TO_INTENTS = {IntentType.MAP_FLY_TO.value, IntentType.LOCATION_SEARCH.value}
+# 需要在地图上聚合显示POI的意图
+CLUSTER_INTENTS = {IntentType.POI_SEARCH.value}
+# 需要在地图上显示路线的意图
+ROUTE_INTENTS = {IntentType.ROUTE_PLANNING.value}
 
 
 class StreamChatService:
@@ -19,11 +40,16 @@ class StreamChatService:
         if not settings.dashscope_api_key:
             raise ValueError("阿里云百炼API Key未配置")
         
-        self.client = OpenAI(
-            api_key=settings.dashscope_api_key,
-            base_url=settings.dashscope_base_url
-        )
-        self.model = settings.dashscope_model
+        self.provider = llm_provider
+        self.model = self.provider.model
+        self.max_tokens = 1000
+        
+        # 客户端断开或取消导致的上游流中止统计
+        self.aborted_streams = 0
+        self.tokens_saved = 0
+        
+        # 后台生成会话摘要的任务
+        self._summary_tasks = set()
         logger.info(f"初始化流式聊天服务，使用阿里云百炼模型: {self.model}")
         
         # 预定义示例响应（用于few-shot提示）
@@ -102,26 +128,23 @@ A：{example3_response}
 
 Q：飞到上海
 A：{example4_response}"""
+        # 意图缓存按提示词划分命名空间，不与AIEngine（提示词不同）共享解析结果
+        self.intent_cache_namespace = prompt_namespace("stream", self.intent_system_prompt)
     
     async def parse_intent(self, user_input: str) -> Dict[str, Any]:
         """解析用户意图"""
         try:
             logger.info(f"开始解析用户意图: {user_input}")
             
-            # 调用AI模型进行意图解析
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": self.intent_system_prompt},
-                    {"role": "user", "content": user_input}
-                ],
-                temperature=0.1,
-                max_tokens=500,
-                response_format={"type": "json_object"}
-            )
+            # 优先使用本地规则快速路径
+            fast_result = intent_classifier.classify(user_input)
+            if fast_result:
+                return fast_result.model_dump(mode="json", include={"intent", "confidence", "parameters"})
             
-            # 解析响应
-            intent_data = json.loads(response.choices[0].message.content)
+            # 相同查询命中缓存，未命中时调用AI模型进行意图解析
+            intent_data = await intent_cache.get_or_load(
+                user_input, self._call_intent_model, self.intent_cache_namespace
+            )
             
             logger.info(f"意图解析成功: {intent_data.get('intent', 'unknown')}, 置信度: {intent_data.get('confidence', 0.0)}, 参数: {intent_data.get('parameters', {})}")
             return intent_data
@@ -135,12 +158,62 @@ A：{example4_response}"""
                 "error": str(e)
             }
     
-    async def stream_chat(self, message: str, session_id: str = None) -> AsyncGenerator[Dict[str, Any], None]:
-        """流式聊天接口"""
+    async def _call_intent_model(self, user_input: str) -> Dict[str, Any]:
+        """调用AI模型进行意图解析"""
+        content = await self.provider.complete(
+            messages=[
+                {"role": "system", "content": self.intent_system_prompt},
+                {"role": "user", "content": user_input}
+            ],
+            temperature=0.1,
+            max_tokens=500,
+            response_format={"type": "json_object"}
+        )
+        # 非法的意图类型或参数格式直接抛出，由 parse_intent 返回未知意图，不写入缓存
+        intent_data = json.loads(content)
+        intent_data["intent"] = IntentType(intent_data.get("intent", "unknown")).value
+        if not isinstance(intent_data.get("parameters", {}), dict):
+            raise ValueError(f"意图参数格式错误: {intent_data.get('parameters')}")
+        return intent_data
+    
+    async def stream_chat(
+        self,
+        message: str,
+        session_id: str = None,
+        message_id: str = None,
+        bypass_cache: bool = False
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式聊天接口
+
+        意图解析与对话流同时发起，首个文本片段不再等待意图解析完成。
+        事件顺序保证：
+        - stream_start 总是第一个事件
+        - stream_chunk 按上游顺序输出
+        - intent_parsed 在解析完成时立即输出，且恰好一次，总在 stream_end 之前
+        - 地图飞行类意图的地点在本地地名库中解析成功时，紧随 intent_parsed 输出 map_action
+        - POI搜索意图在后台执行搜索并构建聚合索引，完成后输出 show_clusters 类型的 map_action，总在 stream_end 之前
+        - 路径规划意图在后台计算路线，完成后输出 show_route 类型的 map_action，总在 stream_end 之前
+        - stream_end（携带各阶段耗时 timings）或 error 总是最后一个事件
+        
+        同一会话的历史对话按token预算加入提示词，正常结束的回答在 stream_end 之前写入会话记忆。
+        与上下文无关的问题的回答写入回答缓存，相同问题在相同上下文中再次出现时按同样的事件顺序
+        重放缓存的回答（stream_end 带 cached 标记），不请求上游模型；bypass_cache 为True时跳过缓存查找。
+        调用方取消迭代任务或关闭生成器时，上游模型请求会被立即中止。
+        """
         if not session_id:
             session_id = str(uuid.uuid4())
         
-        message_id = str(uuid.uuid4())
+        if not message_id:
+            message_id = str(uuid.uuid4())
+        started_at = time.perf_counter()
+        timings: Dict[str, float] = {}
+        intent_task = None
+        plugin_task = None
+        next_chunk = None
+        stream = None
+        finished = False
+        generated_tokens = 0
+        answer_parts = []
         
         try:
             # 发送流式开始消息
@@ -150,16 +223,25 @@ A：{example4_response}"""
                 "session_id": session_id
             }
             
-            # 首先进行意图解析
-            intent_result = await self.parse_intent(message)
+            history = self._history(session_id)
+            cached = answer_cache.get(message, history, bypass=bypass_cache)
+            if cached is not None:
+                logger.info(f"回答缓存命中，重放缓存的回答: {message[:50]}")
+                async for event in self._replay_answer(message_id, session_id, cached, started_at, timings):
+                    yield event
+                self._remember(session_id, message, cached["answer"])
+                finished = True
+                yield {
+                    "type": "stream_end",
+                    "message_id": message_id,
+                    "session_id": session_id,
+                    "timings": timings,
+                    "cached": True
+                }
+                return
             
-            # 发送意图解析结果
-            yield {
-                "type": "intent_parsed",
-                "message_id": message_id,
-                "intent": intent_result,
-                "session_id": session_id
-            }
+            # 意图解析在后台并发执行
+            intent_task = asyncio.create_task(self._timed_parse_intent(message, started_at, timings))
             
             # 构建对话消息
             messages = [
@@ -174,6 +256,7 @@ A：{example4_response}"""
 请用友好、专业的语气回答用户问题。如果用户询问地理相关信息，请提供准确、有用的回答。
 如果涉及天气或POI查询，请说明你可以通过插件获取实时数据。"""
                 },
+                *history,
                 {
                     "role": "user",
                     "content": message
@@ -183,35 +266,76 @@ A：{example4_response}"""
             logger.info(f"开始流式对话，消息: {message[:50]}...")
             
             # 调用阿里云百炼API
-            stream = self.client.chat.completions.create(
-                model=self.model,
+            stream = self.provider.stream(
                 messages=messages,
-                stream=True,
                 temperature=0.7,
-                max_tokens=1000
+                max_tokens=self.max_tokens
             )
             
-            # 处理流式响应 - 使用同步迭代器但返回异步生成器
-            chunk_count = 0
+            # 同时等待意图解析结果和下一个文本片段，谁先完成先输出谁；
+            # 文本片段经合并器按时间、大小和标点规则合并后发送
+            coalescer = ChunkCoalescer()
+            intent_emitted = False
+            next_chunk = asyncio.ensure_future(stream.__anext__())
+            pending = {intent_task, next_chunk}
             try:
-                for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        chunk_count += 1
+                while True:
+                    done, _ = await asyncio.wait(
+                        pending,
+                        timeout=coalescer.timeout(),
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                    
+                    # 等待超时：缓冲区中的片段已到最大延迟
+                    if not done:
+                        yield self._chunk_event(message_id, session_id, coalescer.flush())
+                        continue
+                    
+                    if intent_task in done and not intent_emitted:
+                        intent_emitted = True
+                        pending.discard(intent_task)
+                        yield self._intent_event(message_id, session_id, intent_task.result())
+                        map_action = self._map_action_event(message_id, session_id, intent_task.result())
+                        if map_action:
+                            yield map_action
+                        plugin_task = self._start_plugin_task(message_id, session_id, intent_task.result())
+                        if plugin_task:
+                            pending.add(plugin_task)
+                    
+                    if plugin_task in done:
+                        pending.discard(plugin_task)
+                        plugin_action = plugin_task.result()
+                        plugin_task = None
+                        if plugin_action:
+                            yield plugin_action
+                    
+                    if next_chunk in done:
+                        pending.discard(next_chunk)
+                        try:
+                            content = next_chunk.result()
+                        except StopAsyncIteration:
+                            break
+                        
+                        if coalescer.chunks_in == 0:
+                            timings["first_chunk_ms"] = self._elapsed_ms(started_at)
+                        generated_tokens += estimate_tokens(content)
+                        answer_parts.append(content)
                         
-                        # 发送每个字符片段
-                        yield {
-                            "type": "stream_chunk",
-                            "message_id": message_id,
-                            "chunk": content,
-                            "session_id": session_id
-                        }
-                        # 添加小延迟确保流式效果
-                        import asyncio
-                        await asyncio.sleep(0.01)
+                        merged = coalescer.add(content)
+                        if merged:
+                            yield self._chunk_event(message_id, session_id, merged)
                         
+                        next_chunk = asyncio.ensure_future(stream.__anext__())
+                        pending.add(next_chunk)
+                
+                # 发送缓冲区中剩余的片段
+                remaining = coalescer.flush()
+                if remaining:
+                    yield self._chunk_event(message_id, session_id, remaining)
+                
             except Exception as e:
                 logger.error(f"流式处理失败: {str(e)}")
+                finished = True
                 yield {
                     "type": "error",
                     "message_id": message_id,
@@ -220,23 +344,310 @@ A：{example4_response}"""
                 }
                 return
             
-            logger.info(f"流式对话完成，处理了 {chunk_count} 个字符片段")
+            timings["stream_ms"] = self._elapsed_ms(started_at)
+            
+            # 对话流先结束时，仍需等待意图解析结果，保证其在 stream_end 之前
+            if not intent_emitted:
+                intent_result = await intent_task
+                yield self._intent_event(message_id, session_id, intent_result)
+                map_action = self._map_action_event(message_id, session_id, intent_result)
+                if map_action:
+                    yield map_action
+                plugin_task = self._start_plugin_task(message_id, session_id, intent_result)
+            
+            # POI聚合、路线等插件结果同样在 stream_end 之前输出
+            if plugin_task is not None:
+                plugin_action = await plugin_task
+                plugin_task = None
+                if plugin_action:
+                    yield plugin_action
+            
+            timings["total_ms"] = self._elapsed_ms(started_at)
+            logger.info(
+                f"流式对话完成，处理了 {coalescer.chunks_in} 个字符片段，"
+                f"合并为 {coalescer.frames_out} 帧，耗时: {timings}"
+            )
+            
+            answer = "".join(answer_parts)
+            answer_cache.set(message, history, answer, intent_task.result())
+            self._remember(session_id, message, answer)
             
             # 发送流式结束消息
+            finished = True
             yield {
                 "type": "stream_end",
                 "message_id": message_id,
-                "session_id": session_id
+                "session_id": session_id,
+                "timings": timings
             }
             
         except Exception as e:
             logger.error(f"流式聊天失败: {str(e)}")
+            finished = True
             yield {
                 "type": "error",
                 "message_id": message_id,
                 "error": f"聊天服务出错: {str(e)}",
                 "session_id": session_id
             }
+        finally:
+            # 清理在独立任务中执行：调用方所在任务可能处于持续取消状态（如Starlette断开检测），
+            # 直接await会被反复打断，导致上游连接无法及时关闭
+            cleanup = asyncio.ensure_future(self._cleanup_stream(stream, next_chunk, intent_task, plugin_task))
+            try:
+                await asyncio.shield(cleanup)
+            except asyncio.CancelledError:
+                pass
+            # 上游流已开始但未正常结束，说明客户端断开或取消了对话
+            if next_chunk is not None and not finished:
+                self._record_abort(message_id, generated_tokens)
+    
+    def _record_abort(self, message_id: str, generated_tokens: int):
+        """记录上游流中止，按max_tokens估算节省的token数"""
+        saved = max(0, self.max_tokens - generated_tokens)
+        self.aborted_streams += 1
+        self.tokens_saved += saved
+        logger.info(
+            f"上游流已中止: {message_id}, 已生成约 {generated_tokens} tokens, 节省约 {saved} tokens; "
+            f"累计中止 {self.aborted_streams} 次, 累计节省约 {self.tokens_saved} tokens"
+        )
+    
+    async def _replay_answer(
+        self,
+        message_id: str,
+        session_id: str,
+        cached: Dict[str, Any],
+        started_at: float,
+        timings: Dict[str, float]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """按配置的节奏把缓存的回答切分为文本片段输出"""
+        timings["intent_ms"] = self._elapsed_ms(started_at)
+        yield self._intent_event(message_id, session_id, cached["intent"])
+        
+        answer = cached["answer"]
+        size = settings.answer_cache_replay_chunk_chars or len(answer)
+        interval = settings.answer_cache_replay_interval_ms / 1000
+        for position in range(0, len(answer), size):
+            if position == 0:
+                timings["first_chunk_ms"] = self._elapsed_ms(started_at)
+            elif interval > 0:
+                await asyncio.sleep(interval)
+            yield self._chunk_event(message_id, session_id, answer[position:position + size])
+        timings["stream_ms"] = timings["total_ms"] = self._elapsed_ms(started_at)
+    
+    @staticmethod
+    def _history(session_id: str) -> List[Dict[str, str]]:
+        """会话的历史对话消息"""
+        if not settings.session_memory_enabled:
+            return []
+        return session_memory.context(session_id)
+    
+    def _remember(self, session_id: str, message: str, answer: str):
+        """写入会话记忆，有早期轮次需要折叠时在后台生成摘要"""
+        if not settings.session_memory_enabled:
+            return
+        if session_memory.record(session_id, message, answer):
+            task = asyncio.create_task(self._summarize(session_id))
+            self._summary_tasks.add(task)
+            task.add_done_callback(self._summary_tasks.discard)
+    
+    async def _summarize(self, session_id: str):
+        """把移出上下文窗口的轮次与原摘要合并为新的滚动摘要"""
+        while True:
+            job = session_memory.take_pending(session_id)
+            if job is None:
+                return
+            dialogue = "\n".join(
+                f"用户：{turn['user']}\n助手：{turn['assistant']}" for turn in job["turns"]
+            )
+            summary = None
+            try:
+                summary = await self.provider.complete(
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "请把已有摘要和新增的对话合并为一段简洁的中文摘要，保留地点、时间、"
+                                       "用户偏好等后续对话可能用到的信息，不超过"
+                                       f"{settings.session_memory_summary_tokens}字，只输出摘要内容。"
+                        },
+                        {"role": "user", "content": f"已有摘要：{job['summary'] or '无'}\n\n新增对话：\n{dialogue}"}
+                    ],
+                    temperature=0.1,
+                    max_tokens=settings.session_memory_summary_tokens
+                )
+            except Exception as e:
+                logger.warning(f"会话摘要生成失败，丢弃 {len(job['turns'])} 轮早期对话: {str(e)}")
+            finally:
+                # 任务被取消（如应用关闭）时也要清除生成中标记，否则该会话不再生成摘要
+                session_memory.set_summary(session_id, summary, len(job["turns"]))
+    
+    def stats(self) -> Dict[str, Any]:
+        """流式对话统计"""
+        return {
+            "aborted_streams": self.aborted_streams,
+            "tokens_saved": self.tokens_saved
+        }
+    
+    async def _timed_parse_intent(self, message: str, started_at: float, timings: Dict[str, float]) -> Dict[str, Any]:
+        """解析意图并记录耗时"""
+        intent_result = await self.parse_intent(message)
+        timings["intent_ms"] = self._elapsed_ms(started_at)
+        return intent_result
+    
+    @staticmethod
+    def _chunk_event(message_id: str, session_id: str, chunk: str) -> Dict[str, Any]:
+        """构建文本片段消息"""
+        return {
+            "type": "stream_chunk",
+            "message_id": message_id,
+            "chunk": chunk,
+            "session_id": session_id
+        }
+    
+    @staticmethod
+    def _intent_event(message_id: str, session_id: str, intent_result: Dict[str, Any]) -> Dict[str, Any]:
+        """构建意图解析结果消息"""
+        return {
+            "type": "intent_parsed",
+            "message_id": message_id,
+            "intent": intent_result,
+            "session_id": session_id
+        }
+    
+    @staticmethod
+    def _map_action_event(message_id: str, session_id: str, intent_result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """地图飞行类意图在本地地名库中解析坐标，构建地图飞行指令消息"""
+        if intent_result.get("intent") not in FLY_TO_INTENTS:
+            return None
+        location = (intent_result.get("parameters") or {}).get("location")
+        place = gazetteer.resolve(location) if location else None
+        if place is None:
+            return None
+        
+        action = gazetteer.fly_to_action(place, session_id).model_dump(mode="json")
+        action["message_id"] = message_id
+        return action
+    
+    def _start_plugin_task(
+        self,
+        message_id: str,
+        session_id: str,
+        intent_result: Dict[str, Any]
+    ) -> Optional[asyncio.Task]:
+        """需要插件数据的意图在后台执行插件，结果转换为地图指令消息"""
+        intent = intent_result.get("intent")
+        parameters = intent_result.get("parameters") or {}
+        if intent in CLUSTER_INTENTS and parameters.get("location") and parameters.get("keyword"):
+            return asyncio.create_task(self._cluster_action_event(message_id, session_id, parameters))
+        if intent in ROUTE_INTENTS and parameters.get("start_location") and parameters.get("end_location"):
+            return asyncio.create_task(self._route_action_event(message_id, session_id, parameters))
+        return None
+    
+    @staticmethod
+    async def _cluster_action_event(
+        message_id: str,
+        session_id: str,
+        parameters: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """执行POI搜索，构建初始视口的聚合显示指令消息
+        
+        按评分排序做半径查询，取回范围内的全部POI用于聚合；聚合索引按结果集缓存，
+        客户端平移缩放时通过 /api/map/clusters 按 result_id 查询，无需重新搜索；
+        同时登记为会话的 poi 矢量瓦片图层，结果较多时前端可改为只加载视口内的瓦片。
+        """
+        try:
+            poi_parameters = {
+                "location": parameters["location"],
+                "keyword": parameters["keyword"],
+                "limit": settings.poi_cluster_limit,
+                "sort": SORT_RATING
+            }
+            result = await plugin_manager.execute_plugin(
+                PluginRequest(plugin=PluginType.BAIDU_MAP, parameters=poi_parameters, session_id=session_id)
+            )
+            if not result.success or not result.data:
+                logger.info(f"POI搜索未返回结果，跳过聚合: {result.error}")
+                return None
+            
+            # 构建聚合层级是CPU密集操作，放到线程中执行，避免阻塞事件循环
+            result_id = await asyncio.to_thread(cluster_store.build, poi_parameters, result.data)
+            action = cluster_store.initial_action(result_id, result.data, session_id)
+            if action is None:
+                return None
+            tile_store.set_layer(session_id, ClusterTileLayer("poi", cluster_store.get(result_id), result_id))
+            action.parameters["tile_url"] = tile_store.tile_url(session_id, "poi")
+            action = action.model_dump(mode="json")
+            action["message_id"] = message_id
+            return action
+        except Exception as e:
+            # 地图指令构建失败不影响文本回答
+            logger.error(f"构建POI聚合显示指令失败: {str(e)}")
+            return None
+    
+    @staticmethod
+    async def _route_action_event(
+        message_id: str,
+        session_id: str,
+        parameters: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """执行路径规划，构建路线显示指令消息，路线同时登记为会话的 route 矢量瓦片图层"""
+        try:
+            route_parameters = {
+                "start_location": parameters["start_location"],
+                "end_location": parameters["end_location"]
+            }
+            result = await plugin_manager.execute_plugin(
+                PluginRequest(plugin=PluginType.ROUTING, parameters=route_parameters, session_id=session_id)
+            )
+            if not result.success or not result.data:
+                logger.info(f"路径规划未返回结果，跳过路线显示: {result.error}")
+                return None
+            
+            # 完整路线登记为瓦片图层（瓦片按各自缩放级别抽稀）；消息中只发送按初始视口抽稀后的编码折线
+            route = dict(result.data)
+            coordinates = route.pop("coordinates")
+            tile_store.set_layer(session_id, TileLayer("route", [{
+                "type": "LineString",
+                "coordinates": coordinates,
+                "properties": {"distance_m": route["distance_m"], "duration_s": route["duration_s"]}
+            }]))
+            zoom = zoom_for_bbox(route["bbox"])
+            simplified = simplify(coordinates, zoom, settings.geometry_simplify_pixels)
+            action = MapAction(
+                action="show_route",
+                parameters={
+                    **route,
+                    "zoom": zoom,
+                    "polyline": encode_polyline(simplified, settings.polyline_precision),
+                    "polyline_precision": settings.polyline_precision,
+                    "tile_url": tile_store.tile_url(session_id, "route")
+                },
+                session_id=session_id
+            ).model_dump(mode="json")
+            action["message_id"] = message_id
+            return action
+        except Exception as e:
+            # 地图指令构建失败不影响文本回答
+            logger.error(f"构建路线显示指令失败: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _elapsed_ms(started_at: float) -> float:
+        """计算自开始以来的毫秒数"""
+        return round((time.perf_counter() - started_at) * 1000, 1)
+    
+    @staticmethod
+    async def _cleanup_stream(stream, *tasks):
+        """取消未完成的后台任务并关闭上游流"""
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        if stream is not None:
+            await stream.aclose()
 
 
 # 全局流式聊天服务实例
@@ -0,0 +1,100 @@
+"""
+事件编码模块 - SSE与WebSocket共用的流式事件JSON编码
+安装orjson时使用orjson，否则回退到标准库json；非ASCII字符不转义，中文按UTF-8原样输出
+同一条消息的文本片段只编码片段文本，type/message_id/session_id 部分在消息开始时编码一次
+"""
+import json
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库json
+    orjson = None
+
+
+# 一条消息的最后一个事件，之后不再需要该消息的事件外壳
+TERMINAL_TYPES = frozenset(["stream_end", "stream_cancelled", "error"])
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj: Any) -> bytes:
+        """编码为紧凑的UTF-8 JSON"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+
+    _dumps_text = orjson.dumps
+else:
+    _ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    _encode_text = json.encoder.encode_basestring
+
+    def dumps(obj: Any) -> bytes:
+        """编码为紧凑的UTF-8 JSON"""
+        return _ENCODER.encode(obj).encode("utf-8")
+
+    def _dumps_text(text: str) -> bytes:
+        return _encode_text(text).encode("utf-8")
+
+
+class StreamEnvelope:
+    """单条消息的事件外壳
+
+    文本片段事件的JSON为 前缀 + 片段文本 + 后缀（可带可恢复流的序号 seq），前后缀在构造时编码一次，
+    每个片段只需转义片段文本本身。其余事件按完整字典编码。
+    """
+
+    def __init__(self, message_id: str, session_id: str):
+        self.message_id = message_id
+        self.session_id = session_id
+        head = dumps({"type": "stream_chunk", "message_id": message_id})
+        self._chunk_prefix = head[:-1] + b',"chunk":'
+        self._chunk_session = b',"session_id":' + dumps(session_id)
+
+    def chunk(self, text: str, seq: Optional[int] = None) -> bytes:
+        """编码文本片段事件，与 dumps(stream_chat_service 的片段事件) 结果相同"""
+        tail = b"}" if seq is None else b',"seq":%d}' % seq
+        return self._chunk_prefix + _dumps_text(text) + self._chunk_session + tail
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        if (
+            event.get("type") == "stream_chunk"
+            and event.get("message_id") == self.message_id
+            and event.get("session_id") == self.session_id
+            and isinstance(event.get("chunk"), str)
+        ):
+            if len(event) == 4:
+                return self.chunk(event["chunk"])
+            if len(event) == 5 and type(event.get("seq")) is int:
+                return self.chunk(event["chunk"], event["seq"])
+        return dumps(event)
+
+    def sse(self, event: Dict[str, Any], event_id: Optional[str] = None) -> bytes:
+        """编码为SSE帧，event_id 作为 id 字段，客户端重连时以 Last-Event-ID 请求头带回"""
+        frame = b"data: " + self.encode(event) + b"\n\n"
+        if event_id is None:
+            return frame
+        return b"id: " + event_id.encode("utf-8") + b"\n" + frame
+
+
+class EventEncoder:
+    """一个连接上多条并发消息的事件编码器，按 message_id 缓存事件外壳"""
+
+    def __init__(self):
+        self._envelopes: Dict[str, StreamEnvelope] = {}
+
+    def encode(self, event: Dict[str, Any]) -> bytes:
+        message_id = event.get("message_id")
+        if not message_id:
+            return dumps(event)
+
+        envelope = self._envelopes.get(message_id)
+        if envelope is None or envelope.session_id != event.get("session_id"):
+            if event.get("type") != "stream_chunk":
+                return self._finish(event, message_id, dumps(event))
+            envelope = StreamEnvelope(message_id, event.get("session_id"))
+            self._envelopes[message_id] = envelope
+        return self._finish(event, message_id, envelope.encode(event))
+
+    def _finish(self, event: Dict[str, Any], message_id: str, data: bytes) -> bytes:
+        if event.get("type") in TERMINAL_TYPES:
+            self._envelopes.pop(message_id, None)
+        return data
@@ -0,0 +1,124 @@
+"""
+几何工具模块 - Web墨卡托投影、折线抽稀与编码折线（Encoded Polyline）
+路线、轨迹等大几何在发送前按目标缩放级别抽稀并编码，减小消息体积
+"""
+import math
+from typing import Sequence, Tuple
+
+import numpy as np
+
+# 地图瓦片的像素尺寸，缩放级别z时整个世界宽 TILE_SIZE * 2^z 像素
+TILE_SIZE = 256
+
+
+def project(lngs: np.ndarray, lats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """经纬度投影到[0, 1]范围的Web墨卡托坐标"""
+    xs = np.asarray(lngs, dtype=np.float64) / 360 + 0.5
+    sin = np.sin(np.radians(np.asarray(lats, dtype=np.float64)))
+    ys = 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / np.pi
+    return xs, np.clip(ys, 0.0, 1.0)
+
+
+def unproject(x: float, y: float) -> Tuple[float, float]:
+    """Web墨卡托坐标还原为经纬度"""
+    lng = (x - 0.5) * 360
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+    return lng, lat
+
+
+def zoom_for_bbox(bbox: Sequence[float], viewport_px: int = 1024, max_zoom: int = 18) -> int:
+    """能在视口内完整显示范围(西, 南, 东, 北)的最大缩放级别"""
+    west, south, east, north = bbox
+    (x0, x1), (y1, y0) = project([west, east], [south, north])
+    span = max(x1 - x0, y1 - y0, 1e-12)
+    zoom = math.log2(viewport_px / (span * TILE_SIZE))
+    return max(0, min(int(zoom), max_zoom))
+
+
+def tolerance_for_zoom(zoom: float, pixels: float = 1.0) -> float:
+    """缩放级别下 pixels 个像素对应的墨卡托坐标长度，作为抽稀容差"""
+    return pixels / (TILE_SIZE * 2 ** zoom)
+
+
+def simplify_mask(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker折线抽稀，返回保留点的布尔掩码
+
+    points为(n, 2)的平面坐标；每一步对当前线段内的所有点向量化计算到弦的距离，
+    距离最大的点超过容差时保留并拆分线段。首尾点总是保留。
+    """
+    size = len(points)
+    keep = np.zeros(size, dtype=bool)
+    if size == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if size < 3 or tolerance <= 0:
+        keep[:] = True
+        return keep
+
+    stack = [(0, size - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        origin = points[start]
+        chord = points[end] - origin
+        offsets = points[start + 1:end] - origin
+        length = math.hypot(chord[0], chord[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return keep
+
+
+def simplify(coordinates: Sequence[Sequence[float]], zoom: float, pixels: float = 1.0) -> np.ndarray:
+    """按目标缩放级别抽稀经纬度折线，偏差不超过 pixels 个屏幕像素，返回(n, 2)的[经度, 纬度]数组"""
+    lnglat = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    xs, ys = project(lnglat[:, 0], lnglat[:, 1])
+    mask = simplify_mask(np.column_stack([xs, ys]), tolerance_for_zoom(zoom, pixels))
+    return lnglat[mask]
+
+
+def encode_polyline(coordinates: Sequence[Sequence[float]], precision: int = 5) -> str:
+    """编码为Google Encoded Polyline格式
+
+    输入为[经度, 纬度]，按格式约定以纬度在前编码。坐标乘以10^precision取整后差分，
+    zigzag后按5位一组编码，每组加63转为可打印字符，与 @mapbox/polyline 等解码库兼容。
+    """
+    lnglat = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    if len(lnglat) == 0:
+        return ""
+    values = np.rint(lnglat[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # 每个值拆分为最多13组5位，除最后一组外都带0x20延续位
+    shifts = np.arange(13, dtype=np.int64) * 5
+    groups = (zigzag[:, None] >> shifts) & 0x1F
+    counts = 1 + (zigzag[:, None] >= (np.int64(1) << shifts[1:])).sum(axis=1)
+    used = shifts[None, :] // 5 < counts[:, None]
+    continued = shifts[None, :] // 5 < (counts - 1)[:, None]
+    chars = (groups | np.where(continued, 0x20, 0)) + 63
+    return chars[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def decode_polyline(polyline: str, precision: int = 5) -> np.ndarray:
+    """解码Encoded Polyline，返回(n, 2)的[经度, 纬度]数组"""
+    data = np.frombuffer(polyline.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    ends = np.nonzero(data < 0x20)[0]
+    values = np.empty(len(ends), dtype=np.int64)
+    start = 0
+    for i, end in enumerate(ends.tolist()):
+        value = 0
+        for shift, chunk in enumerate(data[start:end + 1].tolist()):
+            value |= (chunk & 0x1F) << (shift * 5)
+        values[i] = ~(value >> 1) if value & 1 else value >> 1
+        start = end + 1
+    latlng = np.cumsum(values.reshape(-1, 2), axis=0) / 10 ** precision
+    return latlng[:, ::-1]
@@ -0,0 +1,218 @@
+"""
+矢量瓦片编码模块 - Mapbox Vector Tile 2.1 的protobuf编码
+只实现编码所需的protobuf子集（varint、zigzag、长度前缀字段），无需额外依赖
+"""
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Point = Tuple[int, int]
+
+# 几何类型
+GEOM_POINT = 1
+GEOM_LINESTRING = 2
+GEOM_POLYGON = 3
+
+# 几何命令
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+
+# protobuf线格式
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_BYTES = 2
+
+
+def _varint(value: int) -> bytes:
+    """无符号varint编码"""
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    """有符号整数的zigzag编码"""
+    return (value << 1) ^ (value >> 63)
+
+
+def _tag(field: int, wire: int) -> bytes:
+    return _varint((field << 3) | wire)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _tag(field, WIRE_BYTES) + _varint(len(payload)) + payload
+
+
+def _packed_field(field: int, values: Iterable[int]) -> bytes:
+    return _bytes_field(field, b"".join(_varint(value) for value in values))
+
+
+def _command(command: int, count: int) -> int:
+    return (command & 0x7) | (count << 3)
+
+
+def _ring_area(ring: Sequence[Point]) -> int:
+    """环的有向面积的2倍（瓦片坐标y轴向下，正值为顺时针）"""
+    area = 0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+        area += x1 * y2 - x2 * y1
+    return area
+
+
+def _dedupe(points: Sequence[Point]) -> List[Point]:
+    """去除相邻的重复点（量化到瓦片坐标后常见）"""
+    result: List[Point] = []
+    for point in points:
+        if not result or point != result[-1]:
+            result.append(point)
+    return result
+
+
+class _Cursor:
+    """几何命令编码的游标，坐标以相对上一点的增量编码"""
+
+    def __init__(self):
+        self.x = 0
+        self.y = 0
+        self.out: List[int] = []
+
+    def move(self, points: Sequence[Point], command: int):
+        self.out.append(_command(command, len(points)))
+        for x, y in points:
+            self.out.append(_zigzag(x - self.x))
+            self.out.append(_zigzag(y - self.y))
+            self.x, self.y = x, y
+
+
+def encode_geometry(geom_type: int, geometry: Sequence[Any]) -> Optional[List[int]]:
+    """编码几何命令序列，退化几何返回None
+
+    Point: [(x, y), ...]；LineString: [[(x, y), ...], ...]（可包含多段线）；
+    Polygon: [外环, 内环, ...]，环不需要闭合。
+    """
+    cursor = _Cursor()
+    if geom_type == GEOM_POINT:
+        if not geometry:
+            return None
+        cursor.move(geometry, CMD_MOVE_TO)
+    elif geom_type == GEOM_LINESTRING:
+        for line in geometry:
+            line = _dedupe(line)
+            if len(line) < 2:
+                continue
+            cursor.move(line[:1], CMD_MOVE_TO)
+            cursor.move(line[1:], CMD_LINE_TO)
+        if not cursor.out:
+            return None
+    elif geom_type == GEOM_POLYGON:
+        for index, ring in enumerate(geometry):
+            ring = _dedupe(ring)
+            if len(ring) > 1 and ring[0] == ring[-1]:
+                ring = ring[:-1]
+            area = _ring_area(ring) if len(ring) >= 3 else 0
+            if area == 0:
+                if index == 0:
+                    return None
+                continue
+            # 外环顺时针、内环逆时针
+            if (area > 0) != (index == 0):
+                ring = ring[::-1]
+            cursor.move(ring[:1], CMD_MOVE_TO)
+            cursor.move(ring[1:], CMD_LINE_TO)
+            cursor.out.append(_command(CMD_CLOSE_PATH, 1))
+    else:
+        raise ValueError(f"不支持的几何类型: {geom_type}")
+    return cursor.out
+
+
+def _encode_value(value: Any) -> bytes:
+    """编码属性值：字符串、布尔、整数、浮点，其他类型转为字符串"""
+    if isinstance(value, bool):
+        return _tag(7, WIRE_VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _tag(5, WIRE_VARINT) + _varint(value)
+        return _tag(6, WIRE_VARINT) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _tag(3, WIRE_FIXED64) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+class LayerEncoder:
+    """单个图层的编码器，属性键和值在图层内去重"""
+
+    def __init__(self, name: str, extent: int = 4096):
+        self.name = name
+        self.extent = extent
+        self._keys: Dict[str, int] = {}
+        self._values: Dict[Tuple[type, Any], int] = {}
+        self._features: List[bytes] = []
+
+    def __len__(self) -> int:
+        return len(self._features)
+
+    def _key_index(self, key: str) -> int:
+        index = self._keys.get(key)
+        if index is None:
+            index = self._keys[key] = len(self._keys)
+        return index
+
+    def _value_index(self, value: Any) -> int:
+        # 按类型区分，避免 1、1.0、True 被合并为同一个值
+        slot = (type(value), value)
+        index = self._values.get(slot)
+        if index is None:
+            index = self._values[slot] = len(self._values)
+        return index
+
+    def add_feature(
+        self,
+        geom_type: int,
+        geometry: Sequence[Any],
+        properties: Optional[Dict[str, Any]] = None,
+        feature_id: Optional[int] = None
+    ) -> bool:
+        """添加要素，几何为瓦片坐标；退化几何被忽略并返回False"""
+        commands = encode_geometry(geom_type, geometry)
+        if commands is None:
+            return False
+
+        tags: List[int] = []
+        for key, value in (properties or {}).items():
+            if value is None:
+                continue
+            if isinstance(value, (dict, list, tuple)):
+                value = str(value)
+            tags.append(self._key_index(key))
+            tags.append(self._value_index(value))
+
+        feature = b""
+        if feature_id is not None and feature_id >= 0:
+            feature += _tag(1, WIRE_VARINT) + _varint(feature_id)
+        if tags:
+            feature += _packed_field(2, tags)
+        feature += _tag(3, WIRE_VARINT) + _varint(geom_type)
+        feature += _packed_field(4, commands)
+        self._features.append(feature)
+        return True
+
+    def encode(self) -> bytes:
+        """编码为Tile.Layer消息"""
+        layer = _tag(15, WIRE_VARINT) + _varint(2)
+        layer += _bytes_field(1, self.name.encode("utf-8"))
+        for feature in self._features:
+            layer += _bytes_field(2, feature)
+        for key in self._keys:
+            layer += _bytes_field(3, key.encode("utf-8"))
+        for _, value in self._values:
+            layer += _bytes_field(4, _encode_value(value))
+        layer += _tag(5, WIRE_VARINT) + _varint(self.extent)
+        return layer
+
+
+def encode_tile(layers: Sequence[LayerEncoder]) -> bytes:
+    """编码为Tile消息，空图层被省略"""
+    return b"".join(_bytes_field(3, layer.encode()) for layer in layers if len(layer))
@@ -0,0 +1,63 @@
+"""
+Token估算工具 - 无需加载模型分词器的本地token数估算，以及缓存key使用的查询文本归一化
+"""
+import re
+import unicodedata
+
+# 中日韩字符、英文单词/数字、其他非空白字符
+_TOKEN_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]|[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def normalize_query(text: str) -> str:
+    """归一化查询文本
+
+    NFKC将全角字符折叠为半角，并去除空白、标点和符号，英文统一小写。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    return "".join(
+        char for char in text
+        if unicodedata.category(char)[0] not in ("P", "S", "Z", "C")
+    )
+
+
+def _piece_tokens(piece: str) -> int:
+    if piece.isascii() and piece.isalpha():
+        return (len(piece) + 3) // 4
+    if piece.isdigit():
+        return (len(piece) + 2) // 3
+    return 1
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的token数
+
+    按通义千问等模型分词器的经验值估算：每个中日韩字符约1个token，
+    英文单词按每4个字母1个token计，数字每3位1个token，其余符号各1个token。
+    """
+    if not text:
+        return 0
+    count = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        count += _piece_tokens(match.group())
+    return count
+
+
+def truncate_tokens(text: str, max_tokens: int, tail: bool = False) -> str:
+    """按估算的token数截断文本，tail为True时保留末尾部分"""
+    if not text:
+        return text
+    matches = list(_TOKEN_PATTERN.finditer(text))
+    if tail:
+        matches.reverse()
+    count = 0
+    cut = None
+    for match in matches:
+        count += _piece_tokens(match.group())
+        if count > max_tokens:
+            break
+        cut = match
+    else:
+        return text
+    if cut is None:
+        return ""
+    return text[cut.start():] if tail else text[:cut.end()]
@@ -0,0 +1,75 @@
+"""
+前缀树工具 - 规则意图分类器与地名库共用的字符前缀树
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class Trie:
+    """字符前缀树，支持在文本中查找所有不重叠的最长匹配"""
+
+    _END = "\0"
+
+    def __init__(self):
+        self.root: Dict[str, Any] = {}
+
+    def insert(self, word: str, value: Any = None):
+        """插入词条，value为匹配后返回的值（默认为词条本身）"""
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[self._END] = value if value is not None else word
+
+    def get(self, word: str, default: Any = None) -> Any:
+        """精确查找词条对应的值"""
+        node = self._node(word)
+        if node is None:
+            return default
+        return node.get(self._END, default)
+
+    def longest_match(self, text: str, start: int) -> Optional[Tuple[int, Any]]:
+        """从start位置开始的最长匹配，返回(结束位置, 值)"""
+        node = self.root
+        match = None
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if self._END in node:
+                match = (i + 1, node[self._END])
+        return match
+
+    def find_all(self, text: str) -> List[Tuple[int, int, Any]]:
+        """查找文本中所有不重叠的最长匹配，返回(起始, 结束, 值)列表"""
+        results = []
+        i = 0
+        while i < len(text):
+            match = self.longest_match(text, i)
+            if match:
+                end, value = match
+                results.append((i, end, value))
+                i = end
+            else:
+                i += 1
+        return results
+
+    def with_prefix(self, prefix: str) -> Iterator[Tuple[str, Any]]:
+        """按深度优先顺序遍历以prefix开头的所有词条，返回(词条, 值)"""
+        node = self._node(prefix)
+        if node is None:
+            return
+        stack = [(prefix, node)]
+        while stack:
+            word, node = stack.pop()
+            for char, child in node.items():
+                if char == self._END:
+                    yield word, child
+                else:
+                    stack.append((word + char, child))
+
+    def _node(self, prefix: str) -> Optional[Dict[str, Any]]:
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
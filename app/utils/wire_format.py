@@ -0,0 +1,182 @@
+"""
+WebSocket消息编码模块 - 连接建立时协商消息编码
+json: 文本帧（UTF-8，不转义中文），兼容所有客户端（默认，也是msgpack不可用时的回退）
+msgpack: 二进制帧，消息类型和常用字段名使用整数标签，message_id/session_id 只在首次出现时发送原文，
+         较大的消息（如路线几何、POI聚合）在应用层deflate压缩
+"""
+import json
+import zlib
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+from fastapi import WebSocket
+from loguru import logger
+
+from app.config import settings
+from app.utils.event_encoding import TERMINAL_TYPES, EventEncoder
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖，未安装时只支持JSON
+    msgpack = None
+
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+# WebSocket子协议名，客户端通过 Sec-WebSocket-Protocol 协商编码
+SUBPROTOCOL_PREFIX = "geo-agent."
+
+# 整数标签即在列表中的下标，只能在末尾追加，不能调整顺序
+MESSAGE_TYPES = [
+    "system", "error", "stream_start", "intent_parsed", "map_action",
+    "stream_chunk", "stream_end", "stream_cancelled",
+    "chat", "cancel", "map_viewport", "resume",
+]
+FIELD_KEYS = [
+    "type", "message_id", "session_id", "chunk", "intent", "action",
+    "parameters", "timings", "error", "message", "seq", "last_seq",
+]
+
+# 按连接驻留的字段：首次出现时发送 [编号, 原文]，之后只发送编号；
+# 一条消息的最后一个事件（TERMINAL_TYPES）发送后释放其 message_id 的编号
+INTERNED_FIELDS = ("message_id", "session_id")
+
+# 二进制帧首字节
+FRAME_PLAIN = b"\x00"
+FRAME_DEFLATE = b"\x01"
+
+_TYPE_TAGS = {name: tag for tag, name in enumerate(MESSAGE_TYPES)}
+_KEY_TAGS = {name: tag for tag, name in enumerate(FIELD_KEYS)}
+
+
+class WireCodec:
+    """JSON编码（文本帧），每个连接一个实例，文本片段使用预编码的事件外壳"""
+
+    encoding = ENCODING_JSON
+
+    def __init__(self):
+        self.events = EventEncoder()
+
+    def encode(self, message: Dict[str, Any]) -> Union[str, bytes]:
+        return self.events.encode(message).decode("utf-8")
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        """解码客户端消息，格式错误时抛出ValueError"""
+        return json.loads(data)
+
+    def handshake(self) -> Dict[str, Any]:
+        """连接成功消息中附带的编码信息"""
+        return {"encoding": self.encoding}
+
+    async def send(self, websocket: WebSocket, message: Dict[str, Any]):
+        data = self.encode(message)
+        if isinstance(data, bytes):
+            await websocket.send_bytes(data)
+        else:
+            await websocket.send_text(data)
+
+
+class MsgpackCodec(WireCodec):
+    """MessagePack编码（二进制帧），每个连接一个实例，驻留表随发送顺序维护
+
+    帧格式为1字节标志加消息体，标志为1时消息体经过raw deflate压缩（zlib wbits=-15）。
+    消息体为map：已知字段名和消息类型替换为整数标签，其余字段原样保留；
+    驻留字段的值为 [编号, 原文]（定义）或编号（引用）。
+    """
+
+    encoding = ENCODING_MSGPACK
+
+    def __init__(self, compress_threshold: int = None):
+        self.compress_threshold = (
+            settings.ws_compress_threshold if compress_threshold is None else compress_threshold
+        )
+        self._interned: Dict[str, int] = {}
+        self._next_id = 0
+        self.compressed = 0
+
+    def _intern(self, value: str) -> Union[int, list]:
+        ref = self._interned.get(value)
+        if ref is not None:
+            return ref
+        ref = self._next_id
+        self._next_id += 1
+        self._interned[value] = ref
+        return [ref, value]
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        body = {}
+        for key, value in message.items():
+            if key in INTERNED_FIELDS and isinstance(value, str):
+                value = self._intern(value)
+            elif key == "type":
+                value = _TYPE_TAGS.get(value, value)
+            body[_KEY_TAGS.get(key, key)] = value
+        if message.get("type") in TERMINAL_TYPES and message.get("message_id"):
+            self._interned.pop(message["message_id"], None)
+
+        payload = msgpack.packb(body, use_bin_type=True)
+        if self.compress_threshold and len(payload) >= self.compress_threshold:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            packed = compressor.compress(payload) + compressor.flush()
+            if len(packed) < len(payload):
+                self.compressed += 1
+                return FRAME_DEFLATE + packed
+        return FRAME_PLAIN + payload
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        """客户端可发送JSON文本帧或同格式的二进制帧（不使用驻留）"""
+        if isinstance(data, str):
+            return json.loads(data)
+        try:
+            payload = data[1:]
+            if data[:1] == FRAME_DEFLATE:
+                payload = zlib.decompress(payload, -15)
+            body = msgpack.unpackb(payload, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f"二进制消息解码失败: {str(e)}")
+        if not isinstance(body, dict):
+            raise ValueError("消息格式错误")
+
+        message = {}
+        for key, value in body.items():
+            if isinstance(key, int) and 0 <= key < len(FIELD_KEYS):
+                key = FIELD_KEYS[key]
+            if key == "type" and isinstance(value, int) and 0 <= value < len(MESSAGE_TYPES):
+                value = MESSAGE_TYPES[value]
+            message[key] = value
+        return message
+
+    def handshake(self) -> Dict[str, Any]:
+        """附带标签表，客户端据此解码，无需硬编码"""
+        return {
+            "encoding": self.encoding,
+            "tags": {"types": MESSAGE_TYPES, "keys": FIELD_KEYS},
+            "compress_threshold": self.compress_threshold
+        }
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return (ENCODING_MSGPACK, ENCODING_JSON) if msgpack is not None else (ENCODING_JSON,)
+
+
+def create_codec(encoding: str) -> WireCodec:
+    if encoding == ENCODING_MSGPACK and msgpack is not None:
+        return MsgpackCodec()
+    return WireCodec()
+
+
+def negotiate(subprotocols: Iterable[str], encoding: Optional[str] = None) -> Tuple[WireCodec, Optional[str]]:
+    """按客户端提供的子协议（优先）或 encoding 查询参数选择编码
+
+    返回编码器和需要在握手响应中确认的子协议；都未指定时使用 WS_DEFAULT_ENCODING，
+    请求的编码不可用（如未安装msgpack）时回退为JSON。
+    """
+    supported = available_encodings()
+    for protocol in subprotocols:
+        if protocol.startswith(SUBPROTOCOL_PREFIX) and protocol[len(SUBPROTOCOL_PREFIX):] in supported:
+            return create_codec(protocol[len(SUBPROTOCOL_PREFIX):]), protocol
+
+    requested = encoding or settings.ws_default_encoding
+    if requested not in supported:
+        logger.warning(f"不支持的WebSocket编码: {requested}，回退为JSON")
+        requested = ENCODING_JSON
+    return create_codec(requested), None
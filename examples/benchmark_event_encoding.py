@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+流式事件编码基准测试
+比较改造前的SSE（重建字典 + json.dumps(ensure_ascii=False)）和WebSocket（json.dumps，中文转义为\\uXXXX）
+与共用事件编码模块（预编码的事件外壳，orjson或标准库json回退）在每个文本片段上的字节数和编码耗时
+"""
+import importlib.util
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import app.utils.event_encoding as event_encoding
+
+TEXT = (
+    "从杭州到上海推荐走G60沪昆高速，全程约165公里，预计用时1小时40分钟。"
+    "途经嘉兴，可在嘉兴服务区休息。高峰时段沪昆高速上海方向容易拥堵，建议错峰出行。"
+) * 20
+
+
+def chunk_events(message_id: str, session_id: str, size: int = 3):
+    """按服务产生的片段事件格式切分文本"""
+    return [
+        {"type": "stream_chunk", "message_id": message_id, "chunk": TEXT[i:i + size], "session_id": session_id}
+        for i in range(0, len(TEXT), size)
+    ]
+
+
+def legacy_sse(events):
+    """改造前的SSE：按收到的事件重建字典再编码"""
+    for response in events:
+        chunk_data = {
+            "type": "stream_chunk",
+            "message_id": response["message_id"],
+            "chunk": response["chunk"],
+            "session_id": response["session_id"]
+        }
+        yield f"data: {json.dumps(chunk_data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def legacy_websocket(events):
+    """改造前的WebSocket：json.dumps默认转义非ASCII字符"""
+    for response in events:
+        yield json.dumps(response).encode("utf-8")
+
+
+def shared_sse(module, message_id, session_id):
+    def run(events):
+        envelope = module.StreamEnvelope(message_id, session_id)
+        for response in events:
+            yield envelope.sse(response)
+    return run
+
+
+def shared_websocket(module):
+    def run(events):
+        encoder = module.EventEncoder()
+        for response in events:
+            # WebSocket文本帧以str发送，传输层再编码为UTF-8
+            yield encoder.encode(response).decode("utf-8").encode("utf-8")
+    return run
+
+
+def measure(encode, events, rounds: int = 50):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        total = sum(len(frame) for frame in encode(events))
+    per_event_us = (time.perf_counter() - started) / rounds / len(events) * 1e6
+    return total / len(events), per_event_us
+
+
+def load_fallback():
+    """屏蔽orjson加载事件编码模块的独立副本，得到标准库json回退实现"""
+    blocked = sys.modules.get("orjson")
+    sys.modules["orjson"] = None
+    try:
+        spec = importlib.util.spec_from_file_location("event_encoding_fallback", event_encoding.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if blocked is None:
+            del sys.modules["orjson"]
+        else:
+            sys.modules["orjson"] = blocked
+    return module
+
+
+def main():
+    message_id, session_id = str(uuid.uuid4()), str(uuid.uuid4())
+    events = chunk_events(message_id, session_id)
+    fallback = load_fallback()
+
+    print(f"=== 流式事件编码基准测试（{len(events)} 个文本片段，每片段3个汉字）===")
+    cases = [
+        ("改造前", "SSE", legacy_sse),
+        ("改造前", "WebSocket", legacy_websocket),
+        ("共用编码（标准库json）", "SSE", shared_sse(fallback, message_id, session_id)),
+        ("共用编码（标准库json）", "WebSocket", shared_websocket(fallback)),
+    ]
+    if event_encoding.orjson is not None:
+        cases += [
+            ("共用编码（orjson）", "SSE", shared_sse(event_encoding, message_id, session_id)),
+            ("共用编码（orjson）", "WebSocket", shared_websocket(event_encoding)),
+        ]
+    else:
+        print("未安装orjson，只测试标准库json回退（pip install orjson）")
+
+    baseline = {}
+    for name, transport, encode in cases:
+        size, per_event_us = measure(encode, events)
+        reference = baseline.setdefault(transport, (size, per_event_us))
+        print(
+            f"{transport:<9} {name:<16} {size:6.1f} 字节/片段 ({size / reference[0]:6.1%})  "
+            f"{per_event_us:5.2f} µs/片段 ({per_event_us / reference[1]:6.1%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
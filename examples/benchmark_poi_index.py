@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+POI空间索引基准测试
+在各城市周边生成100万个POI，测量建索引耗时以及近邻、半径、范围查询的延迟
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.gazetteer import gazetteer
+from app.core.poi_index import build_demo_index, haversine
+
+
+def measure(name, fn, queries):
+    """执行查询并输出平均与P99延迟（微秒）"""
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(*query)
+        latencies.append((time.perf_counter() - started) * 1e6)
+    latencies = np.array(latencies)
+    print(f"{name:<28} 平均 {latencies.mean():8.1f} us   P99 {np.percentile(latencies, 99):8.1f} us")
+
+
+def main(size: int = 1_000_000, rounds: int = 2000):
+    print(f"=== POI空间索引基准测试（{size:,} 个POI）===")
+    started = time.perf_counter()
+    index = build_demo_index(size)
+    print(f"生成数据并建立索引: {time.perf_counter() - started:.2f} 秒")
+
+    # 查询中心取自随机城市与地标附近
+    rng = np.random.default_rng(7)
+    places = [place for place in gazetteer.places if place.level != "province"]
+    centers = [places[i] for i in rng.integers(0, len(places), rounds)]
+    points = [
+        (place.longitude + rng.normal(0, 0.01), place.latitude + rng.normal(0, 0.01))
+        for place in centers
+    ]
+
+    measure("kNN k=10", lambda lng, lat: index.nearest(lng, lat, 10), points)
+    measure("kNN k=10 + 类别过滤", lambda lng, lat: index.nearest(lng, lat, 10, "咖啡"), points)
+    measure("kNN k=10 + 名称过滤", lambda lng, lat: index.nearest(lng, lat, 10, "1号"), points)
+    measure("半径 1km", lambda lng, lat: index.within_radius(lng, lat, 1000), points)
+    measure("半径 3km + 类别 + 评分排序", lambda lng, lat: index.within_radius(lng, lat, 3000, "餐厅", 20, "rating"), points)
+    measure("范围 0.05°x0.05° 前50", lambda lng, lat: index.within_bbox(lng - 0.025, lat - 0.025, lng + 0.025, lat + 0.025, limit=50), points)
+
+    # 与全量向量化扫描对比，并校验近邻结果一致
+    lng, lat = points[0]
+    started = time.perf_counter()
+    distances = haversine(lng, lat, index.lngs, index.lats)
+    brute = np.sort(np.partition(distances, 9)[:10])
+    brute_us = (time.perf_counter() - started) * 1e6
+    _, found = index.nearest(lng, lat, 10)
+    assert np.allclose(found, brute), "近邻结果与全量扫描不一致"
+    print(f"{'全量扫描 kNN（对照）':<28} 单次 {brute_us:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+路线几何压缩基准测试
+生成一条约5万个顶点的长距离轨迹（示例路网上的城际路线加密并叠加GPS噪声），
+比较原始JSON坐标数组、按缩放级别抽稀后的JSON与编码折线的消息大小和处理耗时
+"""
+import gzip
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.gazetteer import gazetteer
+from app.core.road_graph import build_demo_graph
+from app.utils.geometry import decode_polyline, encode_polyline, simplify, zoom_for_bbox
+
+
+def dense_track(vertices: int = 50_000, seed: int = 7) -> np.ndarray:
+    """北京到广州的路线按弧长均匀加密，并叠加约3米的GPS噪声"""
+    graph = build_demo_graph()
+    start, end = gazetteer.resolve("北京"), gazetteer.resolve("广州")
+    route = graph.route(
+        graph.nearest_node(start.longitude, start.latitude)[0],
+        graph.nearest_node(end.longitude, end.latitude)[0]
+    )
+    points = np.asarray(route.coordinates)
+    steps = np.hypot(*np.diff(points, axis=0).T)
+    along = np.concatenate([[0], np.cumsum(steps)])
+    samples = np.linspace(0, along[-1], vertices)
+    track = np.column_stack([np.interp(samples, along, points[:, 0]), np.interp(samples, along, points[:, 1])])
+    return track + np.random.default_rng(seed).normal(0, 3e-5, track.shape)
+
+
+def timed(fn, *args, rounds: int = 5):
+    """返回结果与平均耗时（毫秒）"""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = fn(*args)
+    return result, (time.perf_counter() - started) / rounds * 1000
+
+
+def sizes(payload: str):
+    data = payload.encode("utf-8")
+    return len(data), len(gzip.compress(data))
+
+
+def main():
+    track = dense_track()
+    bbox = [track[:, 0].min(), track[:, 1].min(), track[:, 0].max(), track[:, 1].max()]
+    fit_zoom = zoom_for_bbox(bbox)
+    print(f"=== 路线几何压缩基准测试（{len(track):,} 个顶点，全程视口缩放级别 {fit_zoom}）===")
+
+    raw_json, dump_ms = timed(lambda: json.dumps(np.round(track, 6).tolist()))
+    raw, raw_gz = sizes(raw_json)
+    print(f"{'原始JSON坐标':<22} {len(track):>7} 点 {raw:>10,} 字节 gzip {raw_gz:>9,} 字节  {dump_ms:7.1f} ms")
+
+    full_polyline, encode_ms = timed(encode_polyline, track)
+    size, size_gz = sizes(full_polyline)
+    print(f"{'编码折线（不抽稀）':<20} {len(track):>7} 点 {size:>10,} 字节 gzip {size_gz:>9,} 字节  {encode_ms:7.1f} ms"
+          f"  体积 {size / raw:.1%}")
+
+    for zoom in (fit_zoom, fit_zoom + 4, fit_zoom + 8):
+        simplified, simplify_ms = timed(simplify, track, zoom)
+        polyline, encode_ms = timed(encode_polyline, simplified)
+        decoded = decode_polyline(polyline)
+        error = np.abs(decoded - simplified).max()
+        json_size, _ = sizes(json.dumps(np.round(simplified, 6).tolist()))
+        size, size_gz = sizes(polyline)
+        print(
+            f"抽稀 z={zoom:<2} + 编码折线      {len(simplified):>7} 点 {size:>10,} 字节 gzip {size_gz:>9,} 字节  "
+            f"{simplify_ms + encode_ms:7.1f} ms  体积 {size / raw:.2%}（同点数JSON {json_size:,} 字节），"
+            f"解码误差 {error:.1e} 度"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+语义缓存基准测试
+向语义缓存写入10万条由说法、地名和关键词组合成的问题，比较逐条比较（矩阵-向量乘法）与IVF索引：
+- 换说法：用换一种说法的问题查找，应命中原条目
+- 未缓存：缓存中没有的问题，需要完整地检索向量后才能确定未命中，是最慢的情况
+- 换地名：同一说法换一个地名，不应命中其他地名的条目
+以及单次查找耗时（含文本特征与向量计算）和IVF相对逐条比较的最近邻召回率
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from loguru import logger
+
+from app.core.gazetteer import gazetteer
+from app.core.semantic_cache import SemanticCache, embed, features
+
+# (写入缓存的说法, 查找时换用的说法)
+TEMPLATES = [
+    ("{place}附近的{keyword}", "帮我找一下{place}附近有什么{keyword}"),
+    ("{place}有哪些{keyword}", "{place}的{keyword}有哪些"),
+    ("推荐{place}的{keyword}", "请推荐一下{place}的{keyword}"),
+    ("{place}最好的{keyword}是哪家", "{place}最好的{keyword}是哪家呢"),
+    ("{place}周边{keyword}推荐", "看看{place}周边的{keyword}推荐"),
+    ("去{place}找{keyword}", "我想去{place}找{keyword}"),
+    ("{place}评分高的{keyword}", "查一下{place}评分高的{keyword}"),
+    ("{place}便宜的{keyword}", "{place}便宜的{keyword}有吗"),
+    ("{place}营业到很晚的{keyword}", "{place}营业到很晚的{keyword}有哪些"),
+    ("{place}适合聚会的{keyword}", "请问{place}适合聚会的{keyword}"),
+]
+KEYWORDS = [
+    "咖啡馆", "火锅店", "酒店", "民宿", "书店", "电影院", "健身房", "药店", "超市", "加油站",
+    "停车场", "银行", "医院", "烧烤店", "面馆", "茶馆", "酒吧", "博物馆", "公园", "商场",
+    "便利店", "快餐店", "甜品店", "披萨店", "日料店", "西餐厅", "早餐店", "充电站", "洗车店", "花店",
+    "宠物店", "理发店", "眼镜店", "五金店", "菜市场", "游泳馆", "网吧", "KTV", "汽修店", "面包店",
+]
+# 不在缓存中的关键词
+UNSEEN_KEYWORDS = ["奶茶店", "图书馆", "体育馆", "寺庙", "夜市", "美术馆", "动物园", "水果店"]
+
+
+def questions(limit: int):
+    places = sorted({name for _, name in gazetteer.names()})
+    combos = [(template, place, keyword) for template in TEMPLATES for place in places for keyword in KEYWORDS]
+    random.Random(7).shuffle(combos)
+    return places, combos[:limit]
+
+
+def build(combos, capacity: int, ivf_threshold: int, nprobe: int) -> SemanticCache:
+    cache = SemanticCache(
+        "benchmark", capacity=capacity, threshold=0.9, ivf_threshold=ivf_threshold, nprobe=nprobe
+    )
+    for index, ((stored, _), place, keyword) in enumerate(combos):
+        cache.set(stored.format(place=place, keyword=keyword), index)
+    return cache
+
+
+def stored_features(combos, index: int):
+    (stored, _), place, keyword = combos[index]
+    return features(stored.format(place=place, keyword=keyword))
+
+
+def query_sets(combos, places, samples: int = 2000):
+    """换说法、未缓存、换地名三组查询，换说法的查询附带应命中的条目"""
+    rng = random.Random(11)
+    picked = rng.sample(range(len(combos)), samples)
+    paraphrased = []
+    unseen = []
+    moved = []
+    for index in picked:
+        (stored, paraphrase), place, keyword = combos[index]
+        paraphrased.append((paraphrase.format(place=place, keyword=keyword), index))
+        unseen.append(rng.choice(TEMPLATES)[1].format(place=place, keyword=rng.choice(UNSEEN_KEYWORDS)))
+        moved.append(stored.format(place=rng.choice(places), keyword=keyword))
+    return paraphrased, unseen, moved
+
+
+def timed_get(cache: SemanticCache, text: str):
+    started = time.perf_counter()
+    value = cache.get(text)
+    return value, (time.perf_counter() - started) * 1e6
+
+
+def measure(cache: SemanticCache, combos, paraphrased, unseen, moved):
+    latencies = []
+
+    # 同名地名等导致模板和守卫相同的条目只保留最后写入的一条，按特征相同判断命中
+    hits = 0
+    for text, index in paraphrased:
+        value, elapsed = timed_get(cache, text)
+        latencies.append(elapsed)
+        hits += value is not None and stored_features(combos, value) == stored_features(combos, index)
+
+    unseen_hits = 0
+    unseen_latencies = []
+    for text in unseen:
+        value, elapsed = timed_get(cache, text)
+        unseen_latencies.append(elapsed)
+        unseen_hits += value is not None
+
+    false_hits = 0
+    for text in moved:
+        value, elapsed = timed_get(cache, text)
+        latencies.append(elapsed)
+        false_hits += value is not None and stored_features(combos, value)[1] != features(text)[1]
+
+    return {
+        "hit_rate": hits / len(paraphrased),
+        "unseen_hits": unseen_hits,
+        "false_hits": false_hits,
+        "p50": np.percentile(latencies + unseen_latencies, 50),
+        "p99": np.percentile(latencies + unseen_latencies, 99),
+        "unseen_p99": np.percentile(unseen_latencies, 99),
+    }
+
+
+def recall(cache: SemanticCache, exact: SemanticCache, texts) -> float:
+    """IVF检索到的最相似条目与逐条比较结果一致的比例"""
+    agree = 0
+    for text in texts:
+        query = embed(*features(text), cache.dim)
+        found, expected = cache.search(query, k=1), exact.search(query, k=1)
+        agree += bool(found) and abs(found[0][1] - expected[0][1]) < 1e-6
+    return agree / len(texts)
+
+
+def main(size: int = 100_000):
+    logger.remove()
+    places, combos = questions(size)
+    paraphrased, unseen, moved = query_sets(combos, places)
+    print(
+        f"=== 语义缓存基准测试（{len(combos):,} 条：{len(TEMPLATES)} 种说法 × {len(places)} 个地名 × "
+        f"{len(KEYWORDS)} 个关键词；每组查询 {len(paraphrased)} 次）==="
+    )
+
+    cases = [
+        ("逐条比较", dict(ivf_threshold=len(combos) + 1, nprobe=0)),
+        ("IVF nprobe=4", dict(ivf_threshold=8192, nprobe=4)),
+        ("IVF nprobe=8", dict(ivf_threshold=8192, nprobe=8)),
+        ("IVF nprobe=16", dict(ivf_threshold=8192, nprobe=16)),
+    ]
+    exact = None
+    for name, options in cases:
+        started = time.perf_counter()
+        cache = build(combos, capacity=len(combos), **options)
+        build_s = time.perf_counter() - started
+        exact = exact or cache
+        result = measure(cache, combos, paraphrased, unseen, moved)
+        ann_recall = recall(cache, exact, unseen + [text for text, _ in paraphrased])
+        print(
+            f"{name:<14} 写入 {build_s:4.1f}s  换说法命中率 {result['hit_rate']:6.1%}  "
+            f"未缓存误命中 {result['unseen_hits']}  换地名误命中 {result['false_hits']}  "
+            f"最近邻召回率 {ann_recall:6.1%}  查找 p50 {result['p50']:5.0f}µs p99 {result['p99']:5.0f}µs"
+            f"（未缓存 p99 {result['unseen_p99']:5.0f}µs）"
+        )
+    print(
+        f"向量矩阵: {cache.vectors.nbytes / 1024 / 1024:.0f} MB（{cache.capacity:,} × {cache.dim} float32），"
+        f"IVF {len(cache.centroids)} 个簇"
+    )
+
+
+if __name__ == "__main__":
+    main()
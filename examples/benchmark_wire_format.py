@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+WebSocket消息编码基准测试
+模拟一次POI搜索回答（stream_start、intent_parsed、带数百个聚合点的show_clusters、数百个文本片段、stream_end），
+比较JSON与msgpack编码（整数标签、ID驻留、大消息应用层压缩）以及传输层permessage-deflate下的
+每次回答字节数和每条消息的服务端编码耗时
+"""
+import sys
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core.clustering import ClusterIndex
+from app.utils.wire_format import MsgpackCodec, WireCodec, msgpack
+
+ANSWER = (
+    "为您在西湖附近找到了以下咖啡馆：星巴克（湖滨银泰店），距离约600米，营业至22:00；"
+    "瑞幸咖啡（南山路店），距离约850米；Manner Coffee（龙翔桥店），距离约1.1公里。"
+    "地图上已按缩放级别聚合显示全部结果，放大可查看每家店的位置和详情。"
+) * 4
+
+
+def answer_messages(session_id: str = "6f1c2d0e-8a4b-4f7e-9c35-2b1d7e9a0c44", seed: int = 7):
+    """一次回答的全部消息，文本按2~4个字符切分为片段"""
+    message_id = "0d5e3b7a-1c2f-4e8d-a6b9-7f3c1e5d9a20"
+    rng = np.random.default_rng(seed)
+    lngs = rng.normal(120.155, 0.03, 800)
+    lats = rng.normal(30.25, 0.02, 800)
+    results = [
+        {"id": f"B0FFG{i:05d}", "name": f"咖啡馆{i}", "category": "餐饮服务;咖啡厅",
+         "address": f"西湖区南山路{i}号", "longitude": round(x, 6), "latitude": round(y, 6)}
+        for i, (x, y) in enumerate(zip(lngs, lats))
+    ]
+    index = ClusterIndex(lngs, lats, results)
+
+    messages = [
+        {"type": "stream_start", "message_id": message_id, "session_id": session_id},
+        {"type": "intent_parsed", "message_id": message_id, "session_id": session_id, "intent": {
+            "intent": "poi_search", "confidence": 0.95,
+            "parameters": {"location": "西湖", "keyword": "咖啡馆", "radius": 3000}}},
+        {"type": "map_action", "action": "show_clusters", "message_id": message_id, "session_id": session_id,
+         "parameters": {"result_id": "ac0105d4679aaed7", "zoom": 14, "bbox": [120.1, 30.2, 120.2, 30.3],
+                        "total": len(results), "clusters": index.get_clusters((120.1, 30.2, 120.2, 30.3), 14)}},
+    ]
+    position = 0
+    while position < len(ANSWER):
+        size = int(rng.integers(2, 5))
+        messages.append({"type": "stream_chunk", "message_id": message_id,
+                         "chunk": ANSWER[position:position + size], "session_id": session_id})
+        position += size
+    messages.append({"type": "stream_end", "message_id": message_id, "session_id": session_id,
+                     "timings": {"intent_ms": 2.1, "first_chunk_ms": 180.4, "stream_ms": 2950.2, "total_ms": 2951.0}})
+    return messages
+
+
+class PerMessageDeflate:
+    """模拟传输层permessage-deflate（保留上下文，每条消息同步刷新并去掉末尾4字节）"""
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+    def __call__(self, data: bytes) -> bytes:
+        return (self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+
+def measure(name: str, make_codec, messages, transport_deflate: bool = False, rounds: int = 20):
+    total_bytes = 0
+    started = time.perf_counter()
+    for _ in range(rounds):
+        codec = make_codec()
+        deflate = PerMessageDeflate() if transport_deflate else None
+        total_bytes = 0
+        for message in messages:
+            data = codec.encode(dict(message))
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            if deflate:
+                data = deflate(data)
+            total_bytes += len(data)
+    per_message_us = (time.perf_counter() - started) / rounds / len(messages) * 1e6
+    return name, total_bytes, per_message_us
+
+
+def main():
+    messages = answer_messages()
+    print(f"=== WebSocket消息编码基准测试（一次回答 {len(messages)} 条消息）===")
+
+    cases = [
+        measure("JSON", WireCodec, messages),
+        measure("JSON + permessage-deflate", WireCodec, messages, transport_deflate=True),
+    ]
+    if msgpack is None:
+        print("未安装msgpack，只测试JSON（pip install msgpack）")
+    else:
+        cases += [
+            measure("msgpack（标签+驻留）", lambda: MsgpackCodec(compress_threshold=0), messages),
+            measure("msgpack + 大消息压缩", lambda: MsgpackCodec(compress_threshold=2048), messages),
+            measure("msgpack + permessage-deflate", lambda: MsgpackCodec(compress_threshold=0), messages,
+                    transport_deflate=True),
+        ]
+
+    baseline = cases[0][1]
+    for name, total_bytes, per_message_us in cases:
+        print(
+            f"{name:<30} {total_bytes:>9,} 字节/回答 ({total_bytes / baseline:6.1%})  "
+            f"{per_message_us:6.1f} µs/消息"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 """
 Geo-Agent 主应用入口
 """
+from typing import Optional
+
 import uvicorn
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,10 +10,15 @@ from fastapi.staticfiles import StaticFiles
 from loguru import logger
 
 from app.config import settings
+from app.core.llm_provider import llm_provider
+from app.core.plugin_manager import plugin_manager
+from app.plugins import register_all_plugins
 from app.utils.logger import setup_logger
 from app.api.websocket import websocket_endpoint
 from app.api.chat import router as chat_router
+from app.api.map import router as map_router
 from app.api.pages import router as pages_router
+from app.api.tiles import router as tiles_router
 
 
 # 创建FastAPI应用
@@ -39,16 +46,18 @@ except Exception as e:
 
 # 注册API路由
 app.include_router(chat_router)
+app.include_router(map_router)
 app.include_router(pages_router)
+app.include_router(tiles_router)
 
 # WebSocket路由
 @app.websocket("/ws/{session_id}")
-async def websocket_route(websocket: WebSocket, session_id: str):
-    await websocket_endpoint(websocket, session_id)
+async def websocket_route(websocket: WebSocket, session_id: str, encoding: Optional[str] = None):
+    await websocket_endpoint(websocket, session_id, encoding)
 
 @app.websocket("/ws")
-async def websocket_route_no_session(websocket: WebSocket):
-    await websocket_endpoint(websocket)
+async def websocket_route_no_session(websocket: WebSocket, encoding: Optional[str] = None):
+    await websocket_endpoint(websocket, encoding=encoding)
 
 # 健康检查
 @app.get("/health")
@@ -61,7 +70,38 @@ async def get_plugins():
     from app.core.plugin_manager import plugin_manager
     return {
         "plugins": plugin_manager.list_plugins(),
-        "total": len(plugin_manager.plugins)
+        "total": len(plugin_manager.plugins),
+        "status": plugin_manager.status()
+    }
+
+# 运行指标
+@app.get("/metrics")
+async def get_metrics():
+    from app.api.websocket import websocket_manager
+    from app.core.answer_cache import answer_cache
+    from app.core.intent_cache import intent_cache
+    from app.core.clustering import cluster_store
+    from app.core.heatmap import heatmap_store
+    from app.core.http_client import http_client_pool
+    from app.core.intent_classifier import intent_classifier
+    from app.core.plugin_manager import plugin_manager
+    from app.core.tiles import tile_store
+    from app.core.session_memory import session_memory
+    from app.services.resumable_stream import stream_registry
+    from app.services.stream_chat_service import stream_chat_service
+    return {
+        "intent_fast_path": intent_classifier.stats(),
+        "intent_cache": intent_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "plugin_cache": plugin_manager.stats(),
+        "plugin_http": http_client_pool.stats(),
+        "poi_clusters": cluster_store.stats(),
+        "heatmap": heatmap_store.stats(),
+        "tiles": tile_store.stats(),
+        "websocket": websocket_manager.stats(),
+        "streams": stream_chat_service.stats(),
+        "resumable_streams": stream_registry.stats(),
+        "session_memory": session_memory.stats()
     }
 
 # 根路径重定向到聊天页面
@@ -79,11 +119,24 @@ async def startup_event():
     logger.info(f"WebSocket地址: ws://{settings.host}:{settings.port}/ws")
     logger.info(f"聊天API地址: http://{settings.host}:{settings.port}/api/chat/stream")
     logger.info(f"测试页面: http://{settings.host}:{settings.port}/test")
+    
+    # 预先建立LLM共享连接池
+    await llm_provider.startup()
+    
+    # 注册插件并注入第三方API共享连接池
+    register_all_plugins()
+    await plugin_manager.startup()
 
 # 关闭事件
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Geo-Agent 服务关闭中...")
+    
+    # 关闭LLM共享连接池
+    await llm_provider.shutdown()
+    
+    # 关闭插件HTTP连接池
+    await plugin_manager.shutdown()
 
 
 if __name__ == "__main__":
@@ -96,5 +149,6 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
-        log_level=settings.log_level.lower()
+        log_level=settings.log_level.lower(),
+        ws_per_message_deflate=settings.ws_per_message_deflate
     ) 
\ No newline at end of file
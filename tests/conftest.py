@@ -0,0 +1,7 @@
+"""
+测试公共配置
+"""
+import os
+
+# 导入对话服务时需要API Key，测试中不会请求上游模型
+os.environ.setdefault("DASHSCOPE_API_KEY", "test")
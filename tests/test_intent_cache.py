@@ -0,0 +1,54 @@
+"""
+意图缓存测试 - 命名空间隔离与结果校验
+"""
+import pytest
+
+from app.core.intent_cache import IntentCache, prompt_namespace
+
+
+def loader_returning(result):
+    calls = []
+
+    async def loader(text):
+        calls.append(text)
+        return dict(result)
+
+    return loader, calls
+
+
+@pytest.mark.asyncio
+async def test_namespaces_do_not_share_results():
+    cache = IntentCache()
+    stream_loader, stream_calls = loader_returning(
+        {"intent": "poi_search", "confidence": 0.9, "parameters": {"keyword": "咖啡"}}
+    )
+    engine_loader, engine_calls = loader_returning(
+        {"intent": "location_search", "confidence": 0.8, "parameters": {}}
+    )
+    stream_ns = prompt_namespace("stream", "提示词A")
+    engine_ns = prompt_namespace("engine", "提示词B")
+
+    assert (await cache.get_or_load("附近的咖啡", stream_loader, stream_ns))["intent"] == "poi_search"
+    assert (await cache.get_or_load("附近的咖啡", engine_loader, engine_ns))["intent"] == "location_search"
+    assert (await cache.get_or_load("附近的咖啡", stream_loader, stream_ns))["intent"] == "poi_search"
+    assert len(stream_calls) == 1
+    assert len(engine_calls) == 1
+
+
+def test_prompt_change_changes_namespace():
+    assert prompt_namespace("stream", "v1") != prompt_namespace("stream", "v2")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("result", [
+    {"intent": "not_an_intent", "confidence": 0.9, "parameters": {}},
+    {"intent": "poi_search", "confidence": 0.9, "parameters": "咖啡"},
+    {"intent": "poi_search", "confidence": "high", "parameters": {}},
+    {"intent": "poi_search", "confidence": 0.0, "parameters": {}},
+])
+async def test_invalid_results_are_not_cached(result):
+    cache = IntentCache()
+    loader, calls = loader_returning(result)
+    await cache.get_or_load("附近的咖啡", loader, "ns")
+    await cache.get_or_load("附近的咖啡", loader, "ns")
+    assert len(calls) == 2
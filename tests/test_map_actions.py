@@ -0,0 +1,39 @@
+"""
+地图指令测试 - 构建失败时退化为没有地图指令
+"""
+import sys
+
+import pytest
+
+from app.models.message import PluginResult, PluginType
+from app.services.stream_chat_service import StreamChatService
+
+# app.services 导出了同名的服务实例，从 sys.modules 取模块本身
+service_module = sys.modules[StreamChatService.__module__]
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError("boom")
+
+
+@pytest.mark.asyncio
+async def test_cluster_action_failure_returns_none(monkeypatch):
+    async def execute_plugin(request, timeout=None):
+        return PluginResult(plugin=PluginType.BAIDU_MAP, success=True, data={"results": [{}]}, session_id="s")
+
+    monkeypatch.setattr(service_module.plugin_manager, "execute_plugin", execute_plugin)
+    monkeypatch.setattr(service_module.cluster_store, "build", fail)
+    action = await StreamChatService._cluster_action_event("m", "s", {"location": "北京", "keyword": "咖啡"})
+    assert action is None
+
+
+@pytest.mark.asyncio
+async def test_route_action_failure_returns_none(monkeypatch):
+    async def execute_plugin(request, timeout=None):
+        data = {"coordinates": [[116.4, 39.9], [117.2, 39.1]], "distance_m": 1, "duration_s": 1, "bbox": [116.4, 39.1, 117.2, 39.9]}
+        return PluginResult(plugin=PluginType.ROUTING, success=True, data=data, session_id="s")
+
+    monkeypatch.setattr(service_module.plugin_manager, "execute_plugin", execute_plugin)
+    monkeypatch.setattr(service_module.tile_store, "set_layer", fail)
+    action = await StreamChatService._route_action_event("m", "s", {"start_location": "北京", "end_location": "天津"})
+    assert action is None
@@ -0,0 +1,89 @@
+"""
+可恢复流测试 - 取消与收尾
+"""
+import asyncio
+
+import pytest
+
+from app.services import resumable_stream
+from app.services.resumable_stream import ResumableStream, StreamRegistry
+
+
+async def fake_chat(*args, **kwargs):
+    """模拟对话流：开始、若干文本块、结束"""
+    yield {"type": "stream_start"}
+    for i in range(3):
+        await asyncio.sleep(0.01)
+        yield {"type": "text_chunk", "content": str(i)}
+    yield {"type": "stream_end"}
+
+
+async def collect(stream: ResumableStream):
+    return [event async for _, event in stream.events()]
+
+
+@pytest.mark.asyncio
+async def test_cancel_before_producer_starts():
+    """start() 后立即取消：生产者函数体未运行，订阅者仍应收到 stream_cancelled 并结束"""
+    stream = ResumableStream("m1", "s1", capacity=8, grace=0)
+    chat = fake_chat()
+    stream.start(chat)
+    assert stream.cancel()
+
+    events = await asyncio.wait_for(collect(stream), timeout=1)
+    assert [event["type"] for event in events] == ["stream_cancelled"]
+    assert stream.finished
+    assert not stream.cancel()
+    await asyncio.sleep(0)
+    assert chat.ag_frame is None
+
+
+@pytest.mark.asyncio
+async def test_cancel_while_streaming():
+    stream = ResumableStream("m2", "s2", capacity=8, grace=0)
+    stream.start(fake_chat())
+    await asyncio.sleep(0.015)
+    assert stream.cancel()
+
+    events = await asyncio.wait_for(collect(stream), timeout=1)
+    assert events[0]["type"] == "stream_start"
+    assert events[-1]["type"] == "stream_cancelled"
+    assert stream.finished
+
+
+@pytest.mark.asyncio
+async def test_grace_timer_expires_before_producer_starts():
+    """宽限期计时器在生产者开始前到期，没有订阅者也应写入 stream_cancelled 并结束"""
+    stream = ResumableStream("m3", "s3", capacity=8, grace=0)
+    stream.start(fake_chat())
+    stream._expire()
+
+    await asyncio.sleep(0.01)
+    assert stream.expired
+    assert stream.finished
+    assert stream.buffer[-1][1]["type"] == "stream_cancelled"
+
+
+@pytest.mark.asyncio
+async def test_registry_releases_stream_cancelled_before_start(monkeypatch):
+    monkeypatch.setattr(resumable_stream.stream_chat_service, "stream_chat", fake_chat)
+    registry = StreamRegistry()
+    stream = registry.start("你好", "s4", "m4")
+    assert registry.in_flight == 1
+    stream.cancel()
+
+    await asyncio.wait_for(collect(stream), timeout=1)
+    await asyncio.sleep(0)
+    assert registry.in_flight == 0
+    assert not registry.is_running("m4")
+
+
+@pytest.mark.asyncio
+async def test_registry_completes_normally(monkeypatch):
+    monkeypatch.setattr(resumable_stream.stream_chat_service, "stream_chat", fake_chat)
+    registry = StreamRegistry()
+    stream = registry.start("你好", "s5", "m5")
+
+    events = await asyncio.wait_for(collect(stream), timeout=1)
+    assert [event["type"] for event in events][-1] == "stream_end"
+    assert registry.in_flight == 0